@@ -9,12 +9,23 @@
     2. The second row consists of a Textbox for user input. Users can enter text or upload PDF/doc files.
 
     3. The third row includes buttons for submitting text, toggling the reference bar visibility, uploading PDF/doc files,
-    adjusting temperature for GPT responses, selecting the document type, and clearing the input.
+    cancelling uploads, adjusting temperature for GPT responses, selecting the document type, and clearing the input.
 
     The application processes user interactions:
-    - Uploaded files trigger the processing of the files, updating the input and chatbot components.
+    - Uploaded files are queued as a background job; its progress (files parsed, chunks embedded, index written) is
+    streamed to the chatbot component until it finishes, and the cancel button stops the session's uploads. Chat
+    requests are served while uploads are processed.
     - Submitting text triggers the chatbot to respond, considering the selected document type and temperature settings.
-    The response is displayed in the Textbox and Chatbot components, and the reference bar may be updated.
+    The references are shown as soon as retrieval finishes and the response is streamed into the Chatbot component
+    while it is generated. Chat requests go through Gradio's queue, whose concurrency is set in the `serve` section of
+    the config.
+
+    - The duration of every pipeline stage (extraction, chunking, embedding, indexing, retrieval, generation, ...) is
+    exported as Prometheus metrics on a separate port, and optionally logged as JSON lines (see the `telemetry_config`
+    section of the config and utils/telemetry.py).
+    - The clients of the model providers are created once and shared, over pooled connections. Their requests have
+    a timeout, are retried with backoff and are paused while a provider keeps failing (see the `api_client_config`
+    section of the config and utils/api_clients.py).
 
     The application can be run as a standalone script, launching the Gradio interface for users to interact with the chatbot.
 
@@ -22,10 +33,22 @@
     explain specific components, interactions, and logic throughout the implementation.
 """
 import gradio as gr
-from utils.upload_file import UploadFile
+from utils.upload_file import INGESTION_JOBS, UploadFile
 # from utils.chatbot import ChatBot
 from utils.chatbot1 import ChatBot
 from utils.ui_settings import UISettings
+from utils.load_config import get_config
+from utils.telemetry import Telemetry
+from utils.api_clients import ClientFactory
+from utils.upload_sessions import get_upload_sessions
+
+APPCFG = get_config()
+Telemetry.configure(enabled=APPCFG.telemetry_enabled, json_log_path=APPCFG.telemetry_json_log_path)
+ClientFactory.configure(timeout=APPCFG.api_timeout, max_retries=APPCFG.api_max_retries,
+                        backoff_base=APPCFG.api_backoff_base, backoff_max=APPCFG.api_backoff_max,
+                        failure_threshold=APPCFG.api_failure_threshold, reset_timeout=APPCFG.api_reset_timeout,
+                        max_connections=APPCFG.api_max_connections, groq_base_url=APPCFG.groq_base_url,
+                        voyage_base_url=APPCFG.voyage_base_url)
 
 
 with gr.Blocks() as demo:
@@ -88,24 +111,31 @@ with gr.Blocks() as demo:
                         '.xlsx'
                     ],
                     file_count="multiple")
+                cancel_upload_btn = gr.Button(value="Cancel upload")
                 temperature_bar = gr.Slider(minimum=0, maximum=1, value=0, step=0.1,
                                             label="Temperature", info="Choose between 0 and 1")
                 rag_with_dropdown = gr.Dropdown(
                     label="RAG with", choices=["Upload doc: Process for RAG","Preprocessed doc", "Upload doc: Give Full summary"], value="Upload doc: Process for RAG")
                 clear_button = gr.ClearButton([input_txt, chatbot])
+                clear_button.click(ChatBot.clear_memory, None, None, queue=False)
             ##############
             # Process:
             ##############
             
+            # Uploads run in the background job queue, which enforces its own limits; the handler only
+            # follows the job, so it does not need to share the concurrency of the other events.
             file_msg = upload_btn.upload(fn=UploadFile.process_uploaded_files, inputs=[
-                upload_btn, chatbot, rag_with_dropdown], outputs=[input_txt, chatbot], queue=False)
+                upload_btn, chatbot, rag_with_dropdown], outputs=[input_txt, chatbot],
+                concurrency_limit=None, concurrency_id="upload")
+            cancel_upload_btn.click(fn=UploadFile.cancel_uploads, inputs=[chatbot], outputs=[chatbot], queue=False)
 
             txt_msg = input_txt.submit(fn=ChatBot.respond,
                                        inputs=[chatbot, input_txt,
                                                rag_with_dropdown, temperature_bar],
                                        outputs=[input_txt,
                                                 chatbot, ref_output],
-                                       queue=False).then(lambda: gr.Textbox(interactive=True),
+                                       concurrency_limit=APPCFG.chat_concurrency_limit,
+                                       concurrency_id="chat").then(lambda: gr.Textbox(interactive=True),
                                                          None, [input_txt], queue=False)
 
             txt_msg = text_submit_btn.click(fn=ChatBot.respond,
@@ -113,9 +143,17 @@ with gr.Blocks() as demo:
                                                     rag_with_dropdown, temperature_bar],
                                             outputs=[input_txt,
                                                      chatbot, ref_output],
-                                            queue=False).then(lambda: gr.Textbox(interactive=True),
+                                            concurrency_limit=APPCFG.chat_concurrency_limit,
+                                            concurrency_id="chat").then(lambda: gr.Textbox(interactive=True),
                                                               None, [input_txt], queue=False)
 
 
 if __name__ == "__main__":
+    if APPCFG.telemetry_enabled and APPCFG.metrics_port:
+        # Prometheus metrics of the pipeline stages, next to the Gradio app
+        Telemetry.start_server(APPCFG.metrics_host, APPCFG.metrics_port)
+    # Upload indexes of abandoned sessions are deleted in the background, unless a job is writing them
+    get_upload_sessions().start_collector(in_use=INGESTION_JOBS.is_busy)
+    demo.queue(default_concurrency_limit=APPCFG.default_concurrency_limit,
+               max_size=APPCFG.max_queue_size)
     demo.launch()
\ No newline at end of file
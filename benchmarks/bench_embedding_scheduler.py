@@ -0,0 +1,48 @@
+"""
+    Compare serial embedding with the EmbeddingScheduler against a local stub embedding server.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_embedding_scheduler --chunks 2000 --latency 0.05 --error-rate 0.05
+"""
+import argparse
+import time
+
+from benchmarks.stubs import HTTPEmbeddings, StubEmbeddingServer
+from utils.embedding_scheduler import EmbeddingScheduler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests-per-minute", type=float, default=6000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    texts = [f"chunk {i} " * 20 for i in range(args.chunks)]
+    with StubEmbeddingServer(latency=args.latency, error_rate=args.error_rate) as server:
+        embedding = HTTPEmbeddings(server.url)
+
+        serial = EmbeddingScheduler(batch_size=args.batch_size, max_concurrency=1,
+                                    requests_per_minute=args.requests_per_minute, backoff_base=0.05)
+        start = time.perf_counter()
+        serial_vectors = serial.embed_documents(embedding, texts)
+        serial_time = time.perf_counter() - start
+
+        scheduler = EmbeddingScheduler(batch_size=args.batch_size, max_concurrency=args.concurrency,
+                                       requests_per_minute=args.requests_per_minute, backoff_base=0.05)
+        start = time.perf_counter()
+        vectors = scheduler.embed_documents(embedding, texts)
+        concurrent_time = time.perf_counter() - start
+
+    assert vectors == serial_vectors, "Concurrent results differ from the serial ones."
+    print(f"chunks={args.chunks} batch_size={args.batch_size} requests={server.requests}")
+    print(f"serial:     {serial_time:.2f}s ({args.chunks / serial_time:.0f} chunks/s)")
+    print(f"concurrent: {concurrent_time:.2f}s ({args.chunks / concurrent_time:.0f} chunks/s), "
+          f"concurrency={args.concurrency}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+    Recall-vs-latency report of the FAISS index types against the flat (exact) baseline.
+
+    Builds every index type of utils/index_factory.py on a synthetic clustered corpus, then sweeps
+    the query-time parameters (nprobe for IVF, efSearch for HNSW) and reports recall@k against
+    brute-force search, the mean query latency, the build time and the serialized index size.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_index_types --vectors 100000 --dimension 1024 --queries 200
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from utils.index_factory import INDEX_TYPES, build_index, set_search_parameters
+
+
+def clustered_corpus(num_vectors: int, dimension: int, num_queries: int, seed: int = 0):
+    """
+    Generate unit vectors grouped around random centroids, like document embeddings, and queries near them.
+
+    Parameters:
+        num_vectors (int): The number of corpus vectors.
+        dimension (int): The dimension of the vectors.
+        num_queries (int): The number of query vectors.
+        seed (int): The random seed.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The corpus and query vectors, float32.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((max(1, num_vectors // 100), dimension)).astype("float32")
+    corpus = centroids[rng.integers(len(centroids), size=num_vectors)]
+    corpus += 0.5 * rng.standard_normal(corpus.shape).astype("float32")
+    queries = centroids[rng.integers(len(centroids), size=num_queries)]
+    queries += 0.5 * rng.standard_normal(queries.shape).astype("float32")
+    faiss.normalize_L2(corpus)
+    faiss.normalize_L2(queries)
+    return corpus, queries
+
+
+def search(index: faiss.Index, queries: np.ndarray, k: int):
+    """
+    Run the queries one at a time, as the chatbot does.
+
+    Returns:
+        Tuple[np.ndarray, float]: The (num_queries, k) result ids and the mean latency in milliseconds.
+    """
+    ids = np.empty((len(queries), k), dtype="int64")
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        _, ids[i] = index.search(query[None, :], k)
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall(ids: np.ndarray, truth: np.ndarray) -> float:
+    """
+    Return the mean fraction of the exact top-k neighbours that were found.
+    """
+    return float(np.mean([len(set(row) & set(true_row)) / len(true_row) for row, true_row in zip(ids, truth)]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    args = parser.parse_args()
+
+    corpus, queries = clustered_corpus(args.vectors, args.dimension, args.queries)
+    params = {"nlist": args.nlist, "pq_m": args.pq_m, "hnsw_m": args.hnsw_m}
+    sweeps = {"ivf_flat": ("nprobe", [1, 4, 16, 64]), "ivf_pq": ("nprobe", [1, 4, 16, 64]),
+              "hnsw": ("ef_search", [16, 32, 64, 128])}
+
+    print(f"vectors={args.vectors} dimension={args.dimension} queries={args.queries} k={args.k}")
+    print(f"{'index':<10} {'param':<14} {'recall@k':>9} {'ms/query':>9} {'build s':>8} {'size MB':>8}")
+    truth = None
+    for index_type in ["flat"] + [t for t in args.types if t != "flat"]:
+        start = time.perf_counter()
+        index = build_index(index_type, corpus, params)
+        index.add(corpus)
+        build_time = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 2 ** 20
+        name, values = sweeps.get(index_type, (None, [None]))
+        for value in values:
+            if name is not None:
+                set_search_parameters(index, {**params, name: value})
+            ids, latency = search(index, queries, args.k)
+            if truth is None:
+                truth = ids
+            label = f"{name}={value}" if name else "-"
+            print(f"{index_type:<10} {label:<14} {recall(ids, truth):>9.3f} {latency:>9.3f} "
+                  f"{build_time:>8.1f} {size_mb:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+    Micro-benchmark of the references renderer for k = 5...100 retrieved chunks.
+
+    Compares utils.clean_refer.format_references with the previous implementation (regex over the
+    repr of the documents, unicode_escape and latin-1 round-trips, one re.sub per replacement pair
+    and string concatenation in a loop), reproduced below as the baseline.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_references --chunk-size 1000 --repeat 200
+"""
+import argparse
+import html
+import random
+import re
+import timeit
+
+from langchain_core.documents import Document
+
+from utils.clean_refer import format_references
+
+
+def baseline_references(documents: list) -> str:
+    """
+    The previous references renderer, kept for comparison.
+    """
+    documents = [str(x) + "\n\n" for x in documents]
+    markdown_documents = ""
+    counter = 1
+    for doc in documents:
+        content, metadata = re.match(r"page_content=(.*?)( metadata=\{.*\})", doc, re.DOTALL).groups()
+        content = bytes(content, "utf-8").decode("unicode_escape")
+        content = re.sub(r'\\n', '\n', content)
+        content = re.sub(r'\s*<EOS>\s*<pad>\s*', ' ', content)
+        content = re.sub(r'\s+', ' ', content).strip()
+        content = html.unescape(content)
+        try:
+            content = content.encode('latin1').decode('utf-8', 'ignore')
+        except UnicodeEncodeError:
+            pass
+        replacements = {'â\x80\x93': '-', 'â\x88\x88': '∈', 'Ã\x97': '×', 'ï¬\x81': 'fi', 'Â·': '·', 'ï¬\x82': 'fl'}
+        for old, new in replacements.items():
+            content = re.sub(old, new, content)
+        markdown_documents += f"# Retrieved content {counter}:\n" + content + "\n\n"
+        counter += 1
+    return markdown_documents
+
+
+def make_documents(k: int, chunk_size: int, seed: int = 0) -> list:
+    """
+    Build k chunks of text with some mojibake, entities and ligatures, like PDF extracts.
+    """
+    rng = random.Random(seed)
+    words = ["attention", "encoder", "decoder", "layer", "the", "of", "model", "xâ\x88\x88R", "&amp;",
+             "ï¬\x81nal", "Ã\x97", "token", "softmax", "self-attention", "\n"]
+    documents = []
+    for i in range(k):
+        text = []
+        while sum(len(word) + 1 for word in text) < chunk_size:
+            text.append(rng.choice(words))
+        documents.append(Document(page_content=" ".join(text),
+                                  metadata={"source": f"data/docs/paper{i % 3}.pdf", "page": i % 15 + 1}))
+    return documents
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'k':>4} {'baseline ms':>12} {'new ms':>8} {'speed-up':>9}")
+    for k in (5, 10, 20, 50, 100):
+        documents = make_documents(k, args.chunk_size)
+        baseline = timeit.timeit(lambda: baseline_references(documents), number=args.repeat) / args.repeat
+        new = timeit.timeit(lambda: format_references(documents), number=args.repeat) / args.repeat
+        print(f"{k:>4} {baseline * 1000:>12.3f} {new * 1000:>8.3f} {baseline / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
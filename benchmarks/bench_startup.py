@@ -0,0 +1,128 @@
+"""
+    Startup-time budget of the app.
+
+    Imports `app` (the Gradio UI and everything it pulls in) in fresh interpreters, `--runs` times,
+    and checks that:
+        - the median import time of the app, minus that of the Gradio import it contains, stays
+          within `--budget` seconds: Gradio's own import time is outside the control of this
+          repository, the rest (the utils modules, building the UI) is what this budget guards.
+          Both times are read from the same run, so that the variance of Gradio's multi-second
+          import does not leak into the difference,
+        - none of the modules of LAZY_MODULES is imported at startup: the provider SDKs and
+          document parsers are imported on first use, since a deployment only uses some of them,
+          and langchain, its FAISS vector store and faiss on the first question or upload.
+    Exits with status 1 if a check fails, so it can run as a regression check in CI; the same
+    check runs in tests/test_startup.py.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_startup
+        python -m benchmarks.bench_startup --runs 5 --budget 0.5 --output startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Set, Tuple
+
+# Modules that must only be imported on first use
+LAZY_MODULES = ("openai", "tiktoken", "g4f", "groq", "langchain_groq", "voyageai", "langchain_voyageai",
+                "langchain_google_genai", "langchain_nvidia_ai_endpoints", "PyPDF2", "pypdf", "docx", "openpyxl",
+                "langchain", "langchain_community", "faiss")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_IMPORT_TIME = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_module(module: str) -> Tuple[Dict[str, float], Set[str]]:
+    """
+    Import a module in a fresh interpreter.
+
+    Parameters:
+        module (str): The module to import.
+
+    Returns:
+        Tuple[Dict[str, float], Set[str]]: The cumulative import time of the module and of every
+        module it imported, in seconds, and the top-level packages imported along with it.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    times, packages = {}, set()
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match is None:
+            continue
+        name = match.group(3)
+        times[name] = int(match.group(1)) / 1e6
+        packages.add(name.split(".")[0])
+    return times, packages
+
+
+def measure(module: str, runs: int) -> Tuple[List[Dict[str, float]], Set[str]]:
+    """
+    Import a module `runs` times, each in a fresh interpreter.
+
+    Returns:
+        Tuple[List[Dict[str, float]], Set[str]]: The import times of every run, in seconds, by
+        module, and the packages imported by any of the runs.
+    """
+    runs_times, packages = [], set()
+    for _ in range(runs):
+        times, imported = import_module(module)
+        runs_times.append(times)
+        packages |= imported
+    return runs_times, packages
+
+
+def check(runs: int = 3, budget: float = 1.0) -> Tuple[Dict, List[str]]:
+    """
+    Measure the startup of the app and check it against the budget.
+
+    Parameters:
+        runs (int): The number of imports of Gradio and of the app.
+        budget (float): The maximum import time of the app on top of Gradio's, in seconds.
+
+    Returns:
+        Tuple[Dict, List[str]]: The measurements, and a description of every failed check.
+    """
+    # Warm the bytecode and OS file caches, so that the first run is not an outlier
+    import_module("app")
+    runs_times, packages = measure("app", runs)
+    overhead = statistics.median(times["app"] - times["gradio"] for times in runs_times)
+    eager = sorted(module for module in LAZY_MODULES if module in packages)
+
+    results: Dict = {"runs": runs, "budget_s": budget,
+                     "gradio_s": statistics.median(times["gradio"] for times in runs_times),
+                     "app_s": statistics.median(times["app"] for times in runs_times),
+                     "app_over_gradio_s": overhead, "eager_imports": eager}
+    failures = []
+    if overhead > budget:
+        failures.append(f"the app takes {overhead:.2f}s to import on top of Gradio, over the {budget:.2f}s budget")
+    if eager:
+        failures.append(f"imported at startup instead of on first use: {', '.join(eager)}")
+    return results, failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="Maximum import time of the app on top of Gradio's, in seconds.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results, failures = check(args.runs, args.budget)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+    Offline end-to-end benchmark of the ingestion and query paths.
+
+    Builds a synthetic corpus by copying the files of data/docs_2 `--scale` times, then measures,
+    against the local stand-ins of benchmarks/stubs.py for Voyage, Groq and g4f (no network access
+    or API keys needed, latencies configurable):
+        - extraction (pages/s) and chunking (chunks/s) of the corpus,
+        - embedding of the chunks through the EmbeddingScheduler (embeddings/s),
+        - the end-to-end index build with PrepareVectorDB,
+        - the latency percentiles of ChatBot.respond, to the references and to the full answer,
+        - the wall time of the summarizer on one PDF,
+        - the peak RSS of the process and of its extraction worker processes.
+    The results are written as JSON together with the commit they were measured on, and
+    `--compare` prints the change against a previous run. A stage that fails records its error
+    instead of its metrics.
+
+    tiktoken downloads its tokenizer files on first use; for runs without network access, point
+    TIKTOKEN_CACHE_DIR at a directory where they are cached.
+
+    Usage (from the repository root):
+        python -m benchmarks.bench_suite --scale 4 --queries 200 --output bench.json
+        python -m benchmarks.bench_suite --scale 4 --queries 200 --output new.json --compare bench.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+from unittest import mock
+
+import numpy as np
+
+from benchmarks.stubs import StubChatModel, StubCompletionClient, StubVoyageEmbeddings, register_stub_embeddings
+from utils.chunker import DocumentChunker
+from utils.doc_parser import DocumentClassifier
+from utils.embedding_scheduler import EmbeddingScheduler
+from utils.load_config import get_config
+from utils.parallel_extract import ParallelExtractor
+from utils.prepare_vectordb import PrepareVectorDB
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+APPCFG = get_config()
+ENGINE = "stub-voyage"
+
+
+def build_corpus(source_directory: str, target_directory: str, scale: int) -> List[str]:
+    """
+    Copy every file of a directory `scale` times under distinct names.
+
+    Parameters:
+        source_directory (str): The directory holding the sample documents.
+        target_directory (str): The directory the copies are written to.
+        scale (int): The number of copies of every file.
+
+    Returns:
+        List[str]: The paths of the copies, sorted.
+    """
+    os.makedirs(target_directory, exist_ok=True)
+    files = []
+    for name in sorted(os.listdir(source_directory)):
+        source = os.path.join(source_directory, name)
+        if not os.path.isfile(source):
+            continue
+        for copy in range(scale):
+            target = os.path.join(target_directory, f"copy{copy:03d}-{name}")
+            shutil.copyfile(source, target)
+            files.append(target)
+    return sorted(files)
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    """
+    Summarize latencies.
+
+    Parameters:
+        seconds (List[float]): The latencies, in seconds.
+
+    Returns:
+        Dict[str, float]: The mean, p50, p95 and p99 latencies, in milliseconds.
+    """
+    values = np.array(seconds) * 1000
+    return {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)), "p99": float(np.percentile(values, 99))}
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """
+    Return the peak resident set size of this process and of its terminated children (the extraction workers).
+
+    Returns:
+        Dict[str, Optional[float]]: The peak RSS values, in MiB, or None where the platform does not report them.
+    """
+    if resource is None:
+        return {"self": None, "children": None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit}
+
+
+def git_commit() -> Dict[str, Optional[object]]:
+    """
+    Identify the commit the benchmark runs on.
+
+    Returns:
+        Dict: The commit hash (None outside a git checkout) and whether the working tree has changes.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+def make_scheduler(args: argparse.Namespace) -> EmbeddingScheduler:
+    return EmbeddingScheduler(batch_size=APPCFG.embedding_batch_size,
+                              max_concurrency=APPCFG.embedding_max_concurrency,
+                              requests_per_minute=args.requests_per_minute or APPCFG.embedding_requests_per_minute,
+                              max_retries=APPCFG.embedding_max_retries,
+                              backoff_base=APPCFG.embedding_backoff_base,
+                              backoff_max=APPCFG.embedding_backoff_max)
+
+
+def bench_extraction(files: List[str], args: argparse.Namespace):
+    """
+    Extract and chunk the documents of the corpus (spreadsheets are chunked by the index build only).
+
+    Returns:
+        Tuple[Dict, List[str]]: The extraction and chunking metrics, and the chunk texts.
+    """
+    documents = [file for file in files if not DocumentClassifier(document=file).is_table()]
+    extractor = ParallelExtractor(max_workers=args.workers, pages_per_task=APPCFG.extraction_pages_per_task,
+                                  page_timeout=APPCFG.extraction_page_timeout)
+    start = time.perf_counter()
+    extracted = list(extractor.extract_pages(documents))
+    extraction_time = time.perf_counter() - start
+    num_pages = sum(len(pages) for pages in extracted)
+
+    chunker = DocumentChunker(chunk_size=APPCFG.chunk_size, chunk_overlap=APPCFG.chunk_overlap)
+    start = time.perf_counter()
+    texts = [chunk.page_content for document, pages in zip(documents, extracted)
+             for chunk in chunker.chunk_pages(os.path.basename(document), pages)]
+    chunking_time = time.perf_counter() - start
+    return {
+        "extraction": {"documents": len(documents), "pages": num_pages, "seconds": extraction_time,
+                       "pages_per_s": num_pages / extraction_time},
+        "chunking": {"chunks": len(texts), "seconds": chunking_time, "chunks_per_s": len(texts) / chunking_time},
+    }, texts
+
+
+def bench_embedding(texts: List[str], args: argparse.Namespace) -> Dict:
+    """
+    Embed the chunk texts through the EmbeddingScheduler, like ingestion does.
+    """
+    embedding = StubVoyageEmbeddings(latency=args.embedding_latency)
+    start = time.perf_counter()
+    make_scheduler(args).embed_documents(embedding, texts)
+    seconds = time.perf_counter() - start
+    return {"embeddings": len(texts), "requests": embedding.requests, "seconds": seconds,
+            "embeddings_per_s": len(texts) / seconds}
+
+
+def bench_index_build(files: List[str], persist_directory: str, args: argparse.Namespace) -> Dict:
+    """
+    Build the index of the whole corpus with PrepareVectorDB, as an upload of all the files.
+    """
+    progress = {}
+    prepare_vectordb = PrepareVectorDB(data_directory=files,
+                                       persist_directory=persist_directory,
+                                       chunk_size=APPCFG.chunk_size,
+                                       chunk_overlap=APPCFG.chunk_overlap,
+                                       extractor=ParallelExtractor(max_workers=args.workers,
+                                                                   pages_per_task=APPCFG.extraction_pages_per_task,
+                                                                   page_timeout=APPCFG.extraction_page_timeout),
+                                       embedding_scheduler=make_scheduler(args),
+                                       index_type=args.index_type,
+                                       index_params=APPCFG.index_params,
+                                       embedding_model_engine=ENGINE,
+                                       progress_callback=lambda stage, done, total: progress.__setitem__(stage, done))
+    start = time.perf_counter()
+    prepare_vectordb.prepare_and_save_vectordb()
+    seconds = time.perf_counter() - start
+    return {"files": len(files), "chunks": progress.get("chunks", 0), "index_type": args.index_type,
+            "seconds": seconds, "chunks_per_s": progress.get("chunks", 0) / seconds}
+
+
+def bench_queries(persist_directory: str, texts: List[str], args: argparse.Namespace) -> Dict:
+    """
+    Answer questions drawn from the corpus with ChatBot.respond, against the stub chat model.
+
+    Every question is asked in a fresh conversation with the answer cache disabled, so each one
+    goes through retrieval and generation.
+    """
+    from utils import chatbot1
+    from utils.index_registry import IndexRegistry
+
+    rng = random.Random(args.seed)
+    questions = []
+    while len(questions) < args.queries:
+        words = rng.choice(texts).split()
+        offset = rng.randrange(max(1, len(words) - args.query_words))
+        questions.append(" ".join(words[offset:offset + args.query_words]) + "?")
+
+    llm = StubChatModel(latency=args.llm_latency, token_latency=args.token_latency)
+    embedding = register_stub_embeddings(latency=args.embedding_latency)
+    to_references, to_answer = [], []
+    with mock.patch.object(chatbot1, "get_llm", return_value=llm), \
+            mock.patch.object(chatbot1, "get_embedding", return_value=embedding), \
+            mock.patch.multiple(chatbot1.APPCFG, persist_directory=persist_directory,
+                                embedding_model_engine=ENGINE, answer_cache_enabled=False):
+        start = time.perf_counter()
+        IndexRegistry.get(persist_directory, embedding)
+        load_time = time.perf_counter() - start
+        for question in questions:
+            chatbot1.ChatBot.clear_memory()
+            start = time.perf_counter()
+            references_time = None
+            for _, _, references in chatbot1.ChatBot.respond([], question):
+                if references_time is None:
+                    references_time = time.perf_counter() - start
+            to_answer.append(time.perf_counter() - start)
+            to_references.append(references_time)
+    return {"queries": len(questions), "index_load_seconds": load_time,
+            "to_references_ms": percentiles(to_references), "to_answer_ms": percentiles(to_answer)}
+
+
+def bench_summarizer(args: argparse.Namespace) -> Dict:
+    """
+    Summarize one PDF against the stub completion client.
+    """
+    from utils import summarizer
+    from utils.api_clients import ClientFactory
+
+    client = StubCompletionClient(latency=args.summary_latency)
+    with mock.patch.object(ClientFactory, "completion_client", return_value=client):
+        start = time.perf_counter()
+        summarizer.Summarizer.summarize_the_pdf(
+            file_dir=args.summary_file,
+            max_final_token=APPCFG.max_final_token,
+            token_threshold=APPCFG.token_threshold,
+            gpt_model=APPCFG.llm_engine,
+            temperature=APPCFG.temperature,
+            summarizer_llm_system_role=APPCFG.summarizer_llm_system_role,
+            final_summarizer_llm_system_role=APPCFG.final_summarizer_llm_system_role,
+            window_token_budget=APPCFG.window_token_budget,
+            window_token_overlap=APPCFG.window_token_overlap,
+            max_concurrency=APPCFG.summarizer_max_concurrency,
+            reduce_token_limit=APPCFG.summarizer_reduce_token_limit)
+        seconds = time.perf_counter() - start
+    return {"file": os.path.basename(args.summary_file), "requests": client.requests, "seconds": seconds}
+
+
+def run_stage(results: Dict, name: str, function, *args) -> bool:
+    """
+    Run a benchmark stage and store its metrics, or its error if it fails.
+
+    Returns:
+        bool: Whether the stage succeeded.
+    """
+    try:
+        results[name] = function(*args)
+    except (Exception, SystemExit) as e:
+        # SystemExit too: the summarizer exits on errors.
+        results[name] = {"error": f"{type(e).__name__}: {e}"}
+        return False
+    return True
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    """
+    Flatten nested results into {"stage.metric": value}, keeping the numeric values only.
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(previous: Dict, current: Dict) -> None:
+    """
+    Print the metrics of two runs side by side, with the relative change.
+    """
+    before, after = flatten(previous["results"]), flatten(current["results"])
+    print(f"\nComparison with {previous.get('commit') or 'unknown commit'} "
+          f"(now {current.get('commit') or 'unknown commit'}):")
+    print(f"{'metric':45} {'before':>12} {'after':>12} {'change':>8}")
+    for key in sorted(before.keys() & after.keys()):
+        change = f"{(after[key] - before[key]) / before[key]:+.1%}" if before[key] else "n/a"
+        print(f"{key:45} {before[key]:12.4g} {after[key]:12.4g} {change:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=os.path.join("data", "docs_2"))
+    parser.add_argument("--scale", type=int, default=2, help="Number of copies of every source file.")
+    parser.add_argument("--workers", type=int, default=APPCFG.extraction_max_workers)
+    parser.add_argument("--index-type", default=APPCFG.index_type)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Per request, in seconds.")
+    parser.add_argument("--requests-per-minute", type=float, default=0,
+                        help="Embedding rate limit; 0 uses the configured one.")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Time to the first token, in seconds.")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Time between tokens, in seconds.")
+    parser.add_argument("--summary-latency", type=float, default=0.5, help="Per request, in seconds.")
+    parser.add_argument("--summary-file", default=os.path.join("data", "docs_2", "Attention_Is_All_You_Need.pdf"))
+    parser.add_argument("--skip", nargs="*", default=[], choices=["queries", "summarizer"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare with the results of a previous run (JSON file).")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the benchmarked code.")
+    args = parser.parse_args()
+
+    register_stub_embeddings(latency=args.embedding_latency)
+    results = {}
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with tempfile.TemporaryDirectory(prefix="bench-suite-") as directory, quiet:
+        files = build_corpus(args.source, os.path.join(directory, "corpus"), args.scale)
+        metrics, texts = bench_extraction(files, args)
+        results.update(metrics)
+        run_stage(results, "embedding", bench_embedding, texts, args)
+        persist_directory = os.path.join(directory, "index")
+        built = run_stage(results, "index_build", bench_index_build, files, persist_directory, args)
+        if "queries" not in args.skip and built:
+            run_stage(results, "query", bench_queries, persist_directory, texts, args)
+        if "summarizer" not in args.skip:
+            run_stage(results, "summarizer", bench_summarizer, args)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    report = {**git_commit(),
+              "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+              "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+              "parameters": {key: value for key, value in vars(args).items()
+                             if key not in ("output", "compare", "verbose")},
+              "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
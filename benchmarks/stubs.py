@@ -0,0 +1,305 @@
+"""
+    Local stand-ins for the remote services used by the app, for benchmarks and offline runs.
+
+    The stubs are deterministic and need no network access or API keys. Each one can add a fixed
+    latency per call so that concurrency and batching effects show up as they would against the
+    real providers.
+"""
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Iterator, List, Optional
+from urllib import error, request
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.embedding_providers import EMBEDDING_PROVIDERS, HashingEmbeddings
+
+
+def deterministic_vector(text: str, dimension: int) -> List[float]:
+    """
+    Map a text to a pseudo-random unit vector that only depends on the text.
+
+    Parameters:
+        text (str): The text to embed.
+        dimension (int): The dimension of the vector.
+
+    Returns:
+        List[float]: The L2-normalized vector.
+    """
+    values = []
+    counter = 0
+    while len(values) < dimension:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(value / 2 ** 31 - 1.0 for value in struct.unpack("<8I", digest))
+        counter += 1
+    values = values[:dimension]
+    norm = math.sqrt(sum(value * value for value in values)) or 1.0
+    return [value / norm for value in values]
+
+
+def deterministic_words(text: str, num_words: int) -> List[str]:
+    """
+    Draw words of a text pseudo-randomly, with a seed that only depends on the text.
+
+    Parameters:
+        text (str): The text to draw from, e.g. a prompt.
+        num_words (int): The number of words to draw.
+
+    Returns:
+        List[str]: The words.
+    """
+    words = text.split() or ["stub"]
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.choice(words) for _ in range(num_words)]
+
+
+class StubEmbeddingServer:
+    """
+    Local HTTP server imitating an embedding API.
+
+    POST /v1/embeddings with {"input": [...]} returns {"data": [{"embedding": [...]}, ...]}. Every
+    request sleeps `latency` seconds, and a fraction `error_rate` of the requests fails with HTTP
+    429 so that retry logic can be exercised.
+
+    Attributes:
+        dimension (int): The dimension of the returned vectors.
+        latency (float): The delay added to every request, in seconds.
+        error_rate (float): The fraction of requests answered with HTTP 429.
+        requests (int): The number of requests received.
+        url (str): The base URL of the server, once started.
+    """
+
+    def __init__(self, dimension: int = 256, latency: float = 0.05, error_rate: float = 0.0, seed: int = 0) -> None:
+        self.dimension = dimension
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.url = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self) -> "StubEmbeddingServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests += 1
+                    fail = stub._random.random() < stub.error_rate
+                time.sleep(stub.latency)
+                if fail:
+                    payload, status = {"error": "rate limited"}, 429
+                else:
+                    payload = {"data": [{"embedding": deterministic_vector(text, stub.dimension)}
+                                        for text in body["input"]]}
+                    status = 200
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class HTTPStatusError(Exception):
+    """
+    Error raised by HTTPEmbeddings when the server answers with an error status.
+
+    Attributes:
+        status_code (int): The HTTP status code of the response.
+    """
+
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+
+
+class HTTPEmbeddings(Embeddings):
+    """
+    Minimal embedding client for StubEmbeddingServer.
+
+    Parameters:
+        url (str): The base URL of the server.
+        timeout (float): The request timeout, in seconds.
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.model = "stub-embedding"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        req = request.Request(f"{self.url}/v1/embeddings", data=json.dumps({"input": texts}).encode("utf-8"),
+                              headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with request.urlopen(req, timeout=self.timeout) as response:
+                payload = json.loads(response.read())
+        except error.HTTPError as e:
+            raise HTTPStatusError(e.code, e.reason) from e
+        return [item["embedding"] for item in payload["data"]]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class StubVoyageEmbeddings(Embeddings):
+    """
+    In-process stand-in for the Voyage embedding API.
+
+    Texts are sent in requests of at most `batch_size` texts, like the Voyage client, and every
+    request sleeps `latency` seconds. The vectors come from HashingEmbeddings, so they are
+    deterministic and retrieval over them returns chunks sharing words with the query.
+
+    Attributes:
+        dimension (int): The dimension of the vectors.
+        latency (float): The delay added to every request, in seconds.
+        batch_size (int): The maximum number of texts per request.
+        requests (int): The number of requests made.
+    """
+
+    def __init__(self, dimension: int = 1024, latency: float = 0.05, batch_size: int = 128) -> None:
+        self.dimension = dimension
+        self.latency = latency
+        self.batch_size = batch_size
+        self.requests = 0
+        self.model = "stub-voyage"
+        self._embedding = HashingEmbeddings(dimension=dimension)
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            with self._lock:
+                self.requests += 1
+            time.sleep(self.latency)
+            vectors.extend(self._embedding.embed_documents(texts[start:start + self.batch_size]))
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def register_stub_embeddings(latency: float = 0.05, batch_size: int = 128) -> StubVoyageEmbeddings:
+    """
+    Register the "stub" embedding provider, serving the "stub-voyage-<dimension>" engines.
+
+    Every engine name gets one shared StubVoyageEmbeddings, so its request count covers both
+    ingestion and queries.
+
+    Parameters:
+        latency (float): The delay added to every request, in seconds.
+        batch_size (int): The maximum number of texts per request.
+
+    Returns:
+        StubVoyageEmbeddings: The model served for "stub-voyage" (1024 dimensions).
+    """
+    models = {}
+
+    def factory(engine: str) -> Embeddings:
+        if engine not in models:
+            _, _, dimension = engine.partition("stub-voyage-")
+            models[engine] = StubVoyageEmbeddings(dimension=int(dimension) if dimension else 1024,
+                                                  latency=latency, batch_size=batch_size)
+        return models[engine]
+
+    EMBEDDING_PROVIDERS["stub"] = (("stub-",), factory)
+    return factory("stub-voyage")
+
+
+class StubChatModel(BaseChatModel):
+    """
+    In-process stand-in for the Groq chat model.
+
+    The answer is `answer_words` words drawn from the last message (see `deterministic_words`), so
+    it is the same for the same prompt. The first token arrives after `latency` seconds and every
+    following one after `token_latency` seconds, both when streaming and when invoking.
+
+    Attributes:
+        latency (float): The time to the first token, in seconds.
+        token_latency (float): The time between two tokens, in seconds.
+        answer_words (int): The number of words of every answer.
+    """
+    latency: float = 0.3
+    token_latency: float = 0.005
+    answer_words: int = 64
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def __answer(self, messages: List[BaseMessage]) -> List[str]:
+        return deterministic_words(str(messages[-1].content) if messages else "", self.answer_words)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        words = self.__answer(messages)
+        time.sleep(self.latency + self.token_latency * max(0, len(words) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for position, word in enumerate(self.__answer(messages)):
+            if position:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if not position else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class StubCompletionClient:
+    """
+    In-process stand-in for the g4f (OpenAI-style) client used by the summarizer.
+
+    `client.chat.completions.create(model=..., messages=[...])` sleeps `latency` seconds and
+    returns a response whose `choices[0].message.content` holds `answer_words` words drawn from
+    the last message. The instance can be called to stand in for the client class itself.
+
+    Attributes:
+        latency (float): The delay added to every request, in seconds.
+        answer_words (int): The number of words of every answer.
+        requests (int): The number of requests made.
+    """
+
+    def __init__(self, latency: float = 1.0, answer_words: int = 200) -> None:
+        self.latency = latency
+        self.answer_words = answer_words
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs) -> "StubCompletionClient":
+        return self
+
+    def create(self, model: str, messages: List[dict], **kwargs) -> SimpleNamespace:
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency)
+        content = " ".join(deterministic_words(messages[-1]["content"] if messages else "", self.answer_words))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))])
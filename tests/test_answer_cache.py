@@ -0,0 +1,55 @@
+"""
+    Exact and semantic lookups, expiry and invalidation of AnswerCache.
+"""
+from utils.answer_cache import AnswerCache
+
+NAMESPACE = ("index", 1)
+
+
+def test_exact_lookups_ignore_case_and_trailing_punctuation():
+    cache = AnswerCache()
+    cache.put(NAMESPACE, "What is  FAISS?", None, "a library", "refs")
+    assert cache.lookup_exact(NAMESPACE, "what is faiss") == ("a library", "refs")
+    assert cache.lookup_exact(("index", 2), "what is faiss") is None
+    assert cache.lookup_similar(NAMESPACE, [1.0, 0.0]) is None
+
+
+def test_semantic_lookups_respect_the_threshold():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put(NAMESPACE, "what is faiss", [1.0, 0.0, 0.0], "a library", "refs")
+    assert cache.lookup_similar(NAMESPACE, [2.0, 0.1, 0.0]) == ("a library", "refs")
+    assert cache.lookup_similar(NAMESPACE, [1.0, 1.0, 0.0]) is None
+    assert cache.lookup_similar(("index", 2), [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_expired_answers_are_not_served(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("utils.answer_cache.time.time", lambda: now[0])
+    cache = AnswerCache(ttl_seconds=60)
+    cache.put(NAMESPACE, "what is faiss", [1.0, 0.0], "a library", "refs")
+    now[0] += 61
+    assert cache.lookup_similar(NAMESPACE, [1.0, 0.0]) is None
+    assert cache.lookup_exact(NAMESPACE, "what is faiss") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_new_index_versions_drop_older_answers():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put(("index", 1), "what is faiss", [1.0, 0.0], "old answer", "refs")
+    cache.put(("other", 1), "what is faiss", [1.0, 0.0], "other answer", "refs")
+    cache.invalidate(("index", 2), "index")
+    assert cache.lookup_exact(("index", 1), "what is faiss") is None
+    assert cache.lookup_similar(("index", 1), [1.0, 0.0]) is None
+    assert cache.lookup_exact(("other", 1), "what is faiss") == ("other answer", "refs")
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_answers_are_evicted():
+    cache = AnswerCache(max_entries=2)
+    for question in ("one", "two"):
+        cache.put(NAMESPACE, question, None, question, "")
+    assert cache.lookup_exact(NAMESPACE, "one") == ("one", "")
+    cache.put(NAMESPACE, "three", None, "three", "")
+    assert cache.lookup_exact(NAMESPACE, "two") is None
+    assert cache.lookup_exact(NAMESPACE, "one") == ("one", "")
@@ -0,0 +1,124 @@
+"""
+    Retries and circuit breaking of ClientFactory.call and ClientFactory.stream, against the local
+    embedding server of benchmarks/stubs.py.
+"""
+import time
+
+import pytest
+
+from benchmarks.stubs import HTTPEmbeddings, HTTPStatusError, StubEmbeddingServer
+from utils.api_clients import APIRequestError, CircuitOpenError, ClientFactory
+
+KEY = "embedding:stub"
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff():
+    settings = dict(ClientFactory._settings)
+    ClientFactory.configure(backoff_base=0.001, backoff_max=0.01)
+    yield
+    ClientFactory.configure(**settings)
+
+
+def stream_vectors(embeddings: HTTPEmbeddings, texts):
+    # Like a streaming model call: the request is only sent when the first chunk is read
+    for vector in embeddings.embed_documents(texts):
+        yield vector
+
+
+def test_call_retries_rate_limited_requests():
+    ClientFactory.configure(max_retries=10, failure_threshold=100)
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=0.3) as server:
+        embeddings = HTTPEmbeddings(server.url)
+        vectors = [ClientFactory.call(KEY, embeddings.embed_query, f"text {i}") for i in range(20)]
+    assert all(len(vector) == 8 for vector in vectors)
+    assert server.requests > 20
+    assert ClientFactory.breaker(KEY).state == "closed"
+
+
+def test_call_gives_up_after_max_retries():
+    ClientFactory.configure(max_retries=2, failure_threshold=100)
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=1.0) as server:
+        embeddings = HTTPEmbeddings(server.url)
+        with pytest.raises(APIRequestError, match="after 3 attempts"):
+            ClientFactory.call(KEY, embeddings.embed_query, "text")
+    assert server.requests == 3
+
+
+def test_call_does_not_retry_other_errors():
+    attempts = []
+
+    def bad_request():
+        attempts.append(1)
+        raise ValueError("invalid input")
+
+    with pytest.raises(APIRequestError, match="invalid input"):
+        ClientFactory.call(KEY, bad_request)
+    assert len(attempts) == 1
+    assert ClientFactory.breaker(KEY).state == "closed"
+
+
+def test_circuit_opens_and_recovers():
+    ClientFactory.configure(max_retries=0, failure_threshold=3, reset_timeout=0.2)
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=1.0) as server:
+        embeddings = HTTPEmbeddings(server.url)
+        for _ in range(3):
+            with pytest.raises(APIRequestError):
+                ClientFactory.call(KEY, embeddings.embed_query, "text")
+        # Open: refused without reaching the server
+        with pytest.raises(CircuitOpenError):
+            ClientFactory.call(KEY, embeddings.embed_query, "text")
+        assert server.requests == 3
+        assert ClientFactory.breaker(KEY).state == "open"
+
+        # Half-open after reset_timeout: a successful trial request closes the circuit
+        time.sleep(0.25)
+        server.error_rate = 0.0
+        assert len(ClientFactory.call(KEY, embeddings.embed_query, "text")) == 8
+        assert ClientFactory.breaker(KEY).state == "closed"
+        assert server.requests == 4
+
+
+def test_rejected_trial_request_closes_the_circuit():
+    ClientFactory.configure(max_retries=0, failure_threshold=1, reset_timeout=0.2)
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=1.0) as server:
+        embeddings = HTTPEmbeddings(server.url)
+        with pytest.raises(APIRequestError):
+            ClientFactory.call(KEY, embeddings.embed_query, "text")
+        assert ClientFactory.breaker(KEY).state == "open"
+
+    def bad_request():
+        raise HTTPStatusError(400, "Bad Request")
+
+    # The trial request is answered with a non-retryable error: the provider is up
+    time.sleep(0.25)
+    with pytest.raises(APIRequestError, match="HTTP 400"):
+        ClientFactory.call(KEY, bad_request)
+    assert ClientFactory.breaker(KEY).state == "closed"
+    assert ClientFactory.call(KEY, lambda: "ok") == "ok"
+
+
+def test_stream_retries_before_the_first_chunk():
+    ClientFactory.configure(max_retries=10, failure_threshold=100)
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=0.3) as server:
+        embeddings = HTTPEmbeddings(server.url)
+        streams = [list(ClientFactory.stream(KEY, stream_vectors, embeddings, ["a", "b", "c"])) for _ in range(10)]
+    assert all(len(chunks) == 3 for chunks in streams)
+    assert server.requests > 10
+
+
+def test_stream_is_not_retried_once_started():
+    ClientFactory.configure(max_retries=10, failure_threshold=100)
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=1.0) as server:
+        embeddings = HTTPEmbeddings(server.url)
+
+        def interrupted_stream():
+            yield "first chunk"
+            yield embeddings.embed_query("text")
+
+        chunks = []
+        with pytest.raises(APIRequestError, match="interrupted"):
+            for chunk in ClientFactory.stream(KEY, interrupted_stream):
+                chunks.append(chunk)
+    assert chunks == ["first chunk"]
+    assert server.requests == 1
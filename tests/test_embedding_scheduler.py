@@ -0,0 +1,42 @@
+"""
+    Batching, ordering and retries of EmbeddingScheduler, against the local embedding server of
+    benchmarks/stubs.py.
+"""
+import pytest
+
+from benchmarks.stubs import HTTPEmbeddings, HTTPStatusError, StubEmbeddingServer, deterministic_vector
+from utils.embedding_scheduler import EmbeddingScheduler
+from utils.telemetry import Telemetry
+
+TEXTS = [f"chunk {i}" for i in range(50)]
+
+
+def scheduler(max_retries: int) -> EmbeddingScheduler:
+    return EmbeddingScheduler(batch_size=8, max_concurrency=4, requests_per_minute=60000,
+                              max_retries=max_retries, backoff_base=0.001, backoff_max=0.01)
+
+
+def test_batches_keep_the_input_order():
+    progress = []
+    with StubEmbeddingServer(dimension=8, latency=0.01) as server:
+        vectors = scheduler(max_retries=0).embed_documents(
+            HTTPEmbeddings(server.url), TEXTS, progress_callback=lambda *counts: progress.append(counts))
+    assert vectors == [deterministic_vector(text, 8) for text in TEXTS]
+    assert server.requests == 7
+    assert progress[-1] == (7, 7, 50, 50)
+
+
+def test_rate_limited_batches_are_retried():
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=0.3) as server:
+        with Telemetry.span("embed") as span:
+            vectors = scheduler(max_retries=10).embed_documents(HTTPEmbeddings(server.url), TEXTS)
+    assert vectors == [deterministic_vector(text, 8) for text in TEXTS]
+    assert server.requests > 7
+    assert span.counts["retries"] == server.requests - 7
+
+
+def test_retries_are_bounded():
+    with StubEmbeddingServer(dimension=8, latency=0, error_rate=1.0) as server:
+        with pytest.raises(HTTPStatusError):
+            scheduler(max_retries=2).embed_documents(HTTPEmbeddings(server.url), TEXTS[:8])
+    assert server.requests == 3
@@ -0,0 +1,78 @@
+"""
+    Memory budget, hot swap and load errors of IndexRegistry.
+"""
+import pytest
+
+from utils.docstore import VectorDBFiles
+from utils.embedding_providers import HashingEmbeddings
+from utils.index_registry import IndexLoadError, IndexRegistry
+from utils.prepare_vectordb import PrepareVectorDB
+from utils.telemetry import Telemetry
+
+ENGINE = "hashing-32"
+EMBEDDING = HashingEmbeddings(dimension=32)
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    search_params, max_bytes = IndexRegistry._search_params, IndexRegistry._max_bytes
+    IndexRegistry._entries.clear()
+    yield
+    IndexRegistry._entries.clear()
+    IndexRegistry.configure(search_params, max_bytes=max_bytes)
+
+
+def build_index(tmp_path, name: str, num_rows: int = 20) -> str:
+    documents = tmp_path / f"{name}-docs"
+    documents.mkdir(exist_ok=True)
+    file_path = documents / f"{name}-{num_rows}.csv"
+    file_path.write_text("name,value\n" + "".join(f"{name} row {n},{n}\n" for n in range(num_rows)), encoding="utf-8")
+    persist_directory = str(tmp_path / name)
+    PrepareVectorDB(data_directory=[], persist_directory=persist_directory, chunk_size=200, chunk_overlap=0,
+                    embedding_model_engine=ENGINE).add_documents([str(file_path)])
+    return persist_directory
+
+
+def test_least_recently_used_indexes_are_evicted(tmp_path):
+    first, second, third = (build_index(tmp_path, name) for name in ("one", "two", "six"))
+    # Same-sized indexes: the budget holds two of them
+    size = IndexRegistry.get(first, EMBEDDING).nbytes
+    IndexRegistry.configure({}, max_bytes=2 * size)
+    evictions = Telemetry._counters.get(("evictions", "index_evict"), 0)
+    IndexRegistry.get(second, EMBEDDING)
+    IndexRegistry.get(first, EMBEDDING)
+    IndexRegistry.get(third, EMBEDDING)
+    assert list(IndexRegistry._entries) == [first, third]
+    assert IndexRegistry.resident_bytes() <= 2 * size
+    assert Telemetry._counters[("evictions", "index_evict")] == evictions + 1
+    # An evicted index is loaded again on its next use
+    assert IndexRegistry.get(second, EMBEDDING).vectordb.index.ntotal > 0
+    assert list(IndexRegistry._entries) == [third, second]
+
+
+def test_a_new_generation_is_swapped_in(tmp_path):
+    directory = build_index(tmp_path, "index")
+    before = IndexRegistry.get(directory, EMBEDDING)
+    assert IndexRegistry.get(directory, EMBEDDING) is before
+    build_index(tmp_path, "index", num_rows=60)
+    after = IndexRegistry.get(directory, EMBEDDING)
+    assert after.version != before.version
+    assert after.vectordb.index.ntotal > before.vectordb.index.ntotal
+    assert set(after.manifest.files) == {"index-20.csv", "index-60.csv"}
+    # Requests holding the previous version keep searching it
+    assert before.vectordb.similarity_search("index row 3", k=1)
+
+
+def test_failed_loads_keep_the_resident_version_or_raise(tmp_path, monkeypatch):
+    directory = build_index(tmp_path, "index")
+    before = IndexRegistry.get(directory, EMBEDDING)
+    build_index(tmp_path, "index", num_rows=60)
+
+    def fail(directory, embedding):
+        raise OSError("truncated index")
+
+    monkeypatch.setattr(VectorDBFiles, "load", staticmethod(fail))
+    assert IndexRegistry.get(directory, EMBEDDING) is before
+    IndexRegistry.evict(directory)
+    with pytest.raises(IndexLoadError, match="truncated index"):
+        IndexRegistry.get(directory, EMBEDDING)
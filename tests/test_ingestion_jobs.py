@@ -0,0 +1,53 @@
+"""
+    State transitions and limits of IngestionJobQueue.
+"""
+import threading
+
+import pytest
+
+from utils.ingestion_jobs import IngestionJob, IngestionJobQueue, JobLimitError
+
+
+def blocked_queue(max_pending: int):
+    """
+    A queue whose single worker is held by a running job until the returned event is set.
+    """
+    release = threading.Event()
+    jobs = IngestionJobQueue(max_workers=1, max_pending=max_pending, max_jobs_per_user=100)
+    running = jobs.submit("owner", "blocking", lambda job: release.wait(10))
+    for _ in IngestionJobQueue.watch(running, heartbeat=0.01):
+        if running.state == "running":
+            break
+    return jobs, running, release
+
+
+def test_cancelled_queued_jobs_free_their_slot():
+    jobs, running, release = blocked_queue(max_pending=2)
+    try:
+        queued = [jobs.submit("owner", f"job {n}", lambda job: "ran") for n in range(2)]
+        with pytest.raises(JobLimitError):
+            jobs.submit("owner", "one too many", lambda job: "ran")
+        for job in queued:
+            job.cancel()
+        last = jobs.submit("owner", "after cancelling", lambda job: "ran")
+    finally:
+        release.set()
+    for _ in IngestionJobQueue.watch(last, heartbeat=0.01):
+        pass
+    assert last.state == "done" and last.result == "ran"
+    assert [job.state for job in queued] == ["cancelled", "cancelled"]
+    assert running.state == "done"
+
+
+def test_finished_and_cancelled_jobs_keep_their_state():
+    job = IngestionJob("owner", "work", lambda job: None)
+    job.cancel()
+    assert not job.start()
+    assert job.state == "cancelled"
+
+    job = IngestionJob("owner", "work", lambda job: None)
+    assert job.start()
+    assert job.finish("done", result=1)
+    job.cancel()
+    assert not job.finish("cancelled")
+    assert (job.state, job.result, job.cancelled) == ("done", 1, False)
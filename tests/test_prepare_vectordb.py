@@ -0,0 +1,66 @@
+"""
+    Incremental updates of PrepareVectorDB: the positions of the chunks in the saved docstore must
+    follow the vectors of the FAISS index as files are added, replaced and removed.
+"""
+import numpy as np
+import pytest
+
+from utils.docstore import VectorDBFiles
+from utils.embedding_providers import HashingEmbeddings
+from utils.prepare_vectordb import PrepareVectorDB
+
+ENGINE = "hashing-32"
+
+
+def write_table(path, name: str, num_rows: int):
+    path.mkdir(parents=True, exist_ok=True)
+    file_path = path / name
+    file_path.write_text("name,value\n" + "".join(f"{name} row {n},{n * n}\n" for n in range(num_rows)),
+                         encoding="utf-8")
+    return str(file_path)
+
+
+def prepare(persist_directory) -> PrepareVectorDB:
+    return PrepareVectorDB(data_directory=[], persist_directory=str(persist_directory), chunk_size=200,
+                           chunk_overlap=0, embedding_model_engine=ENGINE)
+
+
+def check_positions(persist_directory, expected_files):
+    embedding = HashingEmbeddings(dimension=32)
+    vectordb = VectorDBFiles.load(str(persist_directory), embedding)
+    assert vectordb.index.ntotal == len(vectordb.index_to_docstore_id)
+    sources = set()
+    for position in range(vectordb.index.ntotal):
+        doc_id = vectordb.index_to_docstore_id[position]
+        document = vectordb.docstore.search(doc_id)
+        assert doc_id.partition("#")[0] == document.metadata["source"]
+        vector = vectordb.index.reconstruct(position)
+        assert np.allclose(vector, embedding.embed_documents([document.page_content])[0], atol=1e-5)
+        sources.add(document.metadata["source"])
+    assert sources == set(expected_files)
+
+
+def test_added_and_removed_files_keep_the_docstore_in_step(tmp_path):
+    persist_directory = tmp_path / "index"
+    files = [write_table(tmp_path / "docs", name, num_rows) for name, num_rows in
+             (("a.csv", 30), ("b.csv", 5), ("c.csv", 40))]
+    prepare(persist_directory).add_documents(files)
+    check_positions(persist_directory, ["a.csv", "b.csv", "c.csv"])
+
+    prepare(persist_directory).remove_documents(["a.csv"])
+    check_positions(persist_directory, ["b.csv", "c.csv"])
+
+    changed = write_table(tmp_path / "docs", "b.csv", 12)
+    added = write_table(tmp_path / "docs", "d.csv", 7)
+    prepare(persist_directory).add_documents([changed, added])
+    check_positions(persist_directory, ["b.csv", "c.csv", "d.csv"])
+
+
+def test_different_files_with_the_same_name_are_rejected(tmp_path):
+    files = [write_table(tmp_path / "first", "a.csv", 3), write_table(tmp_path / "second", "a.csv", 4)]
+    with pytest.raises(ValueError, match="a.csv"):
+        prepare(tmp_path / "index").add_documents(files)
+    assert not VectorDBFiles.exists(str(tmp_path / "index"))
+    # The same file uploaded twice is only indexed once
+    prepare(tmp_path / "index").add_documents([files[0], write_table(tmp_path / "third", "a.csv", 3)])
+    check_positions(tmp_path / "index", ["a.csv"])
@@ -0,0 +1,69 @@
+"""
+    BM25 ranking of LexicalIndex, reciprocal-rank fusion and the keyword retrieval of ScoredRetriever.
+"""
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from utils.embedding_providers import HashingEmbeddings
+from utils.lexical_index import LexicalIndex
+from utils.retriever import ScoredRetriever, reciprocal_rank_fusion
+
+CHUNKS = {
+    "a": "np.linalg.norm returns the norm of a vector",
+    "b": "the norm of a matrix; np.linalg.norm norm norm",
+    "c": "gradio renders the chat interface",
+}
+
+
+def lexical_index() -> LexicalIndex:
+    index = LexicalIndex()
+    index.add(CHUNKS.keys(), CHUNKS.values())
+    return index
+
+
+def test_bm25_ranks_by_term_frequency():
+    results = lexical_index().search("norm", k=5)
+    assert [doc_id for doc_id, _ in results] == ["b", "a"]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_bm25_matches_identifier_parts_and_skips_removed_chunks():
+    index = lexical_index()
+    assert [doc_id for doc_id, _ in index.search("linalg", k=5)] == ["a", "b"]
+    index.remove(["a"])
+    assert [doc_id for doc_id, _ in index.search("np.linalg.norm", k=5)] == ["b"]
+    assert index.search("gradio", k=0) == []
+
+
+def test_bm25_survives_save_and_load(tmp_path):
+    index = lexical_index()
+    index.save(str(tmp_path))
+    assert LexicalIndex.load(str(tmp_path)).search("chat interface", k=5) == index.search("chat interface", k=5)
+    assert LexicalIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c"]], k=60)
+    assert [item for item, _ in fused] == ["b", "c", "a"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_is_keyword_query():
+    assert LexicalIndex.is_keyword_query("np.linalg.norm")
+    assert LexicalIndex.is_keyword_query("ValueError overlapping IDs")
+    assert not LexicalIndex.is_keyword_query("what is the norm")
+    assert not LexicalIndex.is_keyword_query("norm of a vector?")
+    assert not LexicalIndex.is_keyword_query("one two three four five")
+    assert not LexicalIndex.is_keyword_query("   ")
+
+
+def test_chunks_missing_from_the_docstore_are_skipped():
+    embedding = HashingEmbeddings(dimension=16)
+    vectordb = FAISS.from_texts(list(CHUNKS.values()), embedding, ids=list(CHUNKS))
+    vectordb.docstore = InMemoryDocstore({"b": Document(page_content=CHUNKS["b"])})
+    retriever = ScoredRetriever(vectorstore=vectordb, k=5, lexical_index=lexical_index())
+    documents = retriever.get_documents_by_keywords("norm")
+    assert [document.page_content for document in documents] == [CHUNKS["b"]]
+    assert documents[0].metadata["score"] > 0
@@ -0,0 +1,9 @@
+"""
+    Startup budget of the app: the import-time and lazy-import checks of benchmarks/bench_startup.py.
+"""
+from benchmarks import bench_startup
+
+
+def test_app_starts_within_budget():
+    results, failures = bench_startup.check(runs=3, budget=1.0)
+    assert not failures, f"{'; '.join(failures)} ({results})"
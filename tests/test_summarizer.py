@@ -0,0 +1,12 @@
+"""
+    Validation of the window settings of Summarizer.pack_windows.
+"""
+import pytest
+
+from utils.summarizer import Summarizer
+
+
+@pytest.mark.parametrize("budget, overlap", [(0, 0), (-10, 0), (100, 100), (100, 150), (100, -1)])
+def test_invalid_window_settings_are_rejected(budget, overlap):
+    with pytest.raises(ValueError):
+        Summarizer.pack_windows(["some text"], budget, overlap, "gpt-3.5-turbo")
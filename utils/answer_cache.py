@@ -0,0 +1,238 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.telemetry import Telemetry
+
+if TYPE_CHECKING:
+    import faiss
+
+
+class AnswerCache:
+    """
+    Cache of generated answers for repeated and near-duplicate questions.
+
+    Answers are stored per namespace, where a namespace identifies an index and its on-disk
+    version, so an answer is never served from an index that has changed since it was generated.
+    A lookup first tries an exact match on the normalized question text, which needs no embedding,
+    and then a semantic match: the cosine similarity between the question embedding and the cached
+    questions, searched in a small FAISS inner-product index per namespace, must reach
+    `similarity_threshold`. Entries are evicted least recently used first beyond `max_entries` and
+    expire after `ttl_seconds`.
+
+    Hits are counted by the lookups and misses by `count_miss`, once per question that no lookup
+    answered, however many lookups it went through. Both are also added to the enclosing Telemetry
+    span, as exact_hits, semantic_hits and misses.
+
+    Attributes:
+        similarity_threshold (float): The minimum cosine similarity of a semantic hit.
+        max_entries (int): The maximum number of cached answers.
+        ttl_seconds (float): The lifetime of a cached answer, in seconds.
+        exact_hits (int): The number of exact-match hits since start-up.
+        semantic_hits (int): The number of near-duplicate hits since start-up.
+        misses (int): The number of questions without a hit since start-up.
+    """
+    _PUNCTUATION = re.compile(r"[\s?!.]+$")
+    _WHITESPACE = re.compile(r"\s+")
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: float = 86400) -> None:
+        """
+        Initialize an empty AnswerCache.
+
+        Parameters:
+            similarity_threshold (float): The minimum cosine similarity of a semantic hit.
+            max_entries (int): The maximum number of cached answers.
+            ttl_seconds (float): The lifetime of a cached answer, in seconds.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # entry id -> (namespace, normalized question, answer, references, creation time)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._exact: Dict[Tuple[Hashable, str], int] = {}
+        self._indexes: "Dict[Hashable, faiss.IndexIDMap]" = {}
+        self._current: Dict[Hashable, Hashable] = {}
+
+    @classmethod
+    def normalize(cls, question: str) -> str:
+        """
+        Normalize a question for exact matching (case, whitespace and trailing punctuation).
+
+        Parameters:
+            question (str): The question.
+
+        Returns:
+            str: The normalized question.
+        """
+        return cls._WHITESPACE.sub(" ", cls._PUNCTUATION.sub("", question.strip().lower()))
+
+    @staticmethod
+    def __as_unit_vector(vector: List[float]) -> np.ndarray:
+        """
+        Convert an embedding to a normalized float32 row vector.
+
+        Parameters:
+            vector (List[float]): The embedding.
+
+        Returns:
+            np.ndarray: The (1, d) L2-normalized vector.
+        """
+        array = np.asarray([vector], dtype="float32")
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def __remove(self, entry_id: int) -> None:
+        """
+        Remove an entry. Expects the lock to be held.
+
+        Parameters:
+            entry_id (int): The identifier of the entry.
+        """
+        namespace, question, _, _, _ = self._entries.pop(entry_id)
+        self._exact.pop((namespace, question), None)
+        index = self._indexes.get(namespace)
+        if index is not None:
+            index.remove_ids(np.asarray([entry_id], dtype="int64"))
+            if index.ntotal == 0:
+                del self._indexes[namespace]
+
+    def __evict(self) -> None:
+        """
+        Drop expired entries and the least recently used ones beyond `max_entries`. Expects the lock to be held.
+        """
+        now = time.time()
+        for entry_id in [entry_id for entry_id, entry in self._entries.items()
+                         if now - entry[4] > self.ttl_seconds]:
+            self.__remove(entry_id)
+        while len(self._entries) > self.max_entries:
+            self.__remove(next(iter(self._entries)))
+
+    def lookup_exact(self, namespace: Hashable, question: str) -> Optional[Tuple[str, str]]:
+        """
+        Look up an answer by exact (normalized) question text.
+
+        Parameters:
+            namespace (Hashable): The index and version the answer must come from.
+            question (str): The question.
+
+        Returns:
+            Optional[Tuple[str, str]]: The cached (answer, references), if any.
+        """
+        with self._lock:
+            self.__evict()
+            entry_id = self._exact.get((namespace, self.normalize(question)))
+            if entry_id is None:
+                return None
+            self._entries.move_to_end(entry_id)
+            self.exact_hits += 1
+            _, _, answer, references, _ = self._entries[entry_id]
+        Telemetry.add(exact_hits=1)
+        return answer, references
+
+    def lookup_similar(self, namespace: Hashable, vector: List[float]) -> Optional[Tuple[str, str]]:
+        """
+        Look up the answer of the most similar cached question.
+
+        Parameters:
+            namespace (Hashable): The index and version the answer must come from.
+            vector (List[float]): The embedding of the question.
+
+        Returns:
+            Optional[Tuple[str, str]]: The cached (answer, references) if the most similar question
+            reaches the similarity threshold.
+        """
+        with self._lock:
+            # Expired answers must not be found by similarity either
+            self.__evict()
+            index = self._indexes.get(namespace)
+            if index is not None and index.ntotal:
+                scores, ids = index.search(self.__as_unit_vector(vector), 1)
+                entry_id = int(ids[0][0])
+                if entry_id in self._entries and scores[0][0] >= self.similarity_threshold:
+                    self._entries.move_to_end(entry_id)
+                    self.semantic_hits += 1
+                    _, _, answer, references, _ = self._entries[entry_id]
+                    Telemetry.add(semantic_hits=1)
+                    return answer, references
+            return None
+
+    def count_miss(self) -> None:
+        """
+        Count a question that none of the lookups answered.
+        """
+        with self._lock:
+            self.misses += 1
+        Telemetry.add(misses=1)
+
+    def put(self, namespace: Hashable, question: str, vector: Optional[List[float]], answer: str,
+            references: str) -> None:
+        """
+        Cache the answer to a question.
+
+        Parameters:
+            namespace (Hashable): The index and version the answer was generated from.
+            question (str): The question.
+            vector (Optional[List[float]]): The embedding of the question. Without it, the answer is
+                only found again by exact match.
+            answer (str): The generated answer.
+            references (str): The rendered references shown with the answer.
+        """
+        normalized = self.normalize(question)
+        unit_vector = self.__as_unit_vector(vector) if vector is not None else None
+        with self._lock:
+            if (namespace, normalized) in self._exact:
+                self.__remove(self._exact[(namespace, normalized)])
+            entry_id = self._next_id
+            self._next_id += 1
+            if unit_vector is not None:
+                index = self._indexes.get(namespace)
+                if index is None:
+                    # faiss is only imported once there is something to cache
+                    import faiss
+                    index = faiss.IndexIDMap(faiss.IndexFlatIP(unit_vector.shape[1]))
+                    self._indexes[namespace] = index
+                index.add_with_ids(unit_vector, np.asarray([entry_id], dtype="int64"))
+            self._entries[entry_id] = (namespace, normalized, answer, references, time.time())
+            self._exact[(namespace, normalized)] = entry_id
+            self.__evict()
+
+    def invalidate(self, keep_namespace: Hashable, index_key: Hashable) -> None:
+        """
+        Drop every answer generated from an older version of an index.
+
+        Namespaces are (index key, version) tuples; all namespaces of `index_key` other than
+        `keep_namespace` are removed.
+
+        Parameters:
+            keep_namespace (Hashable): The namespace of the current version of the index.
+            index_key (Hashable): The index whose stale answers are dropped.
+        """
+        with self._lock:
+            if self._current.get(index_key) == keep_namespace:
+                return
+            self._current[index_key] = keep_namespace
+            stale = [entry_id for entry_id, entry in self._entries.items()
+                     if entry[0] != keep_namespace and entry[0][0] == index_key]
+            for entry_id in stale:
+                self.__remove(entry_id)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the hit/miss counters of the cache.
+
+        Returns:
+            Dict[str, float]: The exact hits, semantic hits, misses, hit rate and number of entries.
+        """
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {"exact_hits": self.exact_hits, "semantic_hits": self.semantic_hits, "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0, "entries": len(self._entries)}
@@ -0,0 +1,352 @@
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from utils.embedding_providers import create_embedding, provider_for
+from utils.embedding_scheduler import is_retryable
+
+
+class APIRequestError(RuntimeError):
+    """
+    Raised when a request to a model provider fails for good: the error is not retryable, or the
+    retries are exhausted. The original error is chained as its cause.
+
+    Attributes:
+        key (str): The provider and model the request was sent to, e.g. "groq:Gemma-7b-it".
+    """
+
+    def __init__(self, key: str, message: str) -> None:
+        super().__init__(f"{key}: {message}")
+        self.key = key
+
+
+class CircuitOpenError(APIRequestError):
+    """
+    Raised without sending the request when the circuit of a provider is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one provider and model.
+
+    After `failure_threshold` consecutive retryable failures (timeouts, connection errors, HTTP 429
+    and 5xx), the circuit opens and requests fail immediately with CircuitOpenError instead of
+    piling up on a provider that is down. After `reset_timeout` seconds a single trial request is
+    let through ("half-open"): its success closes the circuit, its failure opens it again.
+
+    Attributes:
+        key (str): The provider and model.
+        failure_threshold (int): The number of consecutive failures that opens the circuit.
+        reset_timeout (float): The time the circuit stays open before a trial request, in seconds.
+    """
+
+    def __init__(self, key: str, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.key = key
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        Returns:
+            str: "closed", "open" or "half_open".
+        """
+        if self._opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self._opened_at < self.reset_timeout else "half_open"
+
+    def before_request(self) -> None:
+        """
+        Let a request through, or refuse it.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial request already in flight.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(self.key, f"the provider failed {self._failures} times in a row; "
+                                                 f"requests are paused for {remaining:.0f}s.")
+            # Half-open: this request is the trial; the others wait for its outcome.
+            self._opened_at = time.monotonic()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ClientFactory:
+    """
+    Process-wide, long-lived clients of the model providers, and resilient calls to them.
+
+    Every client is created once per provider and model and then reused, so requests go over
+    pooled keep-alive connections instead of paying for connection setup and a TLS handshake on
+    every call:
+        - Groq chat models share one httpx connection pool,
+        - Voyage embedding models share one requests session,
+        - the summarizer shares one g4f client.
+    The base URL of Groq and Voyage can be overridden (see `configure`), e.g. to run against a
+    local mock server.
+
+    `call` and `stream` send a request through the circuit breaker of its provider and model, with
+    a timeout and bounded retries with exponential backoff and full jitter. Failures are raised as
+    APIRequestError (or CircuitOpenError), which callers handle; nothing exits the process.
+    """
+    _lock = threading.Lock()
+    _clients: Dict[str, Any] = {}
+    _breakers: Dict[str, CircuitBreaker] = {}
+    _settings: Dict[str, Any] = {"timeout": 60.0, "max_retries": 3, "backoff_base": 0.5, "backoff_max": 8.0,
+                                 "failure_threshold": 5, "reset_timeout": 30.0, "max_connections": 32,
+                                 "groq_base_url": None, "voyage_base_url": None}
+
+    @classmethod
+    def configure(cls, **settings) -> None:
+        """
+        Set the client settings. Clients already created keep theirs; breakers are reset.
+
+        Parameters:
+            timeout (float): The timeout of a request, in seconds.
+            max_retries (int): The number of retries of a failed request.
+            backoff_base (float): The base delay of the retry backoff, in seconds.
+            backoff_max (float): The maximum delay between two attempts, in seconds.
+            failure_threshold (int): The number of consecutive failures that opens a circuit.
+            reset_timeout (float): The time a circuit stays open before a trial request, in seconds.
+            max_connections (int): The maximum number of pooled connections per provider.
+            groq_base_url (str, optional): The base URL of the Groq API, if not the default.
+            voyage_base_url (str, optional): The base URL of the Voyage API, if not the default.
+        """
+        unknown = set(settings) - set(cls._settings)
+        if unknown:
+            raise ValueError(f"Unknown client settings: {', '.join(sorted(unknown))}.")
+        with cls._lock:
+            cls._settings = {**cls._settings, **settings}
+            cls._breakers.clear()
+
+    @classmethod
+    def __get_or_create(cls, key: str, create: Callable[[], Any]) -> Any:
+        """
+        Return the client stored under a key, creating it on first use.
+        """
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = create()
+            return cls._clients[key]
+
+    @classmethod
+    def chat_model(cls, model: str):
+        """
+        Return the shared Groq chat model client of a model.
+
+        Parameters:
+            model (str): The model name, e.g. "Gemma-7b-it".
+
+        Returns:
+            ChatGroq: The client. Its own retries are disabled; use `call` and `stream`.
+        """
+        def create():
+            import httpx
+            from langchain_groq import ChatGroq
+            load_dotenv()
+            settings = cls._settings
+            http_client = cls.__get_or_create("groq:http", lambda: httpx.Client(
+                timeout=settings["timeout"],
+                limits=httpx.Limits(max_connections=settings["max_connections"],
+                                    max_keepalive_connections=settings["max_connections"])))
+            return ChatGroq(groq_api_key=os.getenv("GROQ_API_KEY"), model_name=model,
+                            groq_api_base=settings["groq_base_url"], http_client=http_client,
+                            request_timeout=settings["timeout"], max_retries=0)
+        return cls.__get_or_create(f"groq:{model}", create)
+
+    @classmethod
+    def embedding(cls, engine: str) -> Embeddings:
+        """
+        Return the shared embedding model of an engine.
+
+        Parameters:
+            engine (str): The engine name (see utils/embedding_providers.py).
+
+        Returns:
+            Embeddings: The embedding model.
+        """
+        def create():
+            embedding = create_embedding(engine)
+            if provider_for(engine) == "voyage":
+                cls.__configure_voyage(embedding)
+            return embedding
+        return cls.__get_or_create(f"embedding:{engine}", create)
+
+    @classmethod
+    def __configure_voyage(cls, embedding: Embeddings) -> None:
+        """
+        Route the Voyage client through a shared, pooled session, with the configured timeout and base URL.
+        """
+        import requests
+        import voyageai
+        settings = cls._settings
+
+        def create_session():
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=settings["max_connections"])
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            return session
+        voyageai.requestssession = cls.__get_or_create("voyage:http", create_session)
+        if settings["voyage_base_url"]:
+            voyageai.api_base = settings["voyage_base_url"]
+        # langchain_voyageai does not expose the request timeout of the client it creates.
+        client = getattr(embedding, "_client", None)
+        if client is not None and isinstance(getattr(client, "_params", None), dict):
+            client._params["request_timeout"] = settings["timeout"]
+
+    @classmethod
+    def completion_client(cls, provider: str = "g4f"):
+        """
+        Return the shared OpenAI-style completion client of a provider.
+
+        Parameters:
+            provider (str): The provider; only "g4f" is supported.
+
+        Returns:
+            g4f.client.Client: The client.
+        """
+        if provider != "g4f":
+            raise ValueError(f"Unknown completion provider: {provider}.")
+
+        def create():
+            from g4f.client import Client
+            if sys.platform == "win32":
+                # The g4f providers need the selector event loop on Windows.
+                asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+            return Client()
+        return cls.__get_or_create(provider, create)
+
+    @classmethod
+    def breaker(cls, key: str) -> CircuitBreaker:
+        """
+        Return the circuit breaker of a provider and model.
+
+        Parameters:
+            key (str): The provider and model, e.g. "groq:Gemma-7b-it".
+
+        Returns:
+            CircuitBreaker: The breaker.
+        """
+        with cls._lock:
+            if key not in cls._breakers:
+                cls._breakers[key] = CircuitBreaker(key, cls._settings["failure_threshold"],
+                                                    cls._settings["reset_timeout"])
+            return cls._breakers[key]
+
+    @classmethod
+    def timeout(cls) -> float:
+        return cls._settings["timeout"]
+
+    @classmethod
+    def __retry_or_raise(cls, key: str, breaker: CircuitBreaker, error: Exception, attempt: int) -> None:
+        """
+        Record a failed attempt and wait before the next one, or raise if there is none.
+
+        Raises:
+            APIRequestError: If the error is not retryable or the retries are exhausted.
+        """
+        if not is_retryable(error):
+            # The provider answered (e.g. HTTP 400), so it is up: close the circuit, which also ends
+            # a half-open trial instead of leaving the circuit open for another reset_timeout
+            breaker.record_success()
+            raise APIRequestError(key, str(error)) from error
+        breaker.record_failure()
+        if attempt >= cls._settings["max_retries"]:
+            raise APIRequestError(key, f"failed after {attempt + 1} attempts: {error}") from error
+        delay = random.uniform(0, min(cls._settings["backoff_max"], cls._settings["backoff_base"] * 2 ** attempt))
+        print(f"Request to {key} failed ({error}); retry {attempt + 1}/{cls._settings['max_retries']} "
+              f"in {delay:.1f}s.")
+        time.sleep(delay)
+
+    @classmethod
+    def call(cls, key: str, function: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Send a request through the circuit breaker of a provider, retrying retryable failures.
+
+        Parameters:
+            key (str): The provider and model, e.g. "groq:Gemma-7b-it".
+            function (Callable): The request, e.g. `llm.invoke`.
+            *args, **kwargs: The arguments of the request.
+
+        Returns:
+            The result of the request.
+
+        Raises:
+            APIRequestError: If the request failed for good.
+            CircuitOpenError: If the circuit of the provider is open.
+        """
+        breaker = cls.breaker(key)
+        attempt = 0
+        while True:
+            breaker.before_request()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                cls.__retry_or_raise(key, breaker, e, attempt)
+                attempt += 1
+            else:
+                breaker.record_success()
+                return result
+
+    @classmethod
+    def stream(cls, key: str, function: Callable[..., Iterator], *args, **kwargs) -> Iterator:
+        """
+        Stream a response through the circuit breaker of a provider.
+
+        Failures before the first chunk are retried like in `call`; once chunks were received,
+        a failure is raised immediately, since the caller already used part of the response.
+
+        Parameters:
+            key (str): The provider and model.
+            function (Callable): The streaming request, e.g. `llm.stream`.
+            *args, **kwargs: The arguments of the request.
+
+        Yields:
+            The chunks of the response.
+
+        Raises:
+            APIRequestError: If the request failed for good.
+            CircuitOpenError: If the circuit of the provider is open.
+        """
+        breaker = cls.breaker(key)
+        attempt = 0
+        while True:
+            breaker.before_request()
+            started = False
+            try:
+                for chunk in function(*args, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if started:
+                    breaker.record_failure()
+                    raise APIRequestError(key, f"the response was interrupted: {e}") from e
+                cls.__retry_or_raise(key, breaker, e, attempt)
+                attempt += 1
+            else:
+                breaker.record_success()
+                return
@@ -1,21 +1,55 @@
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
-# from langchain_google_genai import GoogleGenerativeAIEmbeddings
 # from langchain_community.llms import HuggingFaceEndpoint
-from langchain_voyageai import VoyageAIEmbeddings
-
-from langchain_community.vectorstores import FAISS
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
 #from utils.load_config import LoadConfig
-from utils.load_config import LoadConfig
-from utils.clean_refer import *
-import os
+from utils.load_config import get_config
+from utils.lexical_index import LexicalIndex
+from utils.session_memory import SessionMemoryStore
+from utils.answer_cache import AnswerCache
+from utils.upload_sessions import UploadSessionStore, get_upload_sessions
+from utils.embedding_providers import EmbeddingMismatchError
+from utils.api_clients import APIRequestError, ClientFactory
+from utils.clean_refer import clean_references1, format_references
+from utils.telemetry import Telemetry
+from typing import TYPE_CHECKING, Iterator, List, Tuple
 import time
-import re
-from dotenv import load_dotenv
+import gradio as gr
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models import BaseChatModel
+    from utils.index_registry import ResidentIndex
+
+APPCFG = get_config()
+LLM_MODEL = "Gemma-7b-it"
+SESSION_MEMORY = SessionMemoryStore(number_of_q_a_pairs=APPCFG.number_of_q_a_pairs,
+                                    max_tokens=APPCFG.max_history_tokens,
+                                    max_sessions=APPCFG.max_sessions,
+                                    ttl_seconds=APPCFG.session_ttl)
+ANSWER_CACHE = AnswerCache(similarity_threshold=APPCFG.answer_cache_similarity_threshold,
+                           max_entries=APPCFG.answer_cache_max_entries,
+                           ttl_seconds=APPCFG.answer_cache_ttl)
+UPLOAD_SESSIONS = get_upload_sessions()
+
+
+def get_embedding() -> "Embeddings":
+    """
+    Return the process-wide query embedding model of the configured engine (see ClientFactory).
+
+    Returns:
+        Embeddings: The shared embedding model.
+    """
+    return ClientFactory.embedding(APPCFG.embedding_model_engine)
+
+
+def get_llm() -> "BaseChatModel":
+    """
+    Return the process-wide chat model client (see ClientFactory).
+
+    Returns:
+        BaseChatModel: The shared chat model client (a ChatGroq).
+    """
+    return ClientFactory.chat_model(LLM_MODEL)
+
 
-APPCFG = LoadConfig()
 class ChatBot:
     """
     Class representing a chatbot with document retrieval and response generation capabilities.
@@ -24,86 +58,264 @@ class ChatBot:
     cleaning references from retrieved documents.
     """
     @staticmethod
-    def respond(chatbot: list, message: str, data_type: str = "Preprocessed doc", temperature: float = 0.0) -> tuple:
+    def respond(chatbot: list, message: str, data_type: str = "Preprocessed doc", temperature: float = 0.0,
+                request: gr.Request = None) -> Iterator[tuple]:
         """
         Generate a response to a user query using document retrieval and language model completion.
 
+        This is a generator: the references are yielded as soon as retrieval finishes, and the
+        answer is then yielded again every time new tokens arrive from the language model, so the
+        UI can render it while it is being generated.
+
+        Every request is traced (see Telemetry): the "condense", "embed_query", "retrieve",
+        "references", "generate_first_token" and "generate" stages and the whole "respond" share
+        one trace ID.
+
+        Requests to the model providers go through ClientFactory, with a timeout, retries and a
+        circuit breaker; if they fail for good, the error is shown in the chat.
+
         Parameters:
             chatbot (List): List representing the chatbot's conversation history.
             message (str): The user's query.
             data_type (str): Type of data used for document retrieval ("Preprocessed doc" or "Upload doc: Process for RAG").
             temperature (float): Temperature parameter for language model completion.
+            request (gr.Request): The Gradio request, injected by Gradio; identifies the session whose
+                conversation memory and uploaded documents are used.
 
-        Returns:
+        Yields:
             Tuple: A tuple containing an empty string, the updated chat history, and references from retrieved documents.
         """
-        load_dotenv()
-        voyage_api_key = os.getenv("VOYAGE_API_KEY")
-        embedding = VoyageAIEmbeddings(voyage_api_key=voyage_api_key, model="voyage-large-2-instruct")
-        # embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        if data_type == "Preprocessed doc":
-            # directories
-            if os.path.exists(APPCFG.persist_directory):
-                vectordb = FAISS.load_local(APPCFG.persist_directory,embedding,allow_dangerous_deserialization=True)
-        
+        # langchain and FAISS are imported on the first question, not at startup
+        from utils.index_registry import IndexLoadError, IndexRegistry
+
+        trace_id = Telemetry.new_trace_id()
+        start = time.perf_counter()
+        embedding = get_embedding()
+        try:
+            if data_type == "Preprocessed doc":
+                # directories
+                index_directory = APPCFG.persist_directory
+                index = IndexRegistry.get(index_directory, embedding)
+                if index is None:
+                    from utils.docstore import VectorDBFiles
+                    if VectorDBFiles.is_legacy(index_directory):
+                        chatbot.append(
+                            (message, "The VectorDB was saved by an earlier version in a format that is no longer loaded. Please execute the 'upload_data_manually.py' module again to rebuild it."))
+                    else:
+                        chatbot.append(
+                            (message, "VectorDB does not exist. Please first execute the 'upload_data_manually.py' module."))
+                    yield "", chatbot, None
+                    return
+
+            elif data_type == "Upload doc: Process for RAG":
+                # Every session has its own index of uploaded documents
+                owner = UploadSessionStore.owner_of(request)
+                index_directory = UPLOAD_SESSIONS.directory_for(owner)
+                index = IndexRegistry.get(index_directory, embedding)
+                if index is None:
+                    chatbot.append(
+                        (message, f"No file was uploaded. Please first upload your files using the 'upload' button."))
+                    yield "", chatbot, None
+                    return
+                UPLOAD_SESSIONS.touch(owner)
+
             else:
                 chatbot.append(
-                    (message, f"VectorDB does not exist. Please first execute the 'upload_data_manually.py' module. For further information please visit {hyperlink}."))
-                return "", chatbot, None
+                    (message, "Please select 'Preprocessed doc' or 'Upload doc: Process for RAG' in the 'RAG with' dropdown to chat with your documents."))
+                yield "", chatbot, None
+                return
+        except IndexLoadError as e:
+            print(f"Error loading the index: {e}")
+            chatbot.append((message, "The VectorDB could not be loaded. Please try again in a moment."))
+            yield "", chatbot, None
+            return
+
+        # Vectors of another embedding model cannot be compared with the query vector
+        try:
+            index.check_embedding(APPCFG.embedding_model_engine, getattr(embedding, "dimension", None))
+        except EmbeddingMismatchError as e:
+            chatbot.append((message, str(e)))
+            yield "", chatbot, None
+            return
 
-        elif data_type == "Upload doc: Process for RAG":
-            if os.path.exists(APPCFG.custom_persist_directory):
-                vectordb = FAISS.load_local(APPCFG.custom_persist_directory,embedding,allow_dangerous_deserialization=True)
-        
+        llm = get_llm()
+        session_id = ChatBot.session_id(request)
+        chat_history = SESSION_MEMORY.get_history(session_id)
+        turns = len(chatbot)
+        try:
+            yield from ChatBot.__answer(chatbot, message, temperature, trace_id, start, embedding, index,
+                                        index_directory, llm, session_id, chat_history)
+        except APIRequestError as e:
+            print(f"Error answering the question: {e}")
+            answer = "The model provider is not available right now. Please try again in a moment."
+            if len(chatbot) > turns:
+                # Part of the answer was already shown
+                chatbot[-1] = (message, (chatbot[-1][1] + "\n\n" if chatbot[-1][1] else "") + answer)
             else:
-                chatbot.append(
-                    (message, f"No file was uploaded. Please first upload your files using the 'upload' button."))
-                return "", chatbot, None
+                chatbot.append((message, answer))
+            yield "", chatbot, None
 
+    @staticmethod
+    def __answer(chatbot: list, message: str, temperature: float, trace_id: str, start: float,
+                 embedding: "Embeddings", index: "ResidentIndex", index_directory: str, llm, session_id: str,
+                 chat_history: List[Tuple[str, str]]) -> Iterator[tuple]:
+        """
+        Retrieve the documents and stream the answer; the second half of `respond`.
 
+        Everything is read from `index`, the index as it was when the request started: a save or an
+        eviction during the request does not change what it answers from.
 
-        load_dotenv()
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        llm = ChatGroq(groq_api_key= groq_api_key, model_name= "Gemma-7b-it")
+        Raises:
+            APIRequestError: If a request to a model provider failed for good.
+        """
+        from langchain.chains.question_answering.stuff_prompt import CHAT_PROMPT as QA_PROMPT
+        from utils.retriever import ScoredRetriever
 
-        # Create a conversation buffer memory
-        memory = ConversationBufferMemory(memory_key='chat_history', return_messages=True)
+        # Answers generated at temperature 0 are reused for repeated and near-duplicate questions,
+        # as long as the index they were generated from has not changed. A message that repeats a
+        # cached question is answered before it is condensed or embedded.
+        use_cache = APPCFG.answer_cache_enabled and temperature == 0
+        namespace = (index_directory, index.version)
+        cached = None
+        if use_cache:
+            ANSWER_CACHE.invalidate(namespace, index_directory)
+            with Telemetry.span("answer_cache", trace_id=trace_id):
+                cached = ANSWER_CACHE.lookup_exact(namespace, message)
 
-        # Define a custom template for the question prompt
-        custom_template = APPCFG.llm_system_role
-
-        # Create a PromptTemplate from the custom template
-        CUSTOM_QUESTION_PROMPT = PromptTemplate.from_template(custom_template)
-
-        # Create a ConversationalRetrievalChain from an LLM with the specified components
-        conversational_chain = ConversationalRetrievalChain.from_llm(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vectordb.as_retriever(),
-            memory=memory,
-            condense_question_prompt=CUSTOM_QUESTION_PROMPT
-        )
-        response = conversational_chain({"question":message})
-        # print(response)
-        # Ensure the response is a string
-        answer = response['answer']
-        if isinstance(answer, list):
-            answer = ' '.join(answer)
-
-        chatbot.append(
-             (message, answer))
-        time.sleep(2)
-        retrieved_content = vectordb.similarity_search(message, k=APPCFG.k)
+        lexical_index = index.lexical_index if APPCFG.hybrid_search else None
+        retriever = ScoredRetriever(vectorstore=index.vectordb, k=APPCFG.k, lexical_index=lexical_index,
+                                    candidates=APPCFG.hybrid_candidates, rrf_k=APPCFG.rrf_k)
+        # Keyword lookups are recognized on the message as typed: they stand on their own, so they
+        # are neither condensed nor embedded
+        keyword_query = retriever.lexical_index is not None and APPCFG.lexical_fast_path \
+            and LexicalIndex.is_keyword_query(message, APPCFG.keyword_max_terms)
+
+        # Rephrase follow-up questions into standalone questions before retrieval
+        question = message
+        if cached is None and chat_history and not keyword_query:
+            with Telemetry.span("condense", trace_id=trace_id, turns=len(chat_history)):
+                question = ChatBot.condense_question(llm, chat_history, message)
+            if use_cache and question != message:
+                with Telemetry.span("answer_cache", trace_id=trace_id):
+                    cached = ANSWER_CACHE.lookup_exact(namespace, question)
+        retrieved_content = None
+        if cached is None and keyword_query:
+            # Served by the inverted index alone, skipping the embedding call
+            with Telemetry.span("retrieve", trace_id=trace_id, keyword_queries=1) as span:
+                retrieved_content = retriever.get_documents_by_keywords(question) or None
+                span.add(documents=len(retrieved_content or []))
+        query_vector = None
+        if cached is None and retrieved_content is None:
+            # Embed the question once, for both the cache lookup and the index search
+            with Telemetry.span("embed_query", trace_id=trace_id):
+                query_vector = ClientFactory.call(f"embedding:{APPCFG.embedding_model_engine}",
+                                                  embedding.embed_query, question)
+            if use_cache:
+                with Telemetry.span("answer_cache", trace_id=trace_id):
+                    cached = ANSWER_CACHE.lookup_similar(namespace, query_vector)
+        if use_cache and cached is None:
+            # One miss per question, whether it went through the exact lookups only or the semantic one too
+            with Telemetry.span("answer_cache", trace_id=trace_id):
+                ANSWER_CACHE.count_miss()
+        if cached is not None:
+            answer, clean_reference_str = cached
+            chatbot.append((message, answer))
+            SESSION_MEMORY.add(session_id, message, answer)
+            Telemetry.record("respond", time.perf_counter() - start, trace_id)
+            yield "", chatbot, clean_reference_str
+            return
+
+        # Retrieve once; the same hits feed the answer and the References panel
+        if retrieved_content is None:
+            with Telemetry.span("retrieve", trace_id=trace_id) as span:
+                retrieved_content = retriever.get_documents(question, query_vector)
+                span.add(documents=len(retrieved_content))
         # print(retrieved_content)
-        clean_reference_str = clean_references1(retrieved_content)
-        
-        # retrieved_content = ChatBot.clean_references(docs)
-        return "", chatbot, clean_reference_str
+        with Telemetry.span("references", trace_id=trace_id, documents=len(retrieved_content)) as span:
+            clean_reference_str = clean_references1(retrieved_content)
+            span.add(characters=len(clean_reference_str))
+        chatbot.append((message, ""))
+        yield "", chatbot, clean_reference_str
+
+        # Stream the answer token by token
+        prompt = QA_PROMPT.format_messages(
+            context="\n\n".join(doc.page_content for doc in retrieved_content),
+            question=question
+        )
+        # Timed by hand: a span cannot stay open across the yields (see Telemetry). The time the UI
+        # takes to consume every update is included.
+        answer = ""
+        num_chunks = 0
+        generate_start = time.perf_counter()
+        for chunk in ClientFactory.stream(f"groq:{LLM_MODEL}", llm.stream, prompt, temperature=temperature):
+            if not num_chunks:
+                Telemetry.record("generate_first_token", time.perf_counter() - generate_start, trace_id)
+            num_chunks += 1
+            answer += chunk.content
+            chatbot[-1] = (message, answer)
+            yield "", chatbot, clean_reference_str
+        # Streamed chunks are about one token each.
+        Telemetry.record("generate", time.perf_counter() - generate_start, trace_id,
+                         tokens=num_chunks, characters=len(answer))
+        SESSION_MEMORY.add(session_id, message, answer)
+        if use_cache:
+            ANSWER_CACHE.put(namespace, question, query_vector, answer, clean_reference_str)
+        Telemetry.record("respond", time.perf_counter() - start, trace_id)
+
+    @staticmethod
+    def session_id(request: gr.Request = None) -> str:
+        """
+        Identify the session of a Gradio request.
+
+        Parameters:
+            request (gr.Request): The Gradio request.
+
+        Returns:
+            str: The session hash of the request, or "default" outside of a Gradio session.
+        """
+        return getattr(request, "session_hash", None) or "default"
+
+    @staticmethod
+    def clear_memory(request: gr.Request = None) -> None:
+        """
+        Forget the conversation memory of the session, e.g. when the chat is cleared.
+
+        Parameters:
+            request (gr.Request): The Gradio request, injected by Gradio.
+        """
+        SESSION_MEMORY.clear(ChatBot.session_id(request))
+
+    @staticmethod
+    def condense_question(llm, chat_history: List[Tuple[str, str]], message: str) -> str:
+        """
+        Rephrase a follow-up question into a standalone question using the chat history.
+
+        Parameters:
+            llm: The chat model used to rephrase the question.
+            chat_history (List[Tuple[str, str]]): The previous (question, answer) pairs of the conversation.
+            message (str): The user's follow-up question.
+
+        Returns:
+            str: The standalone question, or the message itself if there is no chat history.
+
+        Raises:
+            APIRequestError: If the request to the chat model failed for good.
+        """
+        if not chat_history:
+            return message
+        from langchain.prompts import PromptTemplate
+
+        # Define a custom template for the question prompt
+        CUSTOM_QUESTION_PROMPT = PromptTemplate.from_template(APPCFG.llm_system_role)
+        history = "".join(f"\nHuman: {question}\nAssistant: {answer}" for question, answer in chat_history)
+        response = ClientFactory.call(f"groq:{LLM_MODEL}", llm.invoke,
+                                     CUSTOM_QUESTION_PROMPT.format(chat_history=history, question=message))
+        return response.content
 
     @staticmethod
     def clean_references(documents: list) -> str:
         """
-        Clean and format references from retrieved documents.
+        Clean and format references from retrieved documents, with links to the source files.
 
         Parameters:
             documents (List): List of retrieved documents.
@@ -111,52 +323,6 @@ class ChatBot:
         Returns:
             str: A string containing cleaned and formatted references.
         """
-        server_url = "http://localhost:8000"
-        documents = [str(x)+"\n\n" for x in documents]
-        markdown_documents = ""
-        counter = 1
-        for doc in documents:
-            # Extract content and metadata
-            content, metadata = re.match(
-                r"page_content=(.*?)( metadata=\{.*\})", doc).groups()
-            metadata = metadata.split('=', 1)[1]
-            metadata_dict = ast.literal_eval(metadata)
-
-            # Decode newlines and other escape sequences
-            content = bytes(content, "utf-8").decode("unicode_escape")
-
-            # Replace escaped newlines with actual newlines
-            content = re.sub(r'\\n', '\n', content)
-            # Remove special tokens
-            content = re.sub(r'\s*<EOS>\s*<pad>\s*', ' ', content)
-            # Remove any remaining multiple spaces
-            content = re.sub(r'\s+', ' ', content).strip()
-
-            # Decode HTML entities
-            content = html.unescape(content)
-
-            # Replace incorrect unicode characters with correct ones
-            content = content.encode('latin1').decode('utf-8', 'ignore')
-
-            # Remove or replace special characters and mathematical symbols
-            # This step may need to be customized based on the specific symbols in your documents
-            content = re.sub(r'â', '-', content)
-            content = re.sub(r'â', '∈', content)
-            content = re.sub(r'Ã', '×', content)
-            content = re.sub(r'ï¬', 'fi', content)
-            content = re.sub(r'â', '∈', content)
-            content = re.sub(r'Â·', '·', content)
-            content = re.sub(r'ï¬', 'fl', content)
-
-            pdf_url = f"{server_url}/{os.path.basename(metadata_dict['source'])}"
-
-            # Append cleaned content to the markdown string with two newlines between documents
-            markdown_documents += f"# Retrieved content {counter}:\n" + content + "\n\n" + \
-                f"Source: {os.path.basename(metadata_dict['source'])}" + " | " +\
-                f"Page number: {str(metadata_dict['page'])}" + " | " +\
-                f"[View PDF]({pdf_url})" "\n\n"
-            counter += 1
-
-        return markdown_documents
+        return format_references(documents, server_url="http://localhost:8000")
 
 # response = ChatBot.respond([],'What is node js',"Upload doc: Process for RAG",0.0)
\ No newline at end of file
@@ -0,0 +1,119 @@
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+
+class DocumentChunker:
+    """
+    Streaming chunker that keeps track of where every chunk comes from.
+
+    Pages are consumed lazily, one at a time, and each page is split on its own, so no more than a
+    page of text is held in memory on top of the chunks being emitted. Every chunk is yielded as a
+    Document whose metadata records the source file, the page number and the character offsets of
+    the chunk within that page.
+
+    Spreadsheet rows are chunked by `chunk_table` instead: rows are never split, and every chunk
+    starts with the header of its sheet so each one can be understood on its own.
+
+    Attributes:
+        chunk_size (int): The maximum size of a chunk, in characters.
+        chunk_overlap (int): The overlap between consecutive chunks of a page, in characters.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int) -> None:
+        """
+        Initialize the DocumentChunker.
+
+        Parameters:
+            chunk_size (int): The maximum size of a chunk, in characters.
+            chunk_overlap (int): The overlap between consecutive chunks of a page, in characters.
+        """
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len
+        )
+
+    def chunk_page(self, source: str, page: int, text: str) -> Iterator[Document]:
+        """
+        Split a single page into chunks.
+
+        Parameters:
+            source (str): The name of the file the page belongs to.
+            page (int): The page number (1-based).
+            text (str): The text of the page.
+
+        Yields:
+            Document: The chunks of the page, with source, page and offset metadata.
+        """
+        search_from = 0
+        for chunk in self.text_splitter.split_text(text):
+            start = text.find(chunk, search_from)
+            if start == -1:
+                # The splitter strips whitespace, so the chunk is always found; stay safe anyway.
+                start = search_from
+            end = start + len(chunk)
+            yield Document(
+                page_content=chunk,
+                metadata={"source": source, "page": page, "start_index": start, "end_index": end}
+            )
+            search_from = max(start + 1, end - self.chunk_overlap)
+
+    def chunk_pages(self, source: str, pages: Iterable[Tuple[int, str]]) -> Iterator[Document]:
+        """
+        Split the pages of a document into chunks.
+
+        Parameters:
+            source (str): The name of the file the pages belong to.
+            pages (Iterable[Tuple[int, str]]): (page number, text) pairs, consumed lazily.
+
+        Yields:
+            Document: The chunks of all pages, in page order.
+        """
+        for page, text in pages:
+            if text and not text.isspace():
+                yield from self.chunk_page(source, page, text)
+
+    def chunk_table(self, source: str, rows: Iterable[Tuple[Optional[str], str, int, str]]) -> Iterator[Document]:
+        """
+        Group spreadsheet rows into chunks that repeat the header row.
+
+        Consecutive rows of a sheet are added to a chunk as long as it stays within `chunk_size`
+        characters, header included; a row longer than that makes a chunk of its own. Rows are
+        consumed lazily, so only the rows of the current chunk are held in memory.
+
+        Parameters:
+            source (str): The name of the file the rows belong to.
+            rows (Iterable[Tuple[Optional[str], str, int, str]]): (sheet name, header, row number,
+                row text) tuples, as yielded by `DocumentClassifier.iter_table_rows`.
+
+        Yields:
+            Document: The row groups, with source, sheet and row range metadata.
+        """
+        group: List[str] = []
+        group_sheet, group_header, first_row, last_row, size = None, "", 0, 0, 0
+        for sheet, header, row_number, row_text in rows:
+            if group and (sheet != group_sheet or size + len(row_text) + 1 > self.chunk_size):
+                yield self.__row_group(source, group_sheet, group_header, group, first_row, last_row)
+                group = []
+            if not group:
+                group_sheet, group_header, first_row, size = sheet, header, row_number, len(header)
+            group.append(row_text)
+            last_row = row_number
+            size += len(row_text) + 1
+        if group:
+            yield self.__row_group(source, group_sheet, group_header, group, first_row, last_row)
+
+    @staticmethod
+    def __row_group(source: str, sheet: Optional[str], header: str, rows: List[str],
+                    first_row: int, last_row: int) -> Document:
+        """
+        Build the chunk of a group of rows.
+        """
+        metadata = {"source": source, "row_start": first_row, "row_end": last_row}
+        if sheet is not None:
+            metadata["sheet"] = sheet
+        return Document(page_content="\n".join([header, *rows]), metadata=metadata)
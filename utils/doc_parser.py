@@ -1,52 +1,105 @@
 import os
-from PyPDF2 import PdfReader
-from docx import Document
-from openpyxl import load_workbook
-import pandas as pd
 import html
+from typing import Iterator, List, Optional, Tuple
+
+from utils.extraction_cache import ExtractionCache
 
 class DocumentClassifier:
     """
     A class to classify and extract content from various document types.
     
-    This class supports PDF, DOCX, XLSX, and CSV file formats.
+    This class supports PDF, DOCX, XLSX, and CSV file formats. The parser of a format (PyPDF2,
+    python-docx, openpyxl, pandas) is only imported when a document of that format is read.
+    
+    Spreadsheets can also be streamed row by row with `iter_table_rows` (see `TABLE_EXTENSIONS`), so
+    their size does not bound the memory used to ingest them.
     
     Attributes:
         document (str): The path to the document to be processed.
+        extraction_cache (ExtractionCache, optional): Cache consulted by `process_file` before parsing.
     """
+    TABLE_EXTENSIONS = (".csv", ".xlsx")
+    CSV_BLOCK_ROWS = 10000
     
-    def __init__(self, document: str) -> None:
+    def __init__(self, document: str, extraction_cache: Optional[ExtractionCache] = None) -> None:
         """
         Initialize the DocumentClassifier with the path to the document.
         
         Parameters:
             document (str): The path to the document.
+            extraction_cache (ExtractionCache, optional): Cache of previously extracted documents, 
+                consulted by `process_file` before parsing.
         """
         self.document = document
+        self.extraction_cache = extraction_cache
 
-    def pdf_get_content(self) -> str:
+    def pdf_num_pages(self) -> int:
         """
-        Extract text from a PDF document.
-        
-        This method uses the PyPDF2 library to read the text content from each page of the PDF.
+        Count the pages of a PDF document.
         
         Returns:
-            str: The extracted text content as a single string, with each page separated by two newlines.
+            int: The number of pages, or 0 if the PDF cannot be read.
         """
-        text = []
+        from PyPDF2 import PdfReader
+        try:
+            return len(PdfReader(self.document).pages)
+        except Exception as e:
+            print(f"Error reading PDF file: {e}")
+            return 0
 
+    def pdf_get_pages(self, start: int, end: int) -> List[str]:
+        """
+        Extract the text of a range of pages of a PDF document.
+        
+        Errors are isolated per page: a page that fails to extract yields an empty string and does 
+        not affect the other pages of the range.
+        
+        Parameters:
+            start (int): The index of the first page to extract (0-based).
+            end (int): The index after the last page to extract.
+        
+        Returns:
+            List[str]: The text of each page in the range, in page order.
+        """
+        from PyPDF2 import PdfReader
         try:
             pdf_reader = PdfReader(self.document)
-            num_pages = len(pdf_reader.pages)
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-                if page_text:
-                    text.append(f"Page {page_num + 1}:\n{page_text}\n")
         except Exception as e:
             print(f"Error reading PDF file: {e}")
+            return [""] * (end - start)
+        pages = []
+        for page_num in range(start, end):
+            try:
+                pages.append(pdf_reader.pages[page_num].extract_text() or "")
+            except Exception as e:
+                print(f"Error reading page {page_num + 1} of PDF file: {e}")
+                pages.append("")
+        return pages
+
+    @staticmethod
+    def join_pdf_pages(pages: List[str]) -> str:
+        """
+        Join extracted PDF pages into the text returned by `pdf_get_content`.
+        
+        Parameters:
+            pages (List[str]): The text of each page, in page order.
         
-        return "\n\n".join(text)
+        Returns:
+            str: The non-empty pages prefixed with their page number and separated by two newlines.
+        """
+        return "\n\n".join(f"Page {page_num + 1}:\n{page_text}\n"
+                           for page_num, page_text in enumerate(pages) if page_text)
+
+    def pdf_get_content(self) -> str:
+        """
+        Extract text from a PDF document.
+        
+        This method uses the PyPDF2 library to read the text content from each page of the PDF.
+        
+        Returns:
+            str: The extracted text content as a single string, with each page separated by two newlines.
+        """
+        return self.join_pdf_pages(self.pdf_get_pages(0, self.pdf_num_pages()))
 
     def read_docs(self) -> str:
         """
@@ -58,6 +111,7 @@ class DocumentClassifier:
         Returns:
             str: The extracted text content, with paragraphs and tables formatted as plain text.
         """
+        from docx import Document
         try:
             doc = Document(self.document)
             paragraphs = [para.text for para in doc.paragraphs]
@@ -73,26 +127,130 @@ class DocumentClassifier:
             print(f"Error reading DOCX file: {e}")
             return ""
 
+    def is_table(self) -> bool:
+        """
+        Tell whether the document is a spreadsheet that can be streamed with `iter_table_rows`.
+        
+        Returns:
+            bool: True for CSV and XLSX files.
+        """
+        return os.path.splitext(self.document)[1].lower() in self.TABLE_EXTENSIONS
+
+    @staticmethod
+    def format_row(values) -> str:
+        """
+        Format a spreadsheet row as plain text.
+        
+        Parameters:
+            values: The cell values of the row.
+        
+        Returns:
+            str: The cell values separated by " | ", empty cells as empty strings.
+        """
+        return " | ".join("" if value is None else str(value) for value in values)
+
+    def iter_xlsx_rows(self) -> Iterator[Tuple[Optional[str], str, int, str]]:
+        """
+        Stream the rows of an XLSX document.
+        
+        The workbook is opened in openpyxl's read-only mode, which parses the sheets as they are 
+        iterated instead of loading them, so memory does not grow with the size of the file. The 
+        first non-empty row of each sheet is taken as its header.
+        
+        Yields:
+            Tuple[Optional[str], str, int, str]: The sheet name, the header of the sheet, the row 
+            number (1-based, as shown by spreadsheet applications) and the text of each non-empty row.
+        """
+        from openpyxl import load_workbook
+        workbook = load_workbook(filename=self.document, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                header = None
+                for row_number, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+                    if all(value is None for value in values):
+                        continue
+                    row_text = self.format_row(values)
+                    if header is None:
+                        header = row_text
+                    else:
+                        yield sheet.title, header, row_number, row_text
+        finally:
+            workbook.close()
+
+    def iter_csv_rows(self) -> Iterator[Tuple[Optional[str], str, int, str]]:
+        """
+        Stream the rows of a CSV document.
+        
+        The file is read with pandas in blocks of `CSV_BLOCK_ROWS` rows, so memory does not grow with 
+        the size of the file. Cells are kept as text.
+        
+        Yields:
+            Tuple[Optional[str], str, int, str]: None (a CSV has no sheets), the header row, the row 
+            number (1-based, the header being row 1) and the text of each row.
+        """
+        import pandas as pd
+        row_number = 1
+        with pd.read_csv(self.document, dtype=str, keep_default_na=False,
+                         chunksize=self.CSV_BLOCK_ROWS) as reader:
+            for block in reader:
+                header = self.format_row(block.columns)
+                for values in block.itertuples(index=False, name=None):
+                    row_number += 1
+                    yield None, header, row_number, self.format_row(values)
+
+    def iter_table_rows(self) -> Iterator[Tuple[Optional[str], str, int, str]]:
+        """
+        Stream the rows of a CSV or XLSX document.
+        
+        A file that cannot be read stops the stream at the first error, keeping the rows read so far.
+        
+        Returns:
+            Iterator[Tuple[Optional[str], str, int, str]]: The sheet name (None for a CSV), the 
+            header of the sheet, the row number and the text of each row.
+        
+        Raises:
+            ValueError: If the document is not a spreadsheet.
+        """
+        ext = os.path.splitext(self.document)[1].lower()
+        if ext == '.csv':
+            return self.__guard_rows(self.iter_csv_rows(), "CSV")
+        elif ext == '.xlsx':
+            return self.__guard_rows(self.iter_xlsx_rows(), "XLSX")
+        else:
+            raise ValueError(f"Not a spreadsheet: {ext}")
+
+    @staticmethod
+    def __guard_rows(rows: Iterator, file_type: str) -> Iterator:
+        """
+        Pass rows through, ending the stream instead of raising if the file cannot be read.
+        """
+        try:
+            yield from rows
+        except Exception as e:
+            print(f"Error reading {file_type} file: {e}")
+
     def read_xlsx(self) -> str:
         """
         Extract data from an XLSX document.
         
-        This method uses the openpyxl library to read data from each sheet in an XLSX file. The data 
-        from each sheet is combined into a single string.
+        This method uses the openpyxl library, in read-only mode, to read data from each sheet in an 
+        XLSX file. The data from each sheet is combined into a single string.
         
         Returns:
             str: The extracted data, with each sheet and row formatted as plain text.
         """
+        from openpyxl import load_workbook
         try:
-            workbook = load_workbook(filename=self.document)
-            sheets_data = []
-            for sheetname in workbook.sheetnames:
-                sheet = workbook[sheetname]
-                sheet_data = [sheetname]
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = " | ".join(map(str, row))
-                    sheet_data.append(row_text)
-                sheets_data.append("\n".join(sheet_data))
+            workbook = load_workbook(filename=self.document, read_only=True, data_only=True)
+            try:
+                sheets_data = []
+                for sheet in workbook.worksheets:
+                    sheet_data = [sheet.title]
+                    for row in sheet.iter_rows(values_only=True):
+                        sheet_data.append(" | ".join(map(str, row)))
+                    sheets_data.append("\n".join(sheet_data))
+            finally:
+                workbook.close()
 
             return "\n\n".join(sheets_data)
         except Exception as e:
@@ -104,11 +262,12 @@ class DocumentClassifier:
         Extract data from a CSV document.
         
         This method uses the pandas library to read data from a CSV file into a DataFrame and then 
-        convert it to a plain text string.
+        convert it to a plain text string. Use `iter_csv_rows` for large files.
         
         Returns:
             str: The extracted data as plain text.
         """
+        import pandas as pd
         try:
             data = pd.read_csv(self.document)
             return data.to_string(index=False)
@@ -122,7 +281,8 @@ class DocumentClassifier:
         
         This method determines the file type by examining the file extension and calls the 
         appropriate method to extract content from the document. If the file type is not supported, 
-        it raises a ValueError.
+        it raises a ValueError. With an extraction cache, a document whose content was already 
+        extracted is not parsed again.
         
         Returns:
             str: The extracted content from the document as a plain text string.
@@ -131,16 +291,42 @@ class DocumentClassifier:
             ValueError: If the file type is unsupported.
         """
         ext = os.path.splitext(self.document)[1].lower()
+        if ext not in ('.pdf', '.csv', '.xlsx', '.docx'):
+            raise ValueError(f"Unsupported file type: {ext}")
+        if self.extraction_cache is None:
+            return self.__extract(ext)
+        key = ExtractionCache.make_key(self.document)
+        pages = self.extraction_cache.get(key)
+        if pages is None:
+            if ext == '.pdf':
+                pages = list(enumerate(self.pdf_get_pages(0, self.pdf_num_pages()), start=1))
+            else:
+                pages = [(1, self.__extract(ext))]
+            # Empty extractions (including read errors) are not cached, so they are retried next time.
+            if any(text for _, text in pages):
+                self.extraction_cache.put(key, pages)
+        if ext == '.pdf':
+            return self.join_pdf_pages([text for _, text in pages])
+        return pages[0][1] if pages else ""
+
+    def __extract(self, ext: str) -> str:
+        """
+        Extract the content of the document with the parser of its file type.
+        
+        Parameters:
+            ext (str): The lowercase file extension.
+        
+        Returns:
+            str: The extracted content.
+        """
         if ext == '.pdf':
             return self.pdf_get_content()
         elif ext == '.csv':
             return self.read_csv()
         elif ext == '.xlsx':
             return self.read_xlsx()
-        elif ext == '.docx':
-            return self.read_docs()
         else:
-            raise ValueError(f"Unsupported file type: {ext}")
+            return self.read_docs()
 
 
 
@@ -0,0 +1,359 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import faiss
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from utils.index_generations import IndexGenerations
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only docstore backed by the SQLite file written by VectorDBFiles.save.
+
+    Chunks are fetched one query at a time, so only the top-k hits of a search are ever read and
+    the store costs nothing at start-up however many chunks it holds. The connection is opened
+    read-only and shared by the Gradio worker threads behind a lock.
+
+    Parameters:
+        path (str): The path to the SQLite file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def execute(self, query: str, parameters: tuple = ()) -> list:
+        """
+        Run a read query.
+
+        Parameters:
+            query (str): The SQL query.
+            parameters (tuple): The query parameters.
+
+        Returns:
+            list: The rows of the result.
+        """
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Fetch a chunk by ID.
+
+        Parameters:
+            search (str): The chunk ID.
+
+        Returns:
+            Union[str, Document]: The chunk, or an error message if it is not in the store
+            (as InMemoryDocstore does).
+        """
+        rows = self.execute("SELECT page_content, metadata FROM chunks WHERE id = ?", (search,))
+        if not rows:
+            return f"ID {search} not found."
+        page_content, metadata = rows[0]
+        return Document(id=search, page_content=page_content, metadata=json.loads(metadata))
+
+    def close(self) -> None:
+        """
+        Close the connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+class LazyIndexToDocstoreId(Mapping):
+    """
+    Read-only mapping from FAISS index position to chunk ID, read from the SQLite docstore on access.
+
+    Parameters:
+        docstore (SQLiteDocstore): The docstore holding the positions.
+    """
+
+    def __init__(self, docstore: SQLiteDocstore) -> None:
+        self.docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        rows = self.docstore.execute("SELECT id FROM chunks WHERE position = ?", (int(position),))
+        if not rows:
+            raise KeyError(position)
+        return rows[0][0]
+
+    def __iter__(self) -> Iterator[int]:
+        return (row[0] for row in self.docstore.execute("SELECT position FROM chunks ORDER BY position"))
+
+    def __len__(self) -> int:
+        return self.docstore.execute("SELECT COUNT(*) FROM chunks")[0][0]
+
+
+class IncrementalDocstore(Docstore, AddableMixin):
+    """
+    Docstore of a VectorDB being updated: chunks are read from the saved SQLite docstore on demand,
+    and the chunks added and deleted since it was opened are recorded, so VectorDBFiles.save can
+    apply just those changes instead of rewriting every chunk.
+
+    Attributes:
+        path (str): The path to the saved SQLite file.
+        positions (Dict[str, int]): The saved position of every chunk ID.
+        added (Dict[str, Document]): The chunks added, by ID.
+        deleted (set): The IDs of the saved chunks deleted. A chunk deleted and added again under
+            the same ID (a changed file) is in both.
+    """
+
+    def __init__(self, path: str, positions: Dict[str, int]) -> None:
+        self.path = path
+        self.positions = positions
+        self.added: Dict[str, Document] = {}
+        self.deleted = set()
+        self._saved = SQLiteDocstore(path)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.added or (doc_id in self.positions and doc_id not in self.deleted)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """
+        Add chunks.
+
+        Parameters:
+            texts (Dict[str, Document]): The chunks, by ID.
+
+        Raises:
+            ValueError: If one of the IDs is already in the store (as InMemoryDocstore does).
+        """
+        overlapping = {doc_id for doc_id in texts if doc_id in self}
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self.added.update(texts)
+
+    def delete(self, ids: List[str]) -> None:
+        """
+        Delete chunks.
+
+        Parameters:
+            ids (List[str]): The IDs of the chunks.
+
+        Raises:
+            ValueError: If none of the IDs is in the store (as InMemoryDocstore does).
+        """
+        if not any(doc_id in self for doc_id in ids):
+            raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+        for doc_id in ids:
+            if self.added.pop(doc_id, None) is None:
+                self.deleted.add(doc_id)
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Fetch a chunk by ID, from the added chunks or else from the saved docstore.
+
+        Parameters:
+            search (str): The chunk ID.
+
+        Returns:
+            Union[str, Document]: The chunk, or an error message if it is not in the store.
+        """
+        if search in self.added:
+            return self.added[search]
+        if search in self.deleted:
+            return f"ID {search} not found."
+        return self._saved.search(search)
+
+    def close(self) -> None:
+        self._saved.close()
+
+
+class VectorDBFiles:
+    """
+    On-disk format of a VectorDB: the FAISS index in `index.faiss` and the chunks in `docstore.sqlite3`.
+
+    The docstore is a SQLite table of (position, id, page_content, metadata), indexed by chunk ID,
+    which replaces the pickled InMemoryDocstore of FAISS.save_local: loading it executes no code
+    and reads nothing up front. Readers memory-map the index read-only, so start-up does not depend
+    on the corpus size and processes serving the same index share its pages through the OS page
+    cache. The ingestion side loads the index into memory to modify it, but not the chunks: it
+    records the chunks added and deleted (see IncrementalDocstore), and saving copies the previous
+    docstore and applies those changes in one transaction, so an update costs in proportion to the
+    change rather than to the corpus.
+
+    The files are read from the current generation of the directory (see IndexGenerations) and
+    written to a new generation, which the caller publishes once all its files are written.
+    """
+    INDEX_FILE = "index.faiss"
+    DOCSTORE_FILE = "docstore.sqlite3"
+    FILES = (INDEX_FILE, DOCSTORE_FILE)
+    LEGACY_FILES = (INDEX_FILE, "index.pkl")
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """
+        Check whether a saved VectorDB is present in a directory.
+
+        Parameters:
+            directory (str): The index directory, or one of its generations.
+
+        Returns:
+            bool: True if both the index and the docstore of the current generation exist.
+        """
+        generation = IndexGenerations.current(directory)
+        return all(os.path.exists(os.path.join(generation, file_name)) for file_name in VectorDBFiles.FILES)
+
+    @staticmethod
+    def is_legacy(directory: str) -> bool:
+        """
+        Check whether a directory holds a VectorDB in the former FAISS.save_local format (the index
+        with a pickled docstore in `index.pkl`) and none in the current format.
+
+        Such indexes are not loaded, since unpickling them could run arbitrary code; they have to
+        be rebuilt from their documents.
+
+        Parameters:
+            directory (str): The index directory.
+
+        Returns:
+            bool: True if only a VectorDB in the former format is present.
+        """
+        return (not VectorDBFiles.exists(directory)
+                and all(os.path.exists(os.path.join(directory, file_name)) for file_name in VectorDBFiles.LEGACY_FILES))
+
+    @staticmethod
+    def read_index(path: str) -> faiss.Index:
+        """
+        Memory-map a FAISS index read-only, falling back to reading it into memory.
+
+        Parameters:
+            path (str): The path to the index file.
+
+        Returns:
+            faiss.Index: The index. It must not be modified.
+        """
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError:
+            return faiss.read_index(path)
+
+    @staticmethod
+    def load(directory: str, embedding) -> FAISS:
+        """
+        Open a saved VectorDB for searching: the index is memory-mapped and chunks are read lazily.
+
+        Parameters:
+            directory (str): The index directory, or one of its generations.
+            embedding (Embeddings): The embedding model used to embed queries.
+
+        Returns:
+            FAISS: The read-only VectorDB.
+        """
+        directory = IndexGenerations.current(directory)
+        index = VectorDBFiles.read_index(os.path.join(directory, VectorDBFiles.INDEX_FILE))
+        docstore = SQLiteDocstore(os.path.join(directory, VectorDBFiles.DOCSTORE_FILE))
+        return FAISS(embedding, index, docstore, LazyIndexToDocstoreId(docstore))
+
+    @staticmethod
+    def load_for_update(directory: str, embedding) -> Optional[FAISS]:
+        """
+        Open a saved VectorDB so it can be modified: the index is read into memory, the chunk IDs
+        are read from the docstore and the chunks themselves are only read on demand.
+
+        Parameters:
+            directory (str): The index directory.
+            embedding (Embeddings): The embedding model of the VectorDB.
+
+        Returns:
+            Optional[FAISS]: The VectorDB, or None if none is saved in the directory.
+        """
+        if not VectorDBFiles.exists(directory):
+            return None
+        directory = IndexGenerations.current(directory)
+        index = faiss.read_index(os.path.join(directory, VectorDBFiles.INDEX_FILE))
+        path = os.path.join(directory, VectorDBFiles.DOCSTORE_FILE)
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            index_to_docstore_id = dict(connection.execute("SELECT position, id FROM chunks ORDER BY position"))
+        finally:
+            connection.close()
+        docstore = IncrementalDocstore(path, {doc_id: position for position, doc_id in index_to_docstore_id.items()})
+        return FAISS(embedding, index, docstore, index_to_docstore_id)
+
+    @staticmethod
+    def __rows(vectordb: FAISS) -> Iterator[Tuple[int, str, str, str]]:
+        """
+        Yield the docstore rows of a VectorDB.
+
+        Parameters:
+            vectordb (FAISS): The VectorDB.
+
+        Yields:
+            Tuple[int, str, str, str]: The position, ID, text and JSON metadata of every chunk.
+        """
+        for position, doc_id in vectordb.index_to_docstore_id.items():
+            doc = vectordb.docstore.search(doc_id)
+            yield position, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)
+
+    @staticmethod
+    def save(vectordb: FAISS, directory: str) -> None:
+        """
+        Write a VectorDB to a directory, in the format read by `load`.
+
+        A VectorDB opened with `load_for_update` gets a copy of its previous docstore, updated with
+        the chunks added and deleted since; any other VectorDB is written out in full.
+
+        Parameters:
+            vectordb (FAISS): The VectorDB.
+            directory (str): The directory to write to, normally a new generation (see
+                IndexGenerations.create); existing files are overwritten.
+        """
+        os.makedirs(directory, exist_ok=True)
+        faiss.write_index(vectordb.index, os.path.join(directory, VectorDBFiles.INDEX_FILE))
+        path = os.path.join(directory, VectorDBFiles.DOCSTORE_FILE)
+        if os.path.exists(path):
+            os.remove(path)
+        connection = sqlite3.connect(path)
+        try:
+            if isinstance(vectordb.docstore, IncrementalDocstore):
+                VectorDBFiles.__apply_changes(vectordb, connection)
+            else:
+                connection.execute("CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+                                   "page_content TEXT NOT NULL, metadata TEXT NOT NULL)")
+                connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", VectorDBFiles.__rows(vectordb))
+                connection.commit()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def __apply_changes(vectordb: FAISS, connection: sqlite3.Connection) -> None:
+        """
+        Copy the previous docstore of a VectorDB opened with `load_for_update` into a new SQLite file,
+        and apply the chunks added and deleted since, in one transaction.
+
+        Parameters:
+            vectordb (FAISS): The VectorDB; its docstore is an IncrementalDocstore.
+            connection (sqlite3.Connection): The connection to the new, empty SQLite file.
+        """
+        docstore: IncrementalDocstore = vectordb.docstore
+        source = sqlite3.connect(f"file:{docstore.path}?mode=ro", uri=True)
+        try:
+            source.backup(connection)
+        finally:
+            source.close()
+        with connection:
+            connection.executemany("DELETE FROM chunks WHERE id = ?", ((doc_id,) for doc_id in docstore.deleted))
+            # Deletions renumber the vectors after them. Removal keeps the order of the remaining
+            # vectors and additions go to the end, so a saved chunk only ever moves to a lower
+            # position, which its previous holder has already left when positions are updated in
+            # ascending order.
+            connection.executemany(
+                "UPDATE chunks SET position = ? WHERE id = ?",
+                ((position, doc_id) for position, doc_id in sorted(vectordb.index_to_docstore_id.items())
+                 if doc_id not in docstore.added and docstore.positions[doc_id] != position))
+            positions = {doc_id: position for position, doc_id in vectordb.index_to_docstore_id.items()}
+            connection.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                ((positions[doc_id], doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                 for doc_id, doc in docstore.added.items()))
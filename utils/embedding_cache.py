@@ -0,0 +1,190 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from utils.telemetry import Telemetry
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed cache of document embeddings.
+
+    Vectors are stored in a SQLite database keyed by a hash of (model name, chunk text), so a
+    chunk that was already embedded by the same model is never sent to the embedding provider
+    again, whichever file it came from. The cache is bounded to `max_entries` vectors; when it
+    grows past that, the least recently used entries are evicted.
+
+    Attributes:
+        cache_path (str): The path of the SQLite database file.
+        max_entries (int): The maximum number of vectors kept in the cache.
+        hits (int): The number of lookups answered from the cache since start-up.
+        misses (int): The number of lookups that had to be embedded since start-up.
+    """
+
+    def __init__(self, cache_path: str, max_entries: int = 200000) -> None:
+        """
+        Open (and create if needed) the embedding cache.
+
+        Parameters:
+            cache_path (str): The path of the SQLite database file.
+            max_entries (int): The maximum number of vectors kept in the cache.
+        """
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(cache_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """
+        Build the cache key of a chunk.
+
+        Parameters:
+            model (str): The name of the embedding model.
+            text (str): The chunk text.
+
+        Returns:
+            str: The hex digest identifying the (model, text) pair.
+        """
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up several vectors and refresh their recency.
+
+        Parameters:
+            keys (List[str]): The cache keys to look up.
+
+        Returns:
+            Dict[str, List[float]]: The vectors found, by key.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay below SQLite's limit on the number of bound parameters.
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """
+        Store several vectors, evicting the least recently used ones if the cache is full.
+
+        Parameters:
+            items (Dict[str, List[float]]): The vectors to store, by key.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()])
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the hit/miss counters of the cache.
+
+        Returns:
+            Dict[str, float]: The number of hits, misses and the hit rate since start-up.
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends cache misses to the underlying embedding model.
+
+    Document embeddings are looked up in an EmbeddingCache first; the remaining texts are embedded
+    in a single call to the wrapped model and written back to the cache. Query embeddings are not
+    cached and go straight to the wrapped model. The hits and misses are counted in the enclosing
+    telemetry span (see Telemetry.add).
+
+    Parameters:
+        embedding (Embeddings): The embedding model to wrap.
+        cache (EmbeddingCache): The cache to read from and write to.
+        model_name (str): The model name used in the cache key.
+    """
+
+    def __init__(self, embedding: Embeddings, cache: EmbeddingCache, model_name: Optional[str] = None) -> None:
+        self.embedding = embedding
+        self.cache = cache
+        self.model_name = model_name or getattr(embedding, "model", type(embedding).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a list of documents, reusing cached vectors where possible.
+
+        Parameters:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per text, in the input order.
+        """
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        # Embed each distinct missing text once, even if it occurs several times in the input.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            new_vectors = self.embedding.embed_documents(list(missing.values()))
+            # Round through float32 so fresh and cached vectors of a chunk are identical.
+            computed = {key: array("f", vector).tolist() for key, vector in zip(missing.keys(), new_vectors)}
+            self.cache.put_many(computed)
+            vectors.update(computed)
+        Telemetry.add(cache_hits=len(texts) - len(missing), cache_misses=len(missing))
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query with the wrapped model.
+
+        Parameters:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The query vector.
+        """
+        return self.embedding.embed_query(text)
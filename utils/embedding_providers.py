@@ -0,0 +1,141 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingMismatchError(ValueError):
+    """
+    Raised when an index was built with another embedding model than the one configured.
+    """
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    In-process embedding model based on the hashing trick.
+
+    Word unigrams and bigrams are hashed into `dimension` signed buckets, weighted by sublinear term
+    frequency and L2-normalized. It needs no model download, no network and no API key, runs on the
+    CPU in microseconds per query and is deterministic across processes, so it also serves as an
+    offline backend for development and benchmarks. Being purely lexical, it retrieves chunks that
+    share words with the question rather than paraphrases.
+
+    Parameters:
+        dimension (int): The dimension of the vectors.
+    """
+    _TOKEN = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dimension: int = 1024) -> None:
+        self.dimension = dimension
+        self.model = f"hashing-{dimension}"
+
+    def __features(self, text: str) -> Counter:
+        """
+        Count the word unigrams and bigrams of a text.
+
+        Parameters:
+            text (str): The text.
+
+        Returns:
+            Counter: The number of occurrences of every feature.
+        """
+        tokens = self._TOKEN.findall(text.lower())
+        features = Counter(tokens)
+        features.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+        return features
+
+    def __embed(self, text: str) -> List[float]:
+        """
+        Embed one text.
+
+        Parameters:
+            text (str): The text.
+
+        Returns:
+            List[float]: The L2-normalized vector.
+        """
+        vector = np.zeros(self.dimension, dtype="float32")
+        for feature, count in self.__features(text).items():
+            value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            # The top bit gives the sign, so colliding features tend to cancel out rather than add up.
+            vector[value % self.dimension] += (1.0 + math.log(count)) * (1 if value >> 63 else -1)
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.__embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.__embed(text)
+
+
+def _voyage(engine: str) -> Embeddings:
+    from langchain_voyageai import VoyageAIEmbeddings
+    return VoyageAIEmbeddings(voyage_api_key=os.getenv("VOYAGE_API_KEY"), model=engine)
+
+
+def _google(engine: str) -> Embeddings:
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=engine)
+
+
+def _nvidia(engine: str) -> Embeddings:
+    from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
+    return NVIDIAEmbeddings(model=engine)
+
+
+def _hashing(engine: str) -> Embeddings:
+    _, _, dimension = engine.partition("-")
+    return HashingEmbeddings(dimension=int(dimension) if dimension else 1024)
+
+
+# provider name -> (engine name prefixes, factory taking the engine name)
+EMBEDDING_PROVIDERS: Dict[str, Tuple[Tuple[str, ...], Callable[[str], Embeddings]]] = {
+    "voyage": (("voyage-",), _voyage),
+    "google": (("models/",), _google),
+    "nvidia": (("NV-", "nvidia/"), _nvidia),
+    "hashing": (("hashing",), _hashing),
+}
+
+
+def provider_for(engine: str) -> str:
+    """
+    Find the provider of an embedding engine (the `embedding_model_config.engine` setting).
+
+    Parameters:
+        engine (str): The engine name, e.g. "voyage-large-2-instruct", "models/embedding-001",
+            "NV-Embed-QA" or "hashing-1024".
+
+    Returns:
+        str: The provider name.
+
+    Raises:
+        ValueError: If no provider serves the engine.
+    """
+    for name, (prefixes, _) in EMBEDDING_PROVIDERS.items():
+        if engine.startswith(prefixes):
+            return name
+    raise ValueError(f"Unknown embedding engine: {engine}. Supported providers: {', '.join(EMBEDDING_PROVIDERS)}.")
+
+
+def create_embedding(engine: str) -> Embeddings:
+    """
+    Create the embedding model for an engine. Provider packages are only imported when used.
+
+    Parameters:
+        engine (str): The engine name.
+
+    Returns:
+        Embeddings: The embedding model.
+    """
+    load_dotenv()
+    _, factory = EMBEDDING_PROVIDERS[provider_for(engine)]
+    return factory(engine)
@@ -0,0 +1,260 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from utils.telemetry import Telemetry
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by every ingestion running in the process.
+
+    Tokens are refilled continuously at `rate` tokens per second up to `capacity`. The bucket is
+    thread-safe and independent of any event loop, so one instance can throttle requests coming
+    from several uploads at once.
+
+    Attributes:
+        rate (float): The number of tokens added per second.
+        capacity (float): The maximum number of tokens the bucket holds.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        """
+        Initialize a full TokenBucket.
+
+        Parameters:
+            rate (float): The number of tokens added per second.
+            capacity (float, optional): The maximum number of tokens. Defaults to one second worth of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """
+        Take tokens from the bucket, going into debt if needed.
+
+        Parameters:
+            tokens (float): The number of tokens to take.
+
+        Returns:
+            float: The time to wait, in seconds, before the tokens are actually available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Wait until the requested number of tokens is available.
+
+        Parameters:
+            tokens (float): The number of tokens to take.
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Parts of the names of the SDK exceptions raised for transient failures
+_TRANSIENT_ERROR_NAMES = ("Timeout", "ConnectError", "ConnectionError", "RateLimit", "ServiceUnavailable")
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Tell whether a failed embedding or model request is worth retrying.
+
+    Rate limiting (HTTP 429), server errors (HTTP 5xx), timeouts and connection errors are retried;
+    anything else (bad request, authentication, ...) is not. The provider SDKs raise their own
+    timeout and connection errors (httpx, requests, groq, voyageai), which are recognized by name.
+
+    Parameters:
+        error (Exception): The error raised by the client.
+
+    Returns:
+        bool: True if the request should be retried.
+    """
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if any(name in type(error).__name__ for name in _TRANSIENT_ERROR_NAMES):
+        return True
+    response = getattr(error, "response", None)
+    for status in (getattr(error, "status_code", None), getattr(error, "http_status", None),
+                   getattr(response, "status_code", None)):
+        if isinstance(status, int):
+            return status == 429 or status >= 500
+    return False
+
+
+class EmbeddingScheduler:
+    """
+    Batched, concurrent and rate-limited execution of embedding requests.
+
+    Texts are split into batches of `batch_size`; up to `max_concurrency` batches are in flight at
+    once, every request first takes a token from a shared token bucket (`requests_per_minute`), and
+    batches that fail with a retryable error are retried with exponential backoff and full jitter.
+    Results keep the input order. Retries are counted in the enclosing telemetry span (see Telemetry.add).
+
+    Attributes:
+        batch_size (int): The number of texts per embedding request.
+        max_concurrency (int): The maximum number of requests in flight.
+        max_retries (int): The number of retries of a failed batch.
+        backoff_base (float): The base delay of the exponential backoff, in seconds.
+        backoff_max (float): The maximum delay between two attempts, in seconds.
+        rate_limiter (TokenBucket): The rate limiter shared by every request.
+    """
+
+    def __init__(self, batch_size: int = 64, max_concurrency: int = 4, requests_per_minute: float = 300,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 30.0) -> None:
+        """
+        Initialize the EmbeddingScheduler.
+
+        Parameters:
+            batch_size (int): The number of texts per embedding request.
+            max_concurrency (int): The maximum number of requests in flight.
+            requests_per_minute (float): The maximum request rate.
+            max_retries (int): The number of retries of a failed batch.
+            backoff_base (float): The base delay of the exponential backoff, in seconds.
+            backoff_max (float): The maximum delay between two attempts, in seconds.
+        """
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(rate=requests_per_minute / 60.0,
+                                        capacity=max(1.0, min(self.max_concurrency, requests_per_minute / 60.0)))
+
+    async def __embed_batch(self, embedding: Embeddings, batch: List[str]) -> List[List[float]]:
+        """
+        Embed one batch, retrying retryable failures with backoff.
+
+        Parameters:
+            embedding (Embeddings): The embedding model.
+            batch (List[str]): The texts of the batch.
+
+        Returns:
+            List[List[float]]: The vectors of the batch.
+        """
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            try:
+                return await asyncio.to_thread(embedding.embed_documents, batch)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                Telemetry.add(retries=1)
+                await asyncio.sleep(delay)
+
+    async def aembed_documents(self, embedding: Embeddings, texts: List[str],
+                               progress_callback: Optional[Callable[[int, int, int, int], None]] = None
+                               ) -> List[List[float]]:
+        """
+        Embed texts in concurrent, rate-limited batches.
+
+        Parameters:
+            embedding (Embeddings): The embedding model.
+            texts (List[str]): The texts to embed.
+            progress_callback (Callable, optional): Called after every batch with (batches done,
+                total batches, texts done, total texts).
+
+        Returns:
+            List[List[float]]: One vector per text, in the input order.
+        """
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        results: List[Optional[List[List[float]]]] = [None] * len(batches)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        progress = {"batches": 0, "texts": 0}
+
+        async def run(index: int, batch: List[str]) -> None:
+            async with semaphore:
+                results[index] = await self.__embed_batch(embedding, batch)
+            progress["batches"] += 1
+            progress["texts"] += len(batch)
+            if progress_callback is not None:
+                progress_callback(progress["batches"], len(batches), progress["texts"], len(texts))
+
+        await asyncio.gather(*(run(index, batch) for index, batch in enumerate(batches)))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def embed_documents(self, embedding: Embeddings, texts: List[str],
+                        progress_callback: Optional[Callable[[int, int, int, int], None]] = None
+                        ) -> List[List[float]]:
+        """
+        Embed texts in concurrent, rate-limited batches from synchronous code.
+
+        Parameters:
+            embedding (Embeddings): The embedding model.
+            texts (List[str]): The texts to embed.
+            progress_callback (Callable, optional): Called after every batch with (batches done,
+                total batches, texts done, total texts).
+
+        Returns:
+            List[List[float]]: One vector per text, in the input order.
+        """
+        coroutine = self.aembed_documents(embedding, texts, progress_callback)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        # Called from inside an event loop: run the scheduler on its own loop in a helper thread.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that sends document embeddings through an EmbeddingScheduler.
+
+    Parameters:
+        embedding (Embeddings): The embedding model to wrap.
+        scheduler (EmbeddingScheduler): The scheduler running the requests.
+        progress_callback (Callable, optional): Called after every batch with (batches done,
+            total batches, texts done, total texts).
+    """
+
+    def __init__(self, embedding: Embeddings, scheduler: EmbeddingScheduler,
+                 progress_callback: Optional[Callable[[int, int, int, int], None]] = None) -> None:
+        self.embedding = embedding
+        self.scheduler = scheduler
+        self.progress_callback = progress_callback
+        self.model = getattr(embedding, "model", type(embedding).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a list of documents through the scheduler.
+
+        Parameters:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One vector per text, in the input order.
+        """
+        if not texts:
+            return []
+        return self.scheduler.embed_documents(self.embedding, texts, self.progress_callback)
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query with the wrapped model.
+
+        Parameters:
+            text (str): The query text.
+
+        Returns:
+            List[float]: The query vector.
+        """
+        return self.embedding.embed_query(text)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+
+class ExtractionCache:
+    """
+    On-disk, content-addressed cache of extracted document text.
+
+    The (page number, text) pairs extracted from a file are stored zlib-compressed in a SQLite
+    database keyed by a hash of the file content, so uploading a file that was already extracted,
+    under any name, skips parsing it entirely. The cache is bounded to `max_bytes` of compressed
+    data; when it grows past that, the least recently used entries are evicted.
+
+    Keys include `VERSION`, which must be bumped whenever the extraction output changes so that
+    stale entries are no longer used.
+
+    Attributes:
+        cache_path (str): The path of the SQLite database file.
+        max_bytes (int): The maximum total size of the compressed entries, in bytes.
+        hits (int): The number of lookups answered from the cache since start-up.
+        misses (int): The number of lookups that had to be extracted since start-up.
+    """
+    VERSION = 1
+
+    def __init__(self, cache_path: str, max_bytes: int = 512 * 1024 * 1024) -> None:
+        """
+        Open (and create if needed) the extraction cache.
+
+        Parameters:
+            cache_path (str): The path of the SQLite database file.
+            max_bytes (int): The maximum total size of the compressed entries, in bytes.
+        """
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(cache_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+        self._conn.commit()
+
+    @classmethod
+    def make_key(cls, file_path: str, content_hash: Optional[str] = None) -> str:
+        """
+        Build the cache key of a file.
+
+        Parameters:
+            file_path (str): The path to the file; its extension selects the extractor.
+            content_hash (str, optional): The SHA-256 hex digest of the file content, if already known.
+
+        Returns:
+            str: The key identifying the (extractor version, file type, content) triple.
+        """
+        if content_hash is None:
+            sha = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            content_hash = sha.hexdigest()
+        ext = os.path.splitext(str(file_path))[1].lower()
+        return f"v{cls.VERSION}{ext}:{content_hash}"
+
+    def get(self, key: str) -> Optional[List[Tuple[int, str]]]:
+        """
+        Look up the extracted pages of a file and refresh their recency.
+
+        Parameters:
+            key (str): The cache key of the file.
+
+        Returns:
+            Optional[List[Tuple[int, str]]]: The (page number, text) pairs, or None if not cached.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return [(page, text) for page, text in json.loads(zlib.decompress(row[0]))]
+
+    def put(self, key: str, pages: List[Tuple[int, str]]) -> None:
+        """
+        Store the extracted pages of a file, evicting the least recently used entries if the cache is full.
+
+        Parameters:
+            key (str): The cache key of the file.
+            pages (List[Tuple[int, str]]): The (page number, text) pairs extracted from the file.
+        """
+        data = zlib.compress(json.dumps(pages, ensure_ascii=False).encode("utf-8"))
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()))
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()
+            if total > self.max_bytes:
+                evicted = []
+                for old_key, size in self._conn.execute(
+                        "SELECT key, size FROM extractions WHERE key != ? ORDER BY last_used ASC", (key,)):
+                    evicted.append((old_key,))
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+                self._conn.executemany("DELETE FROM extractions WHERE key = ?", evicted)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the hit/miss counters of the cache.
+
+        Returns:
+            Dict[str, float]: The number of hits, misses and the hit rate since start-up.
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
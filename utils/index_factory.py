@@ -0,0 +1,238 @@
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq_int8")
+
+DEFAULT_INDEX_PARAMS = {
+    "nlist": 1024,
+    "pq_m": 16,
+    "pq_nbits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "nprobe": 16,
+    "retrain_growth": 2,
+}
+
+# FAISS recommends at least 39 training points per IVF list
+MIN_POINTS_PER_LIST = 39
+
+
+def ivf_nlist(num_vectors: int, params: Optional[Dict] = None) -> int:
+    """
+    Return the number of IVF lists of an index trained on `num_vectors` vectors: the configured
+    `nlist`, capped so that every list gets MIN_POINTS_PER_LIST training points.
+
+    Parameters:
+        num_vectors (int): The number of training vectors.
+        params (Dict, optional): The index parameters.
+
+    Returns:
+        int: The number of lists, at least 1.
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    return max(1, min(params["nlist"], num_vectors // MIN_POINTS_PER_LIST))
+
+
+def min_training_vectors(index_type: str, num_vectors: int, params: Optional[Dict] = None) -> int:
+    """
+    Return the number of vectors needed to train an index type with the lists it would get for
+    `num_vectors` vectors (see `ivf_nlist`).
+
+    Parameters:
+        index_type (str): The index type.
+        num_vectors (int): The number of vectors available.
+        params (Dict, optional): The index parameters.
+
+    Returns:
+        int: The minimum number of training vectors (0 if the index needs no training).
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if index_type == "ivf_pq":
+        return max(2 ** params["pq_nbits"], ivf_nlist(num_vectors, params))
+    if index_type == "ivf_flat":
+        return ivf_nlist(num_vectors, params)
+    return 0
+
+
+def factory_string(index_type: str, dimension: int, num_vectors: int, params: Optional[Dict] = None) -> str:
+    """
+    Translate an index type and its parameters into a FAISS index_factory string.
+
+    The number of IVF lists is capped so that every list gets enough training points for the
+    given number of vectors (see `ivf_nlist`).
+
+    Parameters:
+        index_type (str): One of INDEX_TYPES.
+        dimension (int): The dimension of the vectors.
+        num_vectors (int): The number of training vectors available.
+        params (Dict, optional): The index parameters (see DEFAULT_INDEX_PARAMS).
+
+    Returns:
+        str: The FAISS index_factory description.
+
+    Raises:
+        ValueError: If the index type is unknown or PQ does not divide the dimension.
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    nlist = ivf_nlist(num_vectors, params)
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_pq":
+        if dimension % params["pq_m"]:
+            raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dimension}.")
+        return f"IVF{nlist},PQ{params['pq_m']}x{params['pq_nbits']}"
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']}"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    if index_type == "sq_int8":
+        return "SQ8"
+    raise ValueError(f"Unknown index type: {index_type}. Choose one of {', '.join(INDEX_TYPES)}.")
+
+
+def build_index(index_type: str, vectors: np.ndarray, params: Optional[Dict] = None) -> faiss.Index:
+    """
+    Create an empty FAISS index of the given type, trained on `vectors` if the type needs training.
+
+    The vectors are only used for training; they are not added to the index. If there are too few
+    vectors to train the requested type, a flat index is returned instead.
+
+    Parameters:
+        index_type (str): One of INDEX_TYPES.
+        vectors (np.ndarray): The (n, d) float32 training vectors.
+        params (Dict, optional): The index parameters (see DEFAULT_INDEX_PARAMS).
+
+    Returns:
+        faiss.Index: The trained, empty index (L2 metric).
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    num_vectors, dimension = vectors.shape
+    if num_vectors < min_training_vectors(index_type, num_vectors, params):
+        print(f"Only {num_vectors} vectors: too few to train a '{index_type}' index, using a flat index.")
+        index_type = "flat"
+    index = faiss.index_factory(dimension, factory_string(index_type, dimension, num_vectors, params))
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = params["ef_construction"]
+    if not index.is_trained:
+        print(f"Training the '{index_type}' index on {num_vectors} vectors...")
+        index.train(vectors)
+    set_search_parameters(index, params)
+    return index
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """
+    Tell which of INDEX_TYPES an index was built as.
+
+    Parameters:
+        index (faiss.Index): The index.
+
+    Returns:
+        str: The index type.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq_int8"
+    return "flat"
+
+
+def set_search_parameters(index: faiss.Index, params: Optional[Dict] = None) -> None:
+    """
+    Apply the query-time parameters (nprobe for IVF indexes, efSearch for HNSW) to an index.
+
+    Parameters:
+        index (faiss.Index): The index.
+        params (Dict, optional): The index parameters (see DEFAULT_INDEX_PARAMS).
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(params["nprobe"], ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """
+    Read back every vector stored in an index.
+
+    Vectors of quantized indexes (PQ, SQ8) come back approximated.
+
+    Parameters:
+        index (faiss.Index): The index.
+
+    Returns:
+        np.ndarray: The (ntotal, d) float32 vectors, in index order.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def supports_compacting_removal(index: faiss.Index) -> bool:
+    """
+    Tell whether `remove_ids` renumbers the remaining vectors of an index, as the LangChain FAISS
+    store expects. Flat and scalar-quantized indexes do; IVF indexes keep the old labels and HNSW
+    indexes do not support removal at all.
+
+    Parameters:
+        index (faiss.Index): The index.
+
+    Returns:
+        bool: True if vectors can be removed with `remove_ids`.
+    """
+    return index_type_of(index) in ("flat", "sq_fp16", "sq_int8")
+
+
+def compact_index(index: faiss.Index, keep: np.ndarray) -> faiss.Index:
+    """
+    Build a copy of an index holding only some of its vectors, renumbered from 0, without retraining.
+
+    Parameters:
+        index (faiss.Index): The index.
+        keep (np.ndarray): The positions of the vectors to keep, in the order of the new index.
+
+    Returns:
+        faiss.Index: The compacted index, with the same training and search parameters.
+    """
+    vectors = np.ascontiguousarray(reconstruct_all(index)[keep], dtype="float32")
+    new_index = faiss.clone_index(index)
+    new_index.reset()
+    if len(vectors):
+        new_index.add(vectors)
+    return new_index
+
+
+def rebuild_index(index: faiss.Index, keep: np.ndarray, index_type: str, params: Optional[Dict] = None) -> faiss.Index:
+    """
+    Build a new index of another type holding the vectors of an index, trained on those vectors.
+
+    Used to turn the flat index built during ingestion into the configured type once enough
+    vectors exist to train it.
+
+    Parameters:
+        index (faiss.Index): The current index.
+        keep (np.ndarray): The positions of the vectors to keep, in the order of the new index.
+        index_type (str): The type of the new index.
+        params (Dict, optional): The index parameters.
+
+    Returns:
+        faiss.Index: The new index.
+    """
+    vectors = np.ascontiguousarray(reconstruct_all(index)[keep], dtype="float32")
+    new_index = build_index(index_type, vectors, params) if len(vectors) else faiss.IndexFlatL2(index.d)
+    if len(vectors):
+        new_index.add(vectors)
+    return new_index
@@ -0,0 +1,110 @@
+import os
+import re
+import shutil
+from typing import List, Optional
+
+
+class IndexGenerations:
+    """
+    Versioned layout of an index directory.
+
+    Every save of a VectorDB writes a complete new generation, a subdirectory holding the FAISS
+    index, the docstore, the inverted index and the manifest, and then switches the `CURRENT`
+    pointer file to it with a single `os.replace`. Readers resolve `CURRENT` once and load every
+    file from that generation, so they never combine files of two saves (e.g. a new index with the
+    old docstore), whatever the timing of the writer.
+
+    The previous generation is kept when switching, since a reader may have resolved `CURRENT`
+    just before the switch; older ones are deleted. Directories written before generations were
+    introduced hold the files directly and have no `CURRENT`; they are read as they are and
+    converted on their next save.
+    """
+    CURRENT_FILE = "CURRENT"
+    PREFIX = "gen-"
+    # Files of the former flat layout, removed once the directory has a generation
+    LEGACY_FILES = ("index.faiss", "docstore.sqlite3", "lexical.npz", "manifest.json", "index.pkl")
+    _NAME = re.compile(r"^gen-(\d+)$")
+
+    @classmethod
+    def current(cls, directory: str) -> str:
+        """
+        Return the directory of the current generation.
+
+        Parameters:
+            directory (str): The index directory.
+
+        Returns:
+            str: The current generation, or `directory` itself if it has none (flat layout, or no
+            index yet).
+        """
+        try:
+            with open(os.path.join(directory, cls.CURRENT_FILE), encoding="utf-8") as f:
+                name = f.read().strip()
+        except OSError:
+            return directory
+        return os.path.join(directory, name) if cls._NAME.match(name) else directory
+
+    @classmethod
+    def __number(cls, name: str) -> Optional[int]:
+        match = cls._NAME.match(name)
+        return int(match.group(1)) if match else None
+
+    @classmethod
+    def create(cls, directory: str) -> str:
+        """
+        Create the directory of the next generation, empty.
+
+        Parameters:
+            directory (str): The index directory.
+
+        Returns:
+            str: The new generation directory; it is not current until `publish` is called.
+        """
+        os.makedirs(directory, exist_ok=True)
+        numbers = [number for number in map(cls.__number, os.listdir(directory)) if number is not None]
+        generation = os.path.join(directory, f"{cls.PREFIX}{max(numbers, default=0) + 1:06d}")
+        os.makedirs(generation)
+        return generation
+
+    @classmethod
+    def publish(cls, directory: str, generation: str) -> None:
+        """
+        Make a generation current, then delete the generations older than the previous one.
+
+        Parameters:
+            directory (str): The index directory.
+            generation (str): The generation directory, as returned by `create`.
+        """
+        previous = cls.current(directory)
+        pointer = os.path.join(directory, cls.CURRENT_FILE)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(os.path.basename(generation))
+        os.replace(pointer + ".tmp", pointer)
+        keep = {os.path.basename(generation), os.path.basename(previous)}
+        for name in cls.stale(directory, keep):
+            path = os.path.join(directory, name)
+            # Files still open in another process may not be deletable (Windows); the next save retries.
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def stale(cls, directory: str, keep: set) -> List[str]:
+        """
+        List the entries of an index directory left over by earlier saves.
+
+        Parameters:
+            directory (str): The index directory.
+            keep (set): The names of the generations to keep.
+
+        Returns:
+            List[str]: The names of the older generations, of the files of the flat layout and of
+            the temporary directories of interrupted saves.
+        """
+        return [name for name in os.listdir(directory)
+                if (cls._NAME.match(name) and name not in keep) or name in cls.LEGACY_FILES
+                or name.startswith(".tmp-")]
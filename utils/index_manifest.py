@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from utils.embedding_providers import EmbeddingMismatchError
+from utils.index_generations import IndexGenerations
+
+
+class IndexManifest:
+    """
+    Manifest of the files ingested into a vector index.
+
+    The manifest lives next to the FAISS files in the persist directory and records, for every
+    ingested file, its path, the hash of its content and the number of chunks it produced. Chunk IDs
+    are derived from the file key and the chunk position ("<file key>#<n>"), so the manifest entry
+    is enough to find every vector a file owns. A version counter is bumped on every save so
+    readers can tell that the index changed. The embedding engine, provider and dimension that built
+    the vectors are recorded too, since vectors of different models cannot be searched together,
+    and so are the type of the index and the number of vectors it was trained on.
+
+    Attributes:
+        persist_directory (str): The directory holding the index and the manifest.
+        version (int): The version of the manifest, incremented on every save.
+        files (Dict[str, dict]): The manifest entries, by file key.
+        embedding (Optional[dict]): The engine, provider and dimension of the embedding model, if recorded.
+        index (Optional[dict]): The type of the index and the number of vectors it was trained on, if recorded.
+    """
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, persist_directory: str) -> None:
+        """
+        Load the manifest of the current generation of an index directory, or start an empty one.
+
+        Parameters:
+            persist_directory (str): The directory holding the index and the manifest, or one of
+                its generations (see IndexGenerations).
+        """
+        self.persist_directory = persist_directory
+        self.version = 0
+        self.files: Dict[str, dict] = {}
+        self.embedding: Optional[dict] = None
+        self.index: Optional[dict] = None
+        path = os.path.join(IndexGenerations.current(persist_directory), self.FILE_NAME)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.version = manifest["version"]
+            self.files = manifest["files"]
+            self.embedding = manifest.get("embedding")
+            self.index = manifest.get("index")
+
+    @staticmethod
+    def file_key(file_path: str) -> str:
+        """
+        Return the key under which a file is tracked in the manifest.
+
+        Files are tracked by name, so re-uploading a file (which lands in a new temporary path)
+        is recognised as the same file.
+
+        Parameters:
+            file_path (str): The path to the file.
+
+        Returns:
+            str: The file key.
+        """
+        return os.path.basename(str(file_path))
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """
+        Compute the SHA-256 hash of a file's content.
+
+        Parameters:
+            file_path (str): The path to the file.
+
+        Returns:
+            str: The hex digest of the file content.
+        """
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        return sha.hexdigest()
+
+    @staticmethod
+    def chunk_ids_for(file_key: str, num_chunks: int, start: int = 0) -> List[str]:
+        """
+        Build the chunk IDs of a file.
+
+        Parameters:
+            file_key (str): The manifest key of the file.
+            num_chunks (int): The number of chunks to build IDs for.
+            start (int): The position of the first of these chunks in the file.
+
+        Returns:
+            List[str]: The chunk IDs, in chunk order.
+        """
+        return [f"{file_key}#{n}" for n in range(start, start + num_chunks)]
+
+    def is_unchanged(self, file_key: str, content_hash: str) -> bool:
+        """
+        Check whether a file was already ingested with the same content.
+
+        Parameters:
+            file_key (str): The manifest key of the file.
+            content_hash (str): The hash of the file's current content.
+
+        Returns:
+            bool: True if the manifest holds the file with the same content hash.
+        """
+        entry = self.files.get(file_key)
+        return entry is not None and entry["hash"] == content_hash
+
+    def chunk_ids(self, file_key: str) -> List[str]:
+        """
+        Return the chunk IDs recorded for a file.
+
+        Parameters:
+            file_key (str): The manifest key of the file.
+
+        Returns:
+            List[str]: The chunk IDs of the file, or an empty list if it is not in the manifest.
+        """
+        entry = self.files.get(file_key)
+        if entry is None:
+            return []
+        return self.chunk_ids_for(file_key, entry["num_chunks"])
+
+    def add(self, file_key: str, file_path: str, content_hash: str, num_chunks: int) -> None:
+        """
+        Record an ingested file.
+
+        Parameters:
+            file_key (str): The manifest key of the file.
+            file_path (str): The path the file was ingested from.
+            content_hash (str): The hash of the file content.
+            num_chunks (int): The number of chunks the file produced.
+        """
+        self.files[file_key] = {"path": str(file_path), "hash": content_hash, "num_chunks": num_chunks}
+
+    def remove(self, file_key: str) -> Optional[dict]:
+        """
+        Forget an ingested file.
+
+        Parameters:
+            file_key (str): The manifest key of the file.
+
+        Returns:
+            Optional[dict]: The removed entry, if the file was in the manifest.
+        """
+        return self.files.pop(file_key, None)
+
+    def check_embedding(self, engine: str, dimension: Optional[int] = None) -> None:
+        """
+        Check that the vectors of the index were built with the given embedding model.
+
+        Manifests without an embedding record (written before it existed) pass the check.
+
+        Parameters:
+            engine (str): The configured embedding engine.
+            dimension (int, optional): The dimension of the configured model's vectors, if known.
+
+        Raises:
+            EmbeddingMismatchError: If the index was built with another engine or dimension.
+        """
+        if self.embedding is None:
+            return
+        if self.embedding["engine"] != engine:
+            raise EmbeddingMismatchError(
+                f"The index in '{self.persist_directory}' was built with the embedding model "
+                f"'{self.embedding['engine']}' ({self.embedding['provider']}), but '{engine}' is configured. "
+                f"Re-ingest the documents or change embedding_model_config.engine.")
+        if dimension is not None and self.embedding["dimension"] != dimension:
+            raise EmbeddingMismatchError(
+                f"The index in '{self.persist_directory}' holds {self.embedding['dimension']}-dimensional "
+                f"vectors, but the configured embedding model produces {dimension}-dimensional ones.")
+
+    def save(self, directory: Optional[str] = None) -> None:
+        """
+        Bump the version and atomically write the manifest.
+
+        Parameters:
+            directory (str, optional): The directory to write to, e.g. a new generation of the
+                index. Defaults to the persist directory.
+        """
+        self.version += 1
+        directory = directory or self.persist_directory
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.FILE_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "embedding": self.embedding, "index": self.index,
+                       "files": self.files}, f, indent=2)
+        os.replace(tmp_path, path)
@@ -0,0 +1,301 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+from langchain_community.vectorstores import FAISS
+from utils.index_manifest import IndexManifest
+from utils.index_generations import IndexGenerations
+from utils.docstore import VectorDBFiles
+from utils.index_factory import set_search_parameters
+from utils.embedding_providers import EmbeddingMismatchError
+from utils.lexical_index import LexicalIndex
+from utils.load_config import get_config
+from utils.telemetry import Telemetry
+
+
+class IndexLoadError(RuntimeError):
+    """
+    Raised when an index present on disk cannot be loaded and no earlier version of it is resident.
+    """
+
+
+class ResidentIndex(NamedTuple):
+    """
+    A loaded index and everything loaded with it, from a single generation of its directory.
+
+    IndexRegistry.get hands out the whole entry at once: a request that answers from it keeps using
+    the same index, manifest, inverted index and version even if the directory is saved again, or
+    the index is evicted, in the meantime.
+
+    Attributes:
+        version (tuple): The on-disk signature the index was loaded with (see IndexRegistry.signature).
+        vectordb (FAISS): The index.
+        manifest (IndexManifest): The manifest of the index.
+        lexical_index (Optional[LexicalIndex]): The BM25 inverted index saved with it, if any.
+        nbytes (int): The estimated memory taken by the index (see IndexRegistry.estimate_size).
+    """
+    version: tuple
+    vectordb: FAISS
+    manifest: IndexManifest
+    lexical_index: Optional[LexicalIndex]
+    nbytes: int
+
+    def check_embedding(self, engine: str, dimension: Optional[int] = None) -> None:
+        """
+        Check that the index was built with the configured embedding model.
+
+        Parameters:
+            engine (str): The configured embedding engine.
+            dimension (int, optional): The dimension of the configured model's vectors, if known.
+
+        Raises:
+            EmbeddingMismatchError: If the index was built with another engine or dimension.
+        """
+        self.manifest.check_embedding(engine, dimension)
+        if dimension is not None and self.vectordb.index.d != dimension:
+            raise EmbeddingMismatchError(
+                f"The index holds {self.vectordb.index.d}-dimensional vectors, but the configured "
+                f"embedding model produces {dimension}-dimensional ones.")
+
+
+class IndexRegistry:
+    """
+    Process-wide registry of loaded FAISS indexes.
+
+    Each persist directory is opened once and kept resident so chat turns do not re-open the index
+    on every message. Indexes are opened with VectorDBFiles.load: the vectors are memory-mapped and
+    chunks are read from SQLite only for the hits of a search, so opening is cheap at any corpus
+    size. Before handing an index out, the registry compares the on-disk signature (the current
+    generation of the directory, see IndexGenerations, and the modification time and size of its
+    index files and manifest) with the one it loaded and hot-swaps the index when it changed. All
+    the files of an index are read from the generation of its signature, so a save that happens
+    during a load cannot mix files of two saves. Requests that already hold the previous index
+    keep using it until they finish, so a swap never interrupts an in-flight search.
+
+    The registry is shared by all Gradio worker threads; loads are serialized per directory so
+    concurrent requests for a cold index only trigger a single load.
+
+    The BM25 inverted index saved next to an index, if any, is loaded with it. `get` returns the
+    index, its manifest, inverted index and version together (see ResidentIndex), so a request never
+    combines parts of two loads.
+
+    The query-time parameters of approximate indexes (`nprobe` for IVF, `efSearch` for HNSW) are
+    applied to every index as it is loaded; they are set from the app configuration when this
+    module is imported, and can be changed with `configure`.
+
+    Resident indexes are kept in least-recently-used order. With a memory budget (see `configure`),
+    the least recently used indexes are evicted once the estimated size of the resident ones (index
+    file and inverted index) exceeds it, so serving many per-session upload indexes does not grow
+    memory without bound; an evicted index is simply loaded again on its next use.
+
+    Loads are timed as the "index_load" telemetry stage (failed ones with the name of their
+    exception), and evictions are counted as the "index_evict" stage.
+    """
+    INDEX_FILES = VectorDBFiles.FILES
+
+    _lock = threading.Lock()
+    _load_locks: Dict[str, threading.Lock] = {}
+    _entries: "OrderedDict[str, ResidentIndex]" = OrderedDict()
+    _search_params: Dict = {}
+    _max_bytes: Optional[int] = None
+
+    @classmethod
+    def configure(cls, search_params: Dict, max_bytes: Optional[int] = None) -> None:
+        """
+        Set the query-time parameters applied to loaded indexes, including the resident ones, and
+        the memory budget of the resident indexes.
+
+        Parameters:
+            search_params (Dict): The index parameters; `nprobe` and `ef_search` are used.
+            max_bytes (int, optional): The maximum estimated size of the resident indexes, in bytes.
+                Unbounded if None.
+        """
+        cls._search_params = dict(search_params)
+        cls._max_bytes = max_bytes
+        for entry in list(cls._entries.values()):
+            set_search_parameters(entry.vectordb.index, cls._search_params)
+        with cls._lock:
+            cls.__enforce_budget()
+
+    @staticmethod
+    def estimate_size(directory: str, lexical_index: Optional[LexicalIndex]) -> int:
+        """
+        Estimate the memory taken by a loaded index.
+
+        Parameters:
+            directory (str): The persist directory of the index.
+            lexical_index (LexicalIndex, optional): The inverted index loaded with it.
+
+        Returns:
+            int: The size of the FAISS index file plus that of the inverted index, in bytes. Chunks
+            stay in SQLite and are not counted.
+        """
+        try:
+            size = os.path.getsize(os.path.join(IndexGenerations.current(directory), VectorDBFiles.INDEX_FILE))
+        except OSError:
+            size = 0
+        if lexical_index is not None:
+            size += lexical_index.nbytes
+        return size
+
+    @classmethod
+    def __enforce_budget(cls, keep: Optional[str] = None) -> None:
+        """
+        Evict the least recently used indexes until the resident ones fit in the memory budget.
+        Expects the lock to be held.
+
+        Parameters:
+            keep (str, optional): A directory whose index is never evicted (the one just loaded).
+        """
+        if cls._max_bytes is None:
+            return
+        total = sum(entry.nbytes for entry in cls._entries.values())
+        for directory in list(cls._entries):
+            if total <= cls._max_bytes:
+                break
+            if directory == keep:
+                continue
+            nbytes = cls._entries.pop(directory).nbytes
+            total -= nbytes
+            Telemetry.record("index_evict", 0.0, evictions=1, bytes=nbytes)
+
+    @classmethod
+    def resident_bytes(cls) -> int:
+        """
+        Return the estimated size of the resident indexes, in bytes.
+        """
+        return sum(entry.nbytes for entry in list(cls._entries.values()))
+
+    @staticmethod
+    def signature(directory: str) -> Optional[tuple]:
+        """
+        Compute the on-disk signature of an index directory.
+
+        Parameters:
+            directory (str): The persist directory of the index.
+
+        Returns:
+            Optional[tuple]: The current generation directory (see IndexGenerations), followed by
+            (mtime_ns, size) pairs for its index files and manifest, or None if the index is not
+            (completely) present on disk.
+        """
+        generation = IndexGenerations.current(directory)
+        stamps = [generation]
+        for file_name in IndexRegistry.INDEX_FILES:
+            try:
+                stat = os.stat(os.path.join(generation, file_name))
+            except OSError:
+                return None
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        try:
+            stat = os.stat(os.path.join(generation, IndexManifest.FILE_NAME))
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            # Indexes built before manifests were introduced have none.
+            stamps.append(None)
+        return tuple(stamps)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        """
+        Check whether a complete index is present in the directory.
+
+        Parameters:
+            directory (str): The persist directory of the index.
+
+        Returns:
+            bool: True if all index files exist.
+        """
+        return cls.signature(directory) is not None
+
+    @classmethod
+    def get(cls, directory: str, embedding) -> Optional[ResidentIndex]:
+        """
+        Return the resident index for a directory, loading or reloading it if needed.
+
+        Parameters:
+            directory (str): The persist directory of the index.
+            embedding: The embedding model used to embed queries against the index.
+
+        Returns:
+            Optional[ResidentIndex]: The loaded index with its manifest, inverted index and version,
+            or None if no index exists in the directory. If a new version of the index fails to
+            load, the resident one keeps being served.
+
+        Raises:
+            IndexLoadError: If the index fails to load and no earlier version of it is resident.
+        """
+        directory = os.path.abspath(directory)
+        current = cls.signature(directory)
+        if current is None:
+            cls.evict(directory)
+            return None
+
+        with cls._lock:
+            entry = cls._entries.get(directory)
+            if entry is not None and entry.version == current:
+                cls._entries.move_to_end(directory)
+                return entry
+
+        with cls.load_lock(directory):
+            # Another request may have finished loading while we were waiting.
+            with cls._lock:
+                entry = cls._entries.get(directory)
+            current = cls.signature(directory)
+            if current is None:
+                cls.evict(directory)
+                return None
+            if entry is not None and entry.version == current:
+                return entry
+            # Every file is read from the generation the signature was taken from.
+            generation = current[0]
+            try:
+                # The span records the error of a failed load
+                with Telemetry.span("index_load") as span:
+                    vectordb = VectorDBFiles.load(generation, embedding)
+                    lexical_index = LexicalIndex.load(generation)
+                    span.add(vectors=vectordb.index.ntotal)
+            except Exception as e:
+                if entry is None:
+                    raise IndexLoadError(f"The index in '{directory}' could not be loaded: {e}") from e
+                # Keep serving the resident version rather than failing the request.
+                return entry
+            set_search_parameters(vectordb.index, cls._search_params)
+            entry = ResidentIndex(current, vectordb, IndexManifest(generation), lexical_index,
+                                  cls.estimate_size(generation, lexical_index))
+            with cls._lock:
+                cls._entries[directory] = entry
+                cls._entries.move_to_end(directory)
+                cls.__enforce_budget(keep=directory)
+            return entry
+
+    @classmethod
+    def load_lock(cls, directory: str) -> threading.Lock:
+        """
+        Return the lock that serializes loading the index of a directory. Hold it to delete or
+        replace the directory without racing a load.
+
+        Parameters:
+            directory (str): The persist directory of the index.
+
+        Returns:
+            threading.Lock: The lock of the directory.
+        """
+        with cls._lock:
+            return cls._load_locks.setdefault(os.path.abspath(directory), threading.Lock())
+
+    @classmethod
+    def evict(cls, directory: str) -> None:
+        """
+        Drop the resident index of a directory, if any.
+
+        Parameters:
+            directory (str): The persist directory of the index.
+        """
+        with cls._lock:
+            cls._entries.pop(os.path.abspath(directory), None)
+
+
+APPCFG = get_config()
+IndexRegistry.configure(APPCFG.index_params, max_bytes=APPCFG.index_cache_max_bytes)
@@ -0,0 +1,390 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.telemetry import Telemetry
+
+
+class IngestionCancelled(Exception):
+    """
+    Raised inside a job that was cancelled, at its next progress report.
+    """
+
+
+class JobLimitError(RuntimeError):
+    """
+    Raised when a job is submitted while the queue is full or its owner has too many active jobs.
+    """
+
+
+class IngestionJob:
+    """
+    A unit of background work (ingesting or summarizing uploaded files) and its progress.
+
+    The work reports its progress through `report`, per stage: "files" (files parsed), "chunks"
+    (chunks embedded) and "index" (index written). Reporting is also where cancellation takes
+    effect: once the job is cancelled, the next report raises IngestionCancelled, so the work stops
+    at a point where it has not written anything yet.
+
+    Attributes:
+        job_id (str): The identifier of the job.
+        owner (str): The identifier of the session that submitted the job.
+        description (str): What the job does, for display.
+        state (str): "queued", "running", "done", "failed" or "cancelled".
+        progress (Dict[str, Tuple[int, Optional[int]]]): The (done, total) count of every stage reported so far.
+        result: The return value of the work, once done.
+        error (Optional[str]): The error message, if the job failed.
+    """
+    STAGE_LABELS = {"files": "files parsed", "chunks": "chunks embedded", "index": "index written"}
+    FINAL_STATES = ("done", "failed", "cancelled")
+
+    def __init__(self, owner: str, description: str, function: Callable[["IngestionJob"], Any],
+                 lock_key: Optional[str] = None) -> None:
+        """
+        Create a queued job.
+
+        Parameters:
+            owner (str): The identifier of the session submitting the job.
+            description (str): What the job does, for display.
+            function (Callable[[IngestionJob], Any]): The work; it receives the job to report progress to.
+            lock_key (str, optional): Jobs with the same key (e.g. the index directory they write)
+                never run at the same time.
+        """
+        self.job_id = uuid.uuid4().hex[:8]
+        self.owner = owner
+        self.description = description
+        self.function = function
+        self.lock_key = lock_key
+        self.state = "queued"
+        self.progress: Dict[str, Tuple[int, Optional[int]]] = {}
+        self.result = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        # Guards the state transitions and wakes up the watchers; reentrant, so finish() can run under cancel()
+        self._changed = threading.Condition()
+        self._revision = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.state in self.FINAL_STATES
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def __touch(self) -> None:
+        """
+        Wake up the watchers of the job.
+        """
+        with self._changed:
+            self._revision += 1
+            self._changed.notify_all()
+
+    def report(self, stage: str, done: int, total: Optional[int] = None) -> None:
+        """
+        Record the progress of a stage. Called by the work.
+
+        Parameters:
+            stage (str): The stage: "files", "chunks" or "index".
+            done (int): The number of items of the stage done so far.
+            total (int, optional): The total number of items of the stage, if known.
+
+        Raises:
+            IngestionCancelled: If the job was cancelled, unless the report completes the stage:
+                work that is already done (e.g. an index that was written) is not reported as cancelled.
+        """
+        if self._cancel.is_set() and (total is None or done < total):
+            raise IngestionCancelled(self.job_id)
+        self.progress[stage] = (done, total)
+        self.__touch()
+
+    def cancel(self) -> None:
+        """
+        Ask the job to stop. A queued job never starts; a running job stops at its next progress report;
+        a finished job is left as it is.
+        """
+        with self._changed:
+            if self.finished:
+                return
+            self._cancel.set()
+            if self.state == "queued":
+                self.finish("cancelled")
+            else:
+                self.__touch()
+
+    def start(self) -> bool:
+        """
+        Move a queued job to the running state.
+
+        Returns:
+            bool: False if the job was cancelled (or already started), in which case it must not run.
+        """
+        with self._changed:
+            if self.state != "queued" or self._cancel.is_set():
+                return False
+            self.state = "running"
+            self.__touch()
+            return True
+
+    def finish(self, state: str, result=None, error: Optional[str] = None) -> bool:
+        """
+        Move the job to a final state, unless it is already in one.
+
+        Parameters:
+            state (str): "done", "failed" or "cancelled".
+            result: The return value of the work.
+            error (str, optional): The error message, if the job failed.
+
+        Returns:
+            bool: False if the job was already finished and was left unchanged.
+        """
+        with self._changed:
+            if self.finished:
+                return False
+            self.state, self.result, self.error = state, result, error
+            self.finished_at = time.time()
+            self.__touch()
+            return True
+
+    def wait(self, revision: int, timeout: float) -> int:
+        """
+        Wait until the job changes after a given revision, or until the timeout.
+
+        Parameters:
+            revision (int): The last revision seen by the caller.
+            timeout (float): The maximum time to wait, in seconds.
+
+        Returns:
+            int: The current revision.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._revision != revision, timeout=timeout)
+            return self._revision
+
+    def status_text(self) -> str:
+        """
+        Describe the state and progress of the job in one line.
+
+        Returns:
+            str: e.g. "Job 1a2b3c4d (indexing 2 files): running, 1/2 files parsed, 512 chunks embedded".
+        """
+        parts = [self.state if not (self.cancelled and self.state == "running") else "cancelling"]
+        for stage, label in self.STAGE_LABELS.items():
+            if stage in self.progress:
+                done, total = self.progress[stage]
+                parts.append(f"{done}/{total} {label}" if total is not None else f"{done} {label}")
+        if self.error:
+            parts.append(self.error)
+        return f"Job {self.job_id} ({self.description}): " + ", ".join(parts)
+
+
+class IngestionJobQueue:
+    """
+    Bounded queue of background jobs run by a pool of worker threads.
+
+    Uploads are processed here instead of inside the request handler, so the Gradio workers stay
+    free for chat traffic while documents are parsed and embedded. The queue holds at most
+    `max_pending` waiting jobs and every owner (chat session) at most `max_jobs_per_user` active
+    (queued or running) jobs; further submissions raise JobLimitError. Jobs writing the same index
+    (same `lock_key`) are run one after another. Finished jobs are kept for inspection, up to
+    `keep_finished` of them.
+
+    Attributes:
+        max_workers (int): The number of jobs run at the same time.
+        max_pending (int): The maximum number of jobs waiting to run.
+        max_jobs_per_user (int): The maximum number of active jobs per owner.
+        keep_finished (int): The number of finished jobs kept.
+    """
+
+    def __init__(self, max_workers: int = 1, max_pending: int = 16, max_jobs_per_user: int = 2,
+                 keep_finished: int = 100) -> None:
+        """
+        Initialize the IngestionJobQueue. Worker threads are started on the first submission.
+
+        Parameters:
+            max_workers (int): The number of jobs run at the same time.
+            max_pending (int): The maximum number of jobs waiting to run.
+            max_jobs_per_user (int): The maximum number of active jobs per owner.
+            keep_finished (int): The number of finished jobs kept.
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending
+        self.max_jobs_per_user = max_jobs_per_user
+        self.keep_finished = keep_finished
+        # Unbounded: the limit is checked on submission against the jobs still queued, so cancelled
+        # jobs waiting to be drained by a worker do not take up room
+        self._queue: "queue.Queue[IngestionJob]" = queue.Queue()
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+
+    def __start_workers(self) -> None:
+        """
+        Start the worker threads if they are not running yet. Expects the lock to be held.
+        """
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self.__work, name=f"ingestion-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def __work(self) -> None:
+        """
+        Run queued jobs, forever.
+        """
+        while True:
+            job = self._queue.get()
+            try:
+                if job.finished:
+                    continue
+                with self._lock:
+                    key_lock = self._key_locks.setdefault(job.lock_key, threading.Lock()) if job.lock_key else None
+                if key_lock is not None:
+                    key_lock.acquire()
+                try:
+                    self.__run(job)
+                finally:
+                    if key_lock is not None:
+                        key_lock.release()
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def __run(job: IngestionJob) -> None:
+        """
+        Run a job and record its outcome, in the job itself and as a "job" telemetry stage counting
+        done, failed and cancelled jobs (failures with the name of their exception).
+
+        Parameters:
+            job (IngestionJob): The job.
+        """
+        if not job.start():
+            job.finish("cancelled")
+            Telemetry.record("job", 0.0, job.job_id, cancelled=1)
+            return
+        Telemetry.record("job_wait", time.time() - job.created_at, job.job_id)
+        start = time.perf_counter()
+        try:
+            result = job.function(job)
+        except IngestionCancelled:
+            job.finish("cancelled")
+            Telemetry.record("job", time.perf_counter() - start, job.job_id, cancelled=1)
+        except (Exception, SystemExit) as e:
+            # SystemExit too: a job must never take its worker thread down.
+            job.finish("failed", error=str(e))
+            Telemetry.record("job", time.perf_counter() - start, job.job_id, error=type(e).__name__, failed=1)
+        else:
+            job.finish("done", result=result)
+            Telemetry.record("job", time.perf_counter() - start, job.job_id, done=1)
+
+    def __forget_finished(self) -> None:
+        """
+        Drop the oldest finished jobs beyond `keep_finished`, and the locks no active job uses.
+        Expects the lock to be held.
+        """
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+        active_keys = {job.lock_key for job in self._jobs.values() if not job.finished}
+        for key, key_lock in list(self._key_locks.items()):
+            if key not in active_keys and not key_lock.locked():
+                del self._key_locks[key]
+
+    def submit(self, owner: str, description: str, function: Callable[[IngestionJob], Any],
+               lock_key: Optional[str] = None) -> IngestionJob:
+        """
+        Queue a job.
+
+        Parameters:
+            owner (str): The identifier of the session submitting the job.
+            description (str): What the job does, for display.
+            function (Callable[[IngestionJob], Any]): The work; it receives the job to report progress to.
+            lock_key (str, optional): Jobs with the same key never run at the same time.
+
+        Returns:
+            IngestionJob: The queued job.
+
+        Raises:
+            JobLimitError: If the owner has `max_jobs_per_user` active jobs or the queue is full.
+        """
+        job = IngestionJob(owner, description, function, lock_key)
+        with self._lock:
+            self.__forget_finished()
+            if len(self.jobs_of(owner, active_only=True)) >= self.max_jobs_per_user:
+                raise JobLimitError(f"At most {self.max_jobs_per_user} uploads can be in progress per session; "
+                                    "please wait for them to finish or cancel them.")
+            if sum(queued.state == "queued" for queued in self._jobs.values()) >= self.max_pending:
+                raise JobLimitError("The server is busy processing other uploads; please try again later.")
+            self._jobs[job.job_id] = job
+            self._queue.put_nowait(job)
+            self.__start_workers()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def jobs_of(self, owner: str, active_only: bool = False) -> List[IngestionJob]:
+        """
+        List the jobs of an owner.
+
+        Parameters:
+            owner (str): The identifier of the session.
+            active_only (bool): Whether to leave out finished jobs.
+
+        Returns:
+            List[IngestionJob]: The jobs, oldest first.
+        """
+        return [job for job in list(self._jobs.values())
+                if job.owner == owner and not (active_only and job.finished)]
+
+    def is_busy(self, lock_key: str) -> bool:
+        """
+        Tell whether a job with the given lock key is queued or running.
+
+        Parameters:
+            lock_key (str): The lock key, e.g. an index directory.
+
+        Returns:
+            bool: True if an active job uses the key.
+        """
+        return any(job.lock_key == lock_key and not job.finished for job in list(self._jobs.values()))
+
+    def cancel_all(self, owner: str) -> int:
+        """
+        Cancel the active jobs of an owner.
+
+        Parameters:
+            owner (str): The identifier of the session.
+
+        Returns:
+            int: The number of jobs cancelled.
+        """
+        jobs = self.jobs_of(owner, active_only=True)
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    @staticmethod
+    def watch(job: IngestionJob, heartbeat: float = 1.0) -> Iterator[IngestionJob]:
+        """
+        Follow the progress of a job.
+
+        Parameters:
+            job (IngestionJob): The job.
+            heartbeat (float): The maximum time between two updates, in seconds, so waiting
+                clients see that the job is still alive.
+
+        Yields:
+            IngestionJob: The job, every time it changes, until it is finished.
+        """
+        revision = -1
+        while True:
+            revision = job.wait(revision, heartbeat)
+            yield job
+            if job.finished:
+                return
@@ -0,0 +1,292 @@
+import hashlib
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunks of a VectorDB, keyed by the same chunk IDs as the FAISS index.
+
+    Exact identifiers, function names and error strings are often missed by vector search; this
+    index finds them by their tokens. Tokens are lowercased words; dotted, slashed or colon-joined
+    identifiers (e.g. `np.linalg.norm`, `os.path`) are indexed both whole and by their parts.
+
+    Terms are identified by a 64-bit hash, so no vocabulary strings are stored. The index is kept
+    in compressed sparse row form: a sorted array of term hashes, the offsets of each term's
+    postings, and flat arrays of document numbers and term frequencies. Loading reads a handful of
+    numpy arrays and a query term is found with a binary search. Updates switch the index to a
+    mutable form (a dict of `array` postings with deleted documents marked); it is compacted back to
+    CSR form before it is searched or saved.
+
+    Attributes:
+        k1 (float): The BM25 term frequency saturation.
+        b (float): The BM25 document length normalization.
+    """
+    FILE_NAME = "lexical.npz"
+    MAX_TOKEN_LENGTH = 64
+    _TOKEN = re.compile(r"\w+(?:[.:/-]+\w+)*", re.UNICODE)
+    _PART = re.compile(r"\w+", re.UNICODE)
+    _QUESTION_WORDS = frozenset({"what", "how", "why", "when", "where", "who", "whom", "which", "whose",
+                                 "explain", "describe", "summarize", "summarise", "compare", "tell", "list",
+                                 "is", "are", "was", "were", "do", "does", "did", "can", "could", "should",
+                                 "would", "will", "give", "show"})
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        """
+        Create an empty LexicalIndex.
+
+        Parameters:
+            k1 (float): The BM25 term frequency saturation.
+            b (float): The BM25 document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self._term_hashes = np.zeros(0, dtype="uint64")
+        self._offsets = np.zeros(1, dtype="int64")
+        self._postings = np.zeros(0, dtype="uint32")
+        self._frequencies = np.zeros(0, dtype="uint16")
+        self._doc_lengths = np.zeros(0, dtype="uint32")
+        self._doc_id_bytes = np.zeros(0, dtype="uint8")
+        self._doc_id_offsets = np.zeros(1, dtype="int64")
+        # Mutable form, set while the index is being updated
+        self._terms: Optional[Dict[int, Tuple[array, array]]] = None
+        self._doc_ids: Optional[List[Optional[str]]] = None
+        self._doc_numbers: Optional[Dict[str, int]] = None
+        self._mutable_lengths: Optional[array] = None
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """
+        Split a text into index terms.
+
+        Parameters:
+            text (str): The text.
+
+        Returns:
+            List[str]: The terms, in text order; compound identifiers are followed by their parts.
+        """
+        terms = []
+        for token in cls._TOKEN.findall(text.lower()):
+            if len(token) <= cls.MAX_TOKEN_LENGTH:
+                terms.append(token)
+            if not token.isalnum():
+                parts = cls._PART.findall(token)
+                if len(parts) > 1:
+                    terms.extend(part for part in parts if len(part) <= cls.MAX_TOKEN_LENGTH)
+        return terms
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 18)
+    def term_hash(term: str) -> int:
+        """
+        Hash a term to the 64-bit identifier stored in the index.
+
+        Parameters:
+            term (str): The term.
+
+        Returns:
+            int: The unsigned 64-bit hash.
+        """
+        return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+    @classmethod
+    def is_keyword_query(cls, query: str, max_terms: int = 4) -> bool:
+        """
+        Tell whether a query looks like a keyword lookup rather than a natural-language question.
+
+        Parameters:
+            query (str): The query.
+            max_terms (int): The maximum number of words of a keyword query.
+
+        Returns:
+            bool: True for short queries that are not phrased as a question.
+        """
+        words = query.split()
+        if not words or len(words) > max_terms or query.rstrip().endswith("?"):
+            return False
+        return words[0].lower().strip("\"'`") not in cls._QUESTION_WORDS
+
+    def __len__(self) -> int:
+        if self._doc_numbers is not None:
+            return len(self._doc_numbers)
+        return len(self._doc_lengths)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The memory taken by the arrays of the CSR form, in bytes.
+        """
+        return sum(values.nbytes for values in (self._term_hashes, self._offsets, self._postings, self._frequencies,
+                                              self._doc_lengths, self._doc_id_bytes, self._doc_id_offsets))
+
+    def __doc_id(self, doc_number: int) -> str:
+        """
+        Return the chunk ID of a document of the CSR form.
+        """
+        start, end = self._doc_id_offsets[doc_number], self._doc_id_offsets[doc_number + 1]
+        return self._doc_id_bytes[start:end].tobytes().decode("utf-8")
+
+    def __thaw(self) -> None:
+        """
+        Switch to the mutable form.
+        """
+        if self._terms is not None:
+            return
+        self._terms = {}
+        for i, term_hash in enumerate(self._term_hashes.tolist()):
+            start, end = self._offsets[i], self._offsets[i + 1]
+            self._terms[term_hash] = (array("I", self._postings[start:end].tobytes()),
+                                      array("H", self._frequencies[start:end].tobytes()))
+        self._doc_ids = [self.__doc_id(n) for n in range(len(self._doc_lengths))]
+        self._doc_numbers = {doc_id: n for n, doc_id in enumerate(self._doc_ids)}
+        self._mutable_lengths = array("I", self._doc_lengths.tobytes())
+
+    def __freeze(self) -> None:
+        """
+        Compact the mutable form, dropping deleted documents, back into the CSR form.
+        """
+        if self._terms is None:
+            return
+        alive = np.asarray([doc_id is not None for doc_id in self._doc_ids], dtype=bool)
+        renumber = np.cumsum(alive, dtype="int64") - 1
+        term_hashes, offsets, postings, frequencies = [], [0], [], []
+        for term_hash in sorted(self._terms):
+            docs, freqs = self._terms[term_hash]
+            docs = np.frombuffer(docs, dtype="uint32")
+            keep = alive[docs]
+            if not keep.any():
+                continue
+            term_hashes.append(term_hash)
+            postings.append(renumber[docs[keep]].astype("uint32"))
+            frequencies.append(np.frombuffer(freqs, dtype="uint16")[keep])
+            offsets.append(offsets[-1] + int(keep.sum()))
+        doc_ids = [doc_id for doc_id in self._doc_ids if doc_id is not None]
+        encoded = [doc_id.encode("utf-8") for doc_id in doc_ids]
+        self._term_hashes = np.asarray(term_hashes, dtype="uint64")
+        self._offsets = np.asarray(offsets, dtype="int64")
+        self._postings = np.concatenate(postings) if postings else np.zeros(0, dtype="uint32")
+        self._frequencies = np.concatenate(frequencies) if frequencies else np.zeros(0, dtype="uint16")
+        self._doc_lengths = np.frombuffer(self._mutable_lengths, dtype="uint32")[alive].copy()
+        self._doc_id_bytes = np.frombuffer(b"".join(encoded), dtype="uint8").copy()
+        self._doc_id_offsets = np.concatenate([[0], np.cumsum([len(e) for e in encoded], dtype="int64")]).astype("int64")
+        self._terms = self._doc_ids = self._doc_numbers = self._mutable_lengths = None
+
+    def add(self, doc_ids: Iterable[str], texts: Iterable[str]) -> None:
+        """
+        Index chunks. A chunk ID that is already indexed is replaced.
+
+        Parameters:
+            doc_ids (Iterable[str]): The chunk IDs.
+            texts (Iterable[str]): The chunk texts.
+        """
+        self.__thaw()
+        for doc_id, text in zip(doc_ids, texts):
+            if doc_id in self._doc_numbers:
+                self.remove([doc_id])
+            doc_number = len(self._doc_ids)
+            self._doc_ids.append(doc_id)
+            self._doc_numbers[doc_id] = doc_number
+            terms = self.tokenize(text)
+            self._mutable_lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                term_hash = self.term_hash(term)
+                postings = self._terms.get(term_hash)
+                if postings is None:
+                    postings = self._terms[term_hash] = (array("I"), array("H"))
+                postings[0].append(doc_number)
+                postings[1].append(count if count < 65535 else 65535)
+
+    def remove(self, doc_ids: Iterable[str]) -> None:
+        """
+        Remove chunks from the index. Unknown chunk IDs are ignored.
+
+        Parameters:
+            doc_ids (Iterable[str]): The chunk IDs.
+        """
+        self.__thaw()
+        for doc_id in doc_ids:
+            doc_number = self._doc_numbers.pop(doc_id, None)
+            if doc_number is not None:
+                self._doc_ids[doc_number] = None
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Rank the chunks matching a query by BM25.
+
+        Parameters:
+            query (str): The query.
+            k (int): The maximum number of results.
+
+        Returns:
+            List[Tuple[str, float]]: The (chunk ID, BM25 score) of the best chunks, best first.
+        """
+        self.__freeze()
+        num_docs = len(self._doc_lengths)
+        if num_docs == 0 or k <= 0:
+            return []
+        lengths = self._doc_lengths.astype("float32")
+        norms = self.k1 * (1 - self.b + self.b * lengths / max(float(lengths.mean()), 1.0))
+        scores = np.zeros(num_docs, dtype="float32")
+        hashes = np.asarray([self.term_hash(term) for term in set(self.tokenize(query))], dtype="uint64")
+        positions = np.searchsorted(self._term_hashes, hashes)
+        for term_hash, position in zip(hashes, positions):
+            if position >= len(self._term_hashes) or self._term_hashes[position] != term_hash:
+                continue
+            start, end = self._offsets[position], self._offsets[position + 1]
+            docs = self._postings[start:end]
+            frequencies = self._frequencies[start:end].astype("float32")
+            idf = math.log(1 + (num_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * frequencies * (self.k1 + 1) / (frequencies + norms[docs])
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.__doc_id(n), float(scores[n])) for n in matched]
+
+    def save(self, directory: str) -> None:
+        """
+        Write the index to a directory.
+
+        Parameters:
+            directory (str): The directory; the index is written to `FILE_NAME` in it.
+        """
+        self.__freeze()
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, self.FILE_NAME), "wb") as f:
+            np.savez(f, term_hashes=self._term_hashes, offsets=self._offsets, postings=self._postings,
+                     frequencies=self._frequencies, doc_lengths=self._doc_lengths,
+                     doc_id_bytes=self._doc_id_bytes, doc_id_offsets=self._doc_id_offsets)
+
+    @classmethod
+    def load(cls, directory: str, k1: float = 1.5, b: float = 0.75) -> Optional["LexicalIndex"]:
+        """
+        Read the index saved in a directory.
+
+        Parameters:
+            directory (str): The directory.
+            k1 (float): The BM25 term frequency saturation.
+            b (float): The BM25 document length normalization.
+
+        Returns:
+            Optional[LexicalIndex]: The index, or None if the directory holds none.
+        """
+        path = os.path.join(directory, cls.FILE_NAME)
+        if not os.path.exists(path):
+            return None
+        index = cls(k1=k1, b=b)
+        with np.load(path, allow_pickle=False) as arrays:
+            index._term_hashes = arrays["term_hashes"]
+            index._offsets = arrays["offsets"]
+            index._postings = arrays["postings"]
+            index._frequencies = arrays["frequencies"]
+            index._doc_lengths = arrays["doc_lengths"]
+            index._doc_id_bytes = arrays["doc_id_bytes"]
+            index._doc_id_offsets = arrays["doc_id_offsets"]
+        return index
@@ -1,5 +1,6 @@
 
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 import yaml
 from pyprojroot import here
@@ -27,29 +28,142 @@ class LoadConfig:
         persist_directory : str
             The path to the persist directory where data is stored.
         custom_persist_directory : str
-            The path to the custom persist directory.
+            The path to the custom persist directory, holding one upload index per session.
+        index_cache_max_bytes : int
+            The memory budget of the loaded indexes, in bytes.
+        upload_session_ttl : float
+            The time after which an unused session's upload index is deleted, in seconds.
+        upload_session_gc_interval : float
+            The time between two deletions of expired upload indexes, in seconds.
         embedding_model : OpenAIEmbeddings
             An instance of the OpenAIEmbeddings class for language model embeddings.
         data_directory : str
             The path to the data directory.
         k : int
             The value of 'k' specified in the retrieval configuration.
+        index_type : str
+            The FAISS index type (flat, ivf_flat, ivf_pq, hnsw, sq_fp16 or sq_int8).
+        index_params : dict
+            The build and search parameters of the index (nlist, nprobe, pq_m, pq_nbits, hnsw_m,
+            ef_construction, ef_search, retrain_growth).
+        hybrid_search : bool
+            Whether BM25 and vector rankings are fused with reciprocal-rank fusion.
+        hybrid_candidates : int
+            The number of hits of each ranking fed to the fusion.
+        rrf_k : int
+            The rank offset of reciprocal-rank fusion.
+        lexical_fast_path : bool
+            Whether short keyword queries are answered from BM25 alone, without embedding them.
+        keyword_max_terms : int
+            The maximum number of words of a keyword query.
         embedding_model_engine : str
-            The engine specified in the embedding model configuration.
+            The embedding engine specified in the embedding model configuration; it selects the
+            provider (see utils/embedding_providers.py).
         chunk_size : int
             The chunk size specified in the splitter configuration.
         chunk_overlap : int
             The chunk overlap specified in the splitter configuration.
+        extraction_max_workers : int
+            The number of worker processes used to extract uploaded documents.
+        extraction_pages_per_task : int
+            The number of PDF pages extracted per worker task.
+        extraction_page_timeout : float
+            The time allowed to extract a single page, in seconds.
+        extraction_cache_path : str
+            The path to the on-disk cache of extracted document text.
+        extraction_cache_max_bytes : int
+            The maximum size of the extraction cache, in bytes.
+        debug_dump_directory : str or None
+            The directory the chunks of every ingested file are dumped to, or None to disable the dump.
+        ingestion_max_workers : int
+            The number of uploads processed at the same time in the background.
+        ingestion_max_pending : int
+            The maximum number of uploads waiting to be processed.
+        ingestion_max_jobs_per_user : int
+            The maximum number of uploads of a chat session queued or processed at the same time.
+        ingestion_heartbeat : float
+            The maximum time between two progress updates of an upload, in seconds.
+        embedding_batch_size : int
+            The number of chunks sent per embedding request during ingestion.
+        embedding_max_concurrency : int
+            The maximum number of embedding requests in flight during ingestion.
+        embedding_requests_per_minute : float
+            The maximum rate of embedding requests.
+        embedding_max_retries : int
+            The number of retries of a failed embedding request.
+        embedding_backoff_base : float
+            The base delay of the retry backoff, in seconds.
+        embedding_backoff_max : float
+            The maximum delay between two retries, in seconds.
+        embedding_cache_path : str
+            The path to the on-disk embedding cache.
+        embedding_cache_max_entries : int
+            The maximum number of vectors kept in the embedding cache.
         max_final_token : int
             The maximum number of final tokens specified in the summarizer configuration.
         token_threshold : float
             The token threshold specified in the summarizer configuration.
         summarizer_llm_system_role : str
             The role of the summarizer language model system specified in the configuration.
+        window_token_budget : int
+            The maximum number of document tokens the summarizer sends per request.
+        window_token_overlap : int
+            The number of tokens each summarizer window repeats from the previous one.
+        summarizer_max_concurrency : int
+            The maximum number of page summarization requests in flight.
+        summarizer_reduce_token_limit : int
+            The maximum number of tokens sent in a single reduce request of the summarizer.
         temperature : float
             The temperature specified in the LLM configuration.
         number_of_q_a_pairs : int
             The number of question-answer pairs specified in the memory configuration.
+        max_history_tokens : int
+            The maximum number of tokens of conversation history sent to the model.
+        max_sessions : int
+            The maximum number of chat sessions whose memory is kept.
+        session_ttl : float
+            The time after which the memory of an idle chat session is dropped, in seconds.
+        answer_cache_enabled : bool
+            Whether answers generated at temperature 0 are cached.
+        answer_cache_similarity_threshold : float
+            The minimum cosine similarity for a near-duplicate question to reuse a cached answer.
+        answer_cache_max_entries : int
+            The maximum number of cached answers.
+        answer_cache_ttl : float
+            The lifetime of a cached answer, in seconds.
+        chat_concurrency_limit : int
+            The number of chat requests the Gradio queue processes at once.
+        default_concurrency_limit : int
+            The number of requests the Gradio queue processes at once for the other events.
+        max_queue_size : int
+            The maximum number of requests waiting in the Gradio queue.
+        telemetry_enabled : bool
+            Whether the pipeline stages are timed (see utils/telemetry.py).
+        metrics_host : str
+            The address the Prometheus metrics endpoint listens on.
+        metrics_port : int or None
+            The port of the Prometheus metrics endpoint, or None to disable it.
+        telemetry_json_log_path : str or None
+            The file every timed stage is appended to as a JSON line, "-" for the standard output,
+            or None to disable the JSON log.
+        api_timeout : float
+            The timeout of a request to a model provider, in seconds (see utils/api_clients.py).
+        api_max_retries : int
+            The number of retries of a failed request to a model provider.
+        api_backoff_base : float
+            The base delay of the retry backoff, in seconds.
+        api_backoff_max : float
+            The maximum delay between two attempts, in seconds.
+        api_failure_threshold : int
+            The number of consecutive failures after which the requests to a model are paused.
+        api_reset_timeout : float
+            The time the requests to a failing model are paused, in seconds.
+        api_max_connections : int
+            The maximum number of pooled connections per provider.
+        groq_base_url : str or None
+            The base URL of the Groq API, or None for the default.
+        voyage_base_url : str or None
+            The base URL of the Voyage API, or None for the default.
 
     Methods:
         load_openai_cfg():
@@ -76,28 +190,107 @@ class LoadConfig:
         # Retrieval configs
         self.data_directory = app_config["directories"]["data_directory"]
         self.k = app_config["retrieval_config"]["k"]
+        self.index_type = app_config["retrieval_config"].get("index_type", "flat")
+        self.index_params = {key: value for key, value in app_config["retrieval_config"].items()
+                             if key in ("nlist", "nprobe", "pq_m", "pq_nbits", "hnsw_m", "ef_construction", "ef_search",
+                                        "retrain_growth")}
+        self.hybrid_search = app_config["retrieval_config"]["hybrid"]
+        self.hybrid_candidates = app_config["retrieval_config"]["candidates"]
+        self.rrf_k = app_config["retrieval_config"]["rrf_k"]
+        self.lexical_fast_path = app_config["retrieval_config"]["lexical_fast_path"]
+        self.keyword_max_terms = app_config["retrieval_config"]["keyword_max_terms"]
         self.embedding_model_engine = app_config["embedding_model_config"]["engine"]
         self.chunk_size = app_config["splitter_config"]["chunk_size"]
         self.chunk_overlap = app_config["splitter_config"]["chunk_overlap"]
 
+        # Extraction configs
+        self.extraction_max_workers = app_config["extraction_config"]["max_workers"]
+        self.extraction_pages_per_task = app_config["extraction_config"]["pages_per_task"]
+        self.extraction_page_timeout = app_config["extraction_config"]["page_timeout"]
+        self.extraction_cache_path = str(here(
+            app_config["extraction_config"]["cache_path"]))
+        self.extraction_cache_max_bytes = int(app_config["extraction_config"]["cache_max_mb"] * 1024 * 1024)
+        debug_dump_directory = app_config["extraction_config"].get("debug_dump_directory")
+        self.debug_dump_directory = str(here(debug_dump_directory)) if debug_dump_directory else None
+
+        # Ingestion job queue configs
+        self.ingestion_max_workers = app_config["ingestion_config"]["max_workers"]
+        self.ingestion_max_pending = app_config["ingestion_config"]["max_pending"]
+        self.ingestion_max_jobs_per_user = app_config["ingestion_config"]["max_jobs_per_user"]
+        self.ingestion_heartbeat = app_config["ingestion_config"]["heartbeat"]
+
+        # Embedding scheduler configs
+        self.embedding_batch_size = app_config["embedding_scheduler_config"]["batch_size"]
+        self.embedding_max_concurrency = app_config["embedding_scheduler_config"]["max_concurrency"]
+        self.embedding_requests_per_minute = app_config["embedding_scheduler_config"]["requests_per_minute"]
+        self.embedding_max_retries = app_config["embedding_scheduler_config"]["max_retries"]
+        self.embedding_backoff_base = app_config["embedding_scheduler_config"]["backoff_base"]
+        self.embedding_backoff_max = app_config["embedding_scheduler_config"]["backoff_max"]
+
+        # Embedding cache configs
+        self.embedding_cache_path = str(here(
+            app_config["embedding_cache_config"]["cache_path"]))
+        self.embedding_cache_max_entries = app_config["embedding_cache_config"]["max_entries"]
+
         # Summarizer config
         self.max_final_token = app_config["summarizer_config"]["max_final_token"]
         self.token_threshold = app_config["summarizer_config"]["token_threshold"]
         self.summarizer_llm_system_role = app_config["summarizer_config"]["summarizer_llm_system_role"]
-        self.character_overlap = app_config["summarizer_config"]["character_overlap"]
+        self.window_token_budget = app_config["summarizer_config"]["window_token_budget"]
+        self.window_token_overlap = app_config["summarizer_config"]["window_token_overlap"]
+        self.summarizer_max_concurrency = app_config["summarizer_config"]["max_concurrency"]
+        self.summarizer_reduce_token_limit = app_config["summarizer_config"]["reduce_token_limit"]
         self.final_summarizer_llm_system_role = app_config[
             "summarizer_config"]["final_summarizer_llm_system_role"]
         self.temperature = app_config["llm_config"]["temperature"]
 
         # Memory
         self.number_of_q_a_pairs = app_config["memory"]["number_of_q_a_pairs"]
+        self.max_history_tokens = app_config["memory"]["max_history_tokens"]
+        self.max_sessions = app_config["memory"]["max_sessions"]
+        self.session_ttl = app_config["memory"]["session_ttl"]
+
+        # Index cache and upload session configs
+        self.index_cache_max_bytes = int(app_config["index_cache_config"]["max_memory_mb"] * 1024 * 1024)
+        self.upload_session_ttl = app_config["upload_session_config"]["ttl"]
+        self.upload_session_gc_interval = app_config["upload_session_config"]["gc_interval"]
+
+        # Answer cache configs
+        self.answer_cache_enabled = app_config["answer_cache_config"]["enabled"]
+        self.answer_cache_similarity_threshold = app_config["answer_cache_config"]["similarity_threshold"]
+        self.answer_cache_max_entries = app_config["answer_cache_config"]["max_entries"]
+        self.answer_cache_ttl = app_config["answer_cache_config"]["ttl"]
+
+        # Serve configs
+        self.chat_concurrency_limit = app_config["serve"]["chat_concurrency_limit"]
+        self.default_concurrency_limit = app_config["serve"]["default_concurrency_limit"]
+        self.max_queue_size = app_config["serve"]["max_queue_size"]
+
+        # Telemetry configs
+        self.telemetry_enabled = app_config["telemetry_config"]["enabled"]
+        self.metrics_host = app_config["telemetry_config"]["metrics_host"]
+        self.metrics_port = app_config["telemetry_config"]["metrics_port"]
+        json_log_path = app_config["telemetry_config"]["json_log_path"]
+        self.telemetry_json_log_path = str(here(json_log_path)) if json_log_path and json_log_path != "-" \
+            else json_log_path
+
+        # API client configs
+        self.api_timeout = app_config["api_client_config"]["timeout"]
+        self.api_max_retries = app_config["api_client_config"]["max_retries"]
+        self.api_backoff_base = app_config["api_client_config"]["backoff_base"]
+        self.api_backoff_max = app_config["api_client_config"]["backoff_max"]
+        self.api_failure_threshold = app_config["api_client_config"]["failure_threshold"]
+        self.api_reset_timeout = app_config["api_client_config"]["reset_timeout"]
+        self.api_max_connections = app_config["api_client_config"]["max_connections"]
+        self.groq_base_url = app_config["api_client_config"]["groq_base_url"]
+        self.voyage_base_url = app_config["api_client_config"]["voyage_base_url"]
 
         # Load OpenAI credentials
         # self.load_openai_cfg()
 
-        # clean up the upload doc vectordb if it exists
+        # The upload doc vectordb is updated incrementally, so it is kept between runs
         self.create_directory(self.persist_directory)
-        self.remove_directory(self.custom_persist_directory)
+        self.create_directory(self.custom_persist_directory)
 
     def load_llm_cfg(self):
         """
@@ -148,4 +341,18 @@ class LoadConfig:
             except OSError as e:
                 print(f"Error: {e}")
         else:
-            print(f"The directory '{directory_path}' does not exist.")
\ No newline at end of file
+            print(f"The directory '{directory_path}' does not exist.")
+
+
+@lru_cache(maxsize=None)
+def get_config() -> LoadConfig:
+    """
+    Return the process-wide configuration, loading config/app_config.yaml on first use.
+
+    Every module shares this object, so the YAML file is parsed and the directories are set up only
+    once per process.
+
+    Returns:
+        LoadConfig: The configuration.
+    """
+    return LoadConfig()
\ No newline at end of file
@@ -0,0 +1,272 @@
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.doc_parser import DocumentClassifier
+from utils.extraction_cache import ExtractionCache
+from utils.telemetry import Telemetry
+
+
+def _extract_pdf_pages(document: str, start: int, end: int) -> List[str]:
+    """
+    Extract a range of PDF pages. Runs in a worker process.
+
+    Parameters:
+        document (str): The path to the PDF file.
+        start (int): The index of the first page to extract (0-based).
+        end (int): The index after the last page to extract.
+
+    Returns:
+        List[str]: The text of each page in the range.
+    """
+    return DocumentClassifier(document=document).pdf_get_pages(start, end)
+
+
+def _extract_file(document: str) -> str:
+    """
+    Extract a whole (non-PDF) file. Runs in a worker process.
+
+    Parameters:
+        document (str): The path to the file.
+
+    Returns:
+        str: The extracted content.
+    """
+    return DocumentClassifier(document=document).process_file()
+
+
+class ParallelExtractor:
+    """
+    Extract the text of several documents across a pool of worker processes.
+
+    PDF files are split into page ranges of `pages_per_task` pages and every range is extracted in
+    its own task; other file types are extracted as a single task. Results are returned in the
+    order of the input files and pages regardless of the order in which tasks finish. A page range
+    that fails or does not finish within `page_timeout` seconds per page yields empty pages instead
+    of failing the whole upload; the worker processes are then terminated, so a page the parser is
+    stuck on does not keep a CPU busy, and the tasks not done yet are run in a new pool.
+
+    With an extraction cache, documents whose content was already extracted are not parsed again;
+    documents extracted without errors are added to it.
+
+    Attributes:
+        max_workers (int): The number of worker processes.
+        pages_per_task (int): The number of PDF pages extracted per task.
+        page_timeout (float): The time allowed per page, in seconds.
+        extraction_cache (ExtractionCache, optional): Cache of previously extracted documents.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, pages_per_task: int = 8, page_timeout: float = 30,
+                 extraction_cache: Optional[ExtractionCache] = None) -> None:
+        """
+        Initialize the ParallelExtractor.
+
+        Parameters:
+            max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+            pages_per_task (int): The number of PDF pages extracted per task.
+            page_timeout (float): The time allowed per page, in seconds.
+            extraction_cache (ExtractionCache, optional): Cache of previously extracted documents.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = max(1, pages_per_task)
+        self.page_timeout = page_timeout
+        self.extraction_cache = extraction_cache
+
+    def __plan(self, documents: List[str], cached: Dict[int, List[Tuple[int, str]]]) -> List[tuple]:
+        """
+        Split the documents into extraction tasks.
+
+        Parameters:
+            documents (List[str]): The paths of the files to extract.
+            cached (Dict[int, List[Tuple[int, str]]]): The pages of the documents found in the
+                extraction cache, by document index; these get no task.
+
+        Returns:
+            List[tuple]: One (document index, function, arguments, number of pages) tuple per task,
+            in document and page order.
+        """
+        tasks = []
+        for doc_index, document in enumerate(documents):
+            if doc_index in cached:
+                continue
+            if os.path.splitext(document)[1].lower() == ".pdf":
+                num_pages = DocumentClassifier(document=document).pdf_num_pages()
+                for start in range(0, num_pages, self.pages_per_task):
+                    end = min(start + self.pages_per_task, num_pages)
+                    tasks.append((doc_index, _extract_pdf_pages, (document, start, end), end - start))
+            else:
+                tasks.append((doc_index, _extract_file, (document,), 1))
+        return tasks
+
+    def __submit(self, tasks: List[tuple], first: int,
+                 futures: Dict[int, Future]) -> Tuple[ProcessPoolExecutor, Dict[int, Future], Dict[int, float]]:
+        """
+        Start a pool of worker processes and submit the tasks from `first` on that have no result yet.
+
+        Every task gets a deadline counted from now: the time its pages are allowed, plus the time
+        the tasks submitted before it may keep all the workers busy. Tasks are started in order, so
+        a task that misses its deadline took more than `page_timeout` per page itself or made one
+        of the tasks before it miss its own.
+
+        Parameters:
+            tasks (List[tuple]): The extraction tasks, as returned by `__plan`.
+            first (int): The index of the first task to run.
+            futures (Dict[int, Future]): The futures of the tasks after `first` that already finished.
+
+        Returns:
+            Tuple[ProcessPoolExecutor, Dict[int, Future], Dict[int, float]]: The pool, the futures of
+            the tasks from `first` on and the deadlines (in `time.monotonic` time) of the submitted ones.
+        """
+        to_run = [index for index in range(first, len(tasks)) if index not in futures]
+        workers = min(self.max_workers, len(to_run))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        futures, deadlines = dict(futures), {}
+        start, pages_before = time.monotonic(), 0
+        for index in to_run:
+            _, function, args, num_pages = tasks[index]
+            futures[index] = executor.submit(function, *args)
+            deadlines[index] = start + self.page_timeout * (pages_before / workers + num_pages)
+            pages_before += num_pages
+        return executor, futures, deadlines
+
+    @staticmethod
+    def __terminate(executor: ProcessPoolExecutor) -> None:
+        """
+        Shut a pool down without waiting for its running tasks, and kill its worker processes.
+
+        Parameters:
+            executor (ProcessPoolExecutor): The pool.
+        """
+        # The processes are looked up before shutting down, which forgets them.
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def __run(self, tasks: List[tuple]) -> Iterator:
+        """
+        Run the extraction tasks and yield their results in task order.
+
+        Parameters:
+            tasks (List[tuple]): The extraction tasks, as returned by `__plan`.
+
+        Yields:
+            Tuple: The result of each task, in task order, and whether the task failed (in which
+            case the result holds empty pages).
+        """
+        if len(tasks) <= 1 or self.max_workers == 1:
+            # Not worth starting worker processes.
+            for _, function, args, _ in tasks:
+                yield function(*args), False
+            return
+
+        executor, futures, deadlines = self.__submit(tasks, 0, {})
+        try:
+            for index, (doc_index, function, args, num_pages) in enumerate(tasks):
+                if index not in futures:
+                    # Resubmitted after a timeout, with new deadlines
+                    executor, futures, deadlines = self.__submit(tasks, index, futures)
+                future = futures.pop(index)
+                if index in deadlines:
+                    wait([future], timeout=max(0.0, deadlines[index] - time.monotonic()))
+                if not future.done():
+                    print(f"Timed out extracting {args}; its pages are skipped.")
+                    result, failed = [""] * num_pages if function is _extract_pdf_pages else "", True
+                    # Keep the results that are in, and stop the workers: one of them is stuck.
+                    futures = {later: later_future for later, later_future in futures.items() if later_future.done()}
+                    self.__terminate(executor)
+                    deadlines = {}
+                else:
+                    try:
+                        result, failed = future.result(), False
+                    except ValueError:
+                        raise
+                    except Exception as e:
+                        print(f"Error extracting {args}: {e}")
+                        result, failed = [""] * num_pages if function is _extract_pdf_pages else "", True
+                yield result, failed
+        finally:
+            # Tasks still running are not needed any more (the extraction failed or was aborted).
+            self.__terminate(executor)
+
+    def extract_pages(self, documents: List[str],
+                      content_hashes: Optional[List[str]] = None) -> Iterator[List[Tuple[int, str]]]:
+        """
+        Extract the pages of the documents, one document at a time.
+
+        All tasks are submitted up front; the pages of a document are yielded as soon as the
+        document and all documents before it are extracted. Cached documents are not parsed.
+
+        Parameters:
+            documents (List[str]): The paths of the files to extract.
+            content_hashes (List[str], optional): The SHA-256 hex digests of the files, if already
+                known; used for the extraction cache keys.
+
+        Yields:
+            List[Tuple[int, str]]: The (page number, text) pairs of each document, in the order of
+            `documents`. Files other than PDFs are returned as a single page.
+
+        Raises:
+            ValueError: If one of the files has an unsupported type.
+        """
+        documents = [str(document) for document in documents]
+        keys, cached = [None] * len(documents), {}
+        if self.extraction_cache is not None:
+            for doc_index, document in enumerate(documents):
+                keys[doc_index] = ExtractionCache.make_key(
+                    document, content_hashes[doc_index] if content_hashes else None)
+                pages = self.extraction_cache.get(keys[doc_index])
+                if pages is not None:
+                    print(f"Extraction cache: reusing the extracted text of {document}")
+                    cached[doc_index] = pages
+        tasks = self.__plan(documents, cached)
+        results = self.__run(tasks)
+        task_index = 0
+        for doc_index, document in enumerate(documents):
+            # The span only covers waiting for this document: documents after it are extracted meanwhile.
+            with Telemetry.span("extract", documents=1, bytes=os.path.getsize(document)) as span:
+                if doc_index in cached:
+                    pages = cached[doc_index]
+                    span.add(cache_hits=1)
+                else:
+                    pages, complete = [], True
+                    while task_index < len(tasks) and tasks[task_index][0] == doc_index:
+                        _, function, args, _ = tasks[task_index]
+                        result, failed = next(results)
+                        complete = complete and not failed
+                        if function is _extract_pdf_pages:
+                            pages.extend(zip(range(args[1] + 1, args[2] + 1), result))
+                        else:
+                            pages.append((1, result))
+                        task_index += 1
+                    # Failed or empty extractions are not cached, so they are retried next time.
+                    if keys[doc_index] is not None and complete and any(text for _, text in pages):
+                        self.extraction_cache.put(keys[doc_index], pages)
+                    if keys[doc_index] is not None:
+                        span.add(cache_misses=1)
+                span.add(pages=len(pages), characters=sum(len(text) for _, text in pages))
+            yield pages
+
+    def extract(self, documents: List[str]) -> List[str]:
+        """
+        Extract the content of the documents.
+
+        Parameters:
+            documents (List[str]): The paths of the files to extract.
+
+        Returns:
+            List[str]: The extracted content of each document, in the order of `documents`, in the
+            same format as `DocumentClassifier.process_file`.
+
+        Raises:
+            ValueError: If one of the files has an unsupported type.
+        """
+        contents = []
+        for document, pages in zip(documents, self.extract_pages(documents)):
+            if os.path.splitext(str(document))[1].lower() == ".pdf":
+                contents.append(DocumentClassifier.join_pdf_pages([text for _, text in pages]))
+            else:
+                contents.append(pages[0][1] if pages else "")
+        return contents
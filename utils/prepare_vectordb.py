@@ -1,14 +1,24 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.text_splitter import CharacterTextSplitter
+import json
 import os
-from typing import List
-from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_voyageai import VoyageAIEmbeddings
+from collections import defaultdict
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from utils.doc_parser import DocumentClassifier
-from dotenv import load_dotenv
+from utils.parallel_extract import ParallelExtractor
+from utils.chunker import DocumentChunker
+from utils.embedding_cache import EmbeddingCache, CachedEmbeddings
+from utils.embedding_providers import EmbeddingMismatchError, provider_for
+from utils.api_clients import ClientFactory
+from utils.embedding_scheduler import EmbeddingScheduler, ScheduledEmbeddings
+from utils.index_manifest import IndexManifest
+from utils.index_generations import IndexGenerations
+from utils.docstore import VectorDBFiles
+from utils.lexical_index import LexicalIndex
+from utils.telemetry import Telemetry
+from utils.index_factory import (DEFAULT_INDEX_PARAMS, compact_index, index_type_of, min_training_vectors,
+                                 rebuild_index, supports_compacting_removal)
 
 class PrepareVectorDB:
     """
@@ -17,20 +27,59 @@ class PrepareVectorDB:
     This class facilitates the process of loading documents, chunking them, and creating a VectorDB
     with OpenAI embeddings. It provides methods to prepare and save the VectorDB.
 
+    The VectorDB is maintained incrementally: a manifest of the ingested files (see IndexManifest) is
+    kept next to the index, unchanged files are skipped, changed files are re-chunked and their old
+    vectors replaced, and the vectors of files that are gone are removed by ID.
+
+    Every save writes a new generation of the persist directory and switches to it at once (see
+    IndexGenerations), so the chat side never loads files of two different saves.
+
+    The vectors are first added to a flat index; before saving, the index is rebuilt as the configured
+    `index_type` (see utils/index_factory.py) once there are enough vectors to train it. Later additions
+    go straight into the trained index.
+
+    A BM25 inverted index of the chunks (see LexicalIndex) is maintained next to the FAISS index,
+    under the same chunk IDs, and updated incrementally with it.
+
+    CSV and XLSX files are streamed row by row rather than extracted as a whole (see
+    `DocumentChunker.chunk_table`), and the chunks of every file are embedded and added in batches
+    of `ADD_BATCH_SIZE`, so the size of a single upload does not bound the memory used to ingest it.
+
+    Every ingestion is traced (see Telemetry): an "ingest" span encloses the "extract", "chunk",
+    "embed" and "index_add" spans of every batch and the "index_build" and "index_save" spans.
+
     Parameters:
         data_directory (str or List[str]): The directory or list of directories containing the documents.
         persist_directory (str): The directory to save the VectorDB.
-        embedding_model_engine (str): The engine for OpenAI embeddings.
         chunk_size (int): The size of the chunks for document processing.
         chunk_overlap (int): The overlap between chunks.
+        embedding_cache (EmbeddingCache, optional): Cache of previously computed chunk embeddings.
+        extractor (ParallelExtractor, optional): Extracts uploaded documents across worker processes.
+        embedding_scheduler (EmbeddingScheduler, optional): Batches, parallelizes and rate-limits embedding requests.
+        index_type (str): The FAISS index type.
+        index_params (Dict, optional): The build and search parameters of the index.
+        embedding_model_engine (str): The embedding engine (see utils/embedding_providers.py).
+        debug_dump_directory (str, optional): If set, the chunks of every ingested file are written there
+            as JSON lines, for inspection.
+        progress_callback (Callable, optional): Called with (stage, done, total) as files are parsed,
+            chunks embedded and the index written; it may raise to abort before anything is saved.
     """
+    ADD_BATCH_SIZE = 512
 
     def __init__(
             self,
             data_directory: str,
             persist_directory: str,
             chunk_size: int,
-            chunk_overlap: int
+            chunk_overlap: int,
+            embedding_cache: EmbeddingCache = None,
+            extractor: ParallelExtractor = None,
+            embedding_scheduler: EmbeddingScheduler = None,
+            index_type: str = "flat",
+            index_params: Dict = None,
+            embedding_model_engine: str = "voyage-large-2-instruct",
+            debug_dump_directory: Optional[str] = None,
+            progress_callback: Optional[Callable[[str, int, Optional[int]], None]] = None
     ) -> None:
         """
         Initialize the PrepareVectorDB instance.
@@ -38,95 +87,489 @@ class PrepareVectorDB:
         Parameters:
             data_directory (str or List[str]): The directory or list of directories containing the documents.
             persist_directory (str): The directory to save the VectorDB.
-            embedding_model_engine (str): The engine for OpenAI embeddings.
             chunk_size (int): The size of the chunks for document processing.
             chunk_overlap (int): The overlap between chunks.
+            embedding_cache (EmbeddingCache, optional): Cache of previously computed chunk embeddings.
+                Only chunks missing from the cache are sent to the embedding model.
+            extractor (ParallelExtractor, optional): Extracts uploaded documents across worker processes.
+                Defaults to extracting them one after another in this process.
+            embedding_scheduler (EmbeddingScheduler, optional): Batches, parallelizes and rate-limits the
+                embedding requests. Defaults to a single request per file.
+            index_type (str): The FAISS index type: flat, ivf_flat, ivf_pq, hnsw, sq_fp16 or sq_int8.
+            index_params (Dict, optional): The build and search parameters of the index (nlist, nprobe,
+                pq_m, pq_nbits, hnsw_m, ef_construction, ef_search, retrain_growth).
+            embedding_model_engine (str): The embedding engine, e.g. "voyage-large-2-instruct",
+                "models/embedding-001", "NV-Embed-QA" or "hashing-1024" (see utils/embedding_providers.py).
+            debug_dump_directory (str, optional): If set, the chunks of every ingested file are written to
+                "<file name>.chunks.jsonl" in this directory, with their IDs and metadata. Off by default.
+            progress_callback (Callable, optional): Called with (stage, done, total): ("files", files
+                parsed, number of files), ("chunks", chunks embedded, None) and ("index", 0 or 1, 1). It
+                is called between batches and before the index is written, so an exception it raises
+                (e.g. to cancel ingestion) leaves the saved VectorDB untouched.
 
         """
 
         
-        self.text_splitter = CharacterTextSplitter(
-            separator="\n",
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        """Other options: CharacterTextSplitter, TokenTextSplitter, etc."""
+        self.chunker = DocumentChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         self.data_directory = data_directory
         self.persist_directory = persist_directory
         
-        self.embedding = VoyageAIEmbeddings
-        # self.embedding = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        self.embedding_model_engine = embedding_model_engine
+        self.embedding_cache = embedding_cache
+        self.extractor = extractor or ParallelExtractor(max_workers=1)
+        self.embedding_scheduler = embedding_scheduler
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.debug_dump_directory = debug_dump_directory
+        self.progress_callback = progress_callback
 
 
 
-    def __load_all_documents(self) -> List:
+    def __list_files(self) -> List[str]:
         """
-        Load all documents from the specified directory or directories.
+        List the files to ingest.
 
         Returns:
-            List: A list of loaded documents.
+            List[str]: The uploaded file paths, or the files of the data directory.
+        """
+        if isinstance(self.data_directory, list):
+            return [str(doc_dir) for doc_dir in self.data_directory]
+        return [os.path.join(self.data_directory, doc_name)
+                for doc_name in sorted(os.listdir(self.data_directory))]
+
+    @staticmethod
+    def __load_pdf_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+        """
+        Lazily load the pages of a PDF with PyPDFLoader.
+
+        Parameters:
+            file_path (str): The path to the PDF file.
+
+        Yields:
+            Tuple[int, str]: The page number (1-based) and text of each page.
+        """
+        from langchain_community.document_loaders import PyPDFLoader
+        for doc in PyPDFLoader(file_path).lazy_load():
+            yield doc.metadata.get("page", 0) + 1, doc.page_content
+
+    def __load_all_documents(self, file_paths: List[str],
+                             content_hashes: List[str]) -> Iterator[Iterator[Tuple[int, str]]]:
+        """
+        Load the given documents, one at a time.
+
+        Parameters:
+            file_paths (List[str]): The paths of the files to load.
+            content_hashes (List[str]): The hashes of the files' content, used as extraction cache keys.
+
+        Yields:
+            Iterator[Tuple[int, str]]: The (page number, text) pairs of each file, in the order of `file_paths`.
         """
-        doc_counter = 0
         if isinstance(self.data_directory, list):
             print("Loading the uploaded documents...")
-            docs = []
-            
-            for doc_dir in self.data_directory:
-                print(doc_dir)
-                doc_loader = DocumentClassifier(document=str(doc_dir))
-                doc = doc_loader.process_file()
-                docs.append(doc)
-                doc_counter += 1
-            print("Number of loaded documents:", doc_counter)
-            print("Number of pages:", len(docs), "\n\n")
+            print(file_paths)
+            for pages in self.extractor.extract_pages(file_paths, content_hashes):
+                yield iter(pages)
         else:
             print("Loading documents manually...")
-            document_list = os.listdir(self.data_directory)
-            docs = []
-            for doc_name in document_list:
-                docs.extend(PyPDFLoader(os.path.join(
-                    self.data_directory, doc_name)).load())
-                doc_counter += 1
-            print("Number of loaded documents:", doc_counter)
-            # print("Number of pages:", len(docs), "\n\n")
-        with open ('list.txt','w') as f:
-            f.write(str(docs))
-        return docs
-
-    def __chunk_documents(self, docs: List) -> List:
-        """
-        Chunk the loaded documents using the specified text splitter.
+            for doc_dir in file_paths:
+                yield self.__load_pdf_pages(doc_dir)
+
+    def __chunk_documents(self, file_key: str, pages: Iterator[Tuple[int, str]]) -> Iterator:
+        """
+        Chunk the pages of a document, keeping their source and page metadata.
+
+        Parameters:
+            file_key (str): The name of the document, recorded as the source of every chunk.
+            pages (Iterator[Tuple[int, str]]): The (page number, text) pairs of the document.
+
+        Returns:
+            Iterator: The chunks of the document, as Documents.
+
+        """
+        return self.chunker.chunk_pages(file_key, pages)
+
+    def __chunk_table(self, file_key: str, file_path: str) -> Iterator:
+        """
+        Stream the rows of a spreadsheet into row-group chunks, keeping their sheet and row range.
 
         Parameters:
-            docs (List): The list of loaded documents.
+            file_key (str): The name of the document, recorded as the source of every chunk.
+            file_path (str): The path to the CSV or XLSX file.
 
         Returns:
-            List: A list of chunked documents.
+            Iterator: The chunks of the document, as Documents.
+        """
+        return self.chunker.chunk_table(file_key, DocumentClassifier(document=file_path).iter_table_rows())
+
+    def __report(self, stage: str, done: int, total: Optional[int] = None) -> None:
+        """
+        Report ingestion progress to the progress callback, if any.
+        """
+        if self.progress_callback is not None:
+            self.progress_callback(stage, done, total)
 
+    def __open_debug_dump(self, file_key: str):
         """
+        Open the debug dump of a file's chunks, if dumping is enabled.
+
+        Parameters:
+            file_key (str): The name of the document.
+
+        Returns:
+            The open text file, or None if `debug_dump_directory` is not set.
+        """
+        if not self.debug_dump_directory:
+            return None
+        os.makedirs(self.debug_dump_directory, exist_ok=True)
+        return open(os.path.join(self.debug_dump_directory, f"{file_key}.chunks.jsonl"), "w", encoding="utf-8")
+
+    def __get_embedding(self):
+        """
+        Create the embedding model used to embed the chunks, around the shared client of the engine.
+
+        Returns:
+            Embeddings: The embedding model, going through the embedding scheduler and backed by the
+            embedding cache if they were given.
+        """
+        embedding = ClientFactory.embedding(self.embedding_model_engine)
+        if self.embedding_scheduler is not None:
+            embedding = ScheduledEmbeddings(embedding, self.embedding_scheduler)
+        if self.embedding_cache is not None:
+            embedding = CachedEmbeddings(embedding, self.embedding_cache)
+        return embedding
+
+    def __load_vectordb(self, embedding, manifest: IndexManifest) -> Optional[FAISS]:
+        """
+        Load the existing VectorDB from the persist directory.
+
+        Indexes saved in the former pickle format or built with another embedding model are not
+        loaded; their files are re-ingested.
+
+        Parameters:
+            embedding (Embeddings): The embedding model of the VectorDB.
+            manifest (IndexManifest): The manifest of the VectorDB, emptied if no VectorDB can be loaded.
+
+        Returns:
+            Optional[FAISS]: The VectorDB, or None if none was saved yet.
+        """
+        try:
+            manifest.check_embedding(self.embedding_model_engine)
+        except EmbeddingMismatchError:
+            print(f"The embedding model changed from '{manifest.embedding['engine']}' to "
+                  f"'{self.embedding_model_engine}', re-ingesting all files.")
+            manifest.files.clear()
+            return None
+        vectordb = VectorDBFiles.load_for_update(self.persist_directory, embedding)
+        if vectordb is None and (manifest.files or VectorDBFiles.is_legacy(self.persist_directory)):
+            print("No VectorDB in the current format was found, re-ingesting all files.")
+            manifest.files.clear()
+        return vectordb
+
+    def __load_lexical_index(self, vectordb: Optional[FAISS]) -> LexicalIndex:
+        """
+        Load the inverted index of the VectorDB, building it from the docstore if it was never saved.
+
+        Parameters:
+            vectordb (Optional[FAISS]): The loaded VectorDB, or None if there is none.
+
+        Returns:
+            LexicalIndex: The inverted index.
+        """
+        if vectordb is None:
+            return LexicalIndex()
+        lexical_index = LexicalIndex.load(IndexGenerations.current(self.persist_directory))
+        if lexical_index is None:
+            print("Building the lexical index of the existing chunks...")
+            lexical_index = LexicalIndex()
+            doc_ids = list(vectordb.index_to_docstore_id.values())
+            lexical_index.add(doc_ids, (vectordb.docstore.search(doc_id).page_content for doc_id in doc_ids))
+        return lexical_index
+
+    def __save_vectordb(self, vectordb: FAISS, lexical_index: LexicalIndex, manifest: IndexManifest) -> None:
+        """
+        Save the VectorDB, its inverted index and its manifest to the persist directory.
+
+        All the files are written to a new generation, which is then made current in one step, so
+        readers never load a half-written index or mix files of two saves.
+
+        Parameters:
+            vectordb (FAISS): The VectorDB to save.
+            lexical_index (LexicalIndex): The inverted index of the VectorDB.
+            manifest (IndexManifest): The manifest describing the VectorDB.
+        """
+        self.__report("index", 0, 1)
+        with Telemetry.span("index_build", vectors=vectordb.index.ntotal):
+            self.__fit_index(vectordb, manifest)
+        manifest.embedding = {"engine": self.embedding_model_engine,
+                              "provider": provider_for(self.embedding_model_engine),
+                              "dimension": vectordb.index.d}
+        with Telemetry.span("index_save", vectors=vectordb.index.ntotal) as span:
+            generation = IndexGenerations.create(self.persist_directory)
+            VectorDBFiles.save(vectordb, generation)
+            lexical_index.save(generation)
+            manifest.save(generation)
+            for file_name in os.listdir(generation):
+                span.add(bytes=os.path.getsize(os.path.join(generation, file_name)))
+            IndexGenerations.publish(self.persist_directory, generation)
+        self.__report("index", 1, 1)
+
+    def __fit_index(self, vectordb: FAISS, manifest: IndexManifest) -> None:
+        """
+        Rebuild the index of the VectorDB as the configured index type, if it is not already of that type
+        and there are enough vectors to train it.
+
+        An index that needs training (IVF) is also retrained once it holds `retrain_growth` times
+        the vectors it was trained on, so its lists keep up with the corpus: an index trained early
+        has few lists (see `ivf_nlist`) and centroids fitted to the first documents only.
+
+        Parameters:
+            vectordb (FAISS): The VectorDB whose index is rebuilt in place.
+            manifest (IndexManifest): The manifest of the VectorDB, in which the number of vectors the
+                index is trained on is recorded.
+        """
+        current_type = index_type_of(vectordb.index)
+        num_vectors = vectordb.index.ntotal
+        if current_type == self.index_type:
+            if not min_training_vectors(self.index_type, num_vectors, self.index_params):
+                return
+            trained = (manifest.index or {}).get("trained_vectors")
+            if not trained:
+                # Trained before the size was recorded: count the growth from now on.
+                manifest.index = {"type": self.index_type, "trained_vectors": num_vectors}
+                return
+            growth = self.index_params.get("retrain_growth", DEFAULT_INDEX_PARAMS["retrain_growth"])
+            if num_vectors < trained * growth:
+                return
+            print(f"The '{current_type}' index grew from {trained} to {num_vectors} vectors, retraining it...")
+        elif num_vectors < max(1, min_training_vectors(self.index_type, num_vectors, self.index_params)):
+            return
+        else:
+            print(f"Rebuilding the '{current_type}' index as '{self.index_type}'...")
+        # Positions are kept, so index_to_docstore_id stays valid.
+        vectordb.index = rebuild_index(vectordb.index, np.arange(num_vectors), self.index_type, self.index_params)
+        manifest.index = {"type": self.index_type, "trained_vectors": num_vectors}
+
+    def __delete(self, vectordb: FAISS, ids: List[str]) -> None:
+        """
+        Delete vectors by chunk ID.
+
+        Index types whose removal does not renumber the remaining vectors (IVF, HNSW) are compacted
+        into a copy of the index instead, so positions keep matching index_to_docstore_id.
+
+        Parameters:
+            vectordb (FAISS): The VectorDB to delete from.
+            ids (List[str]): The chunk IDs to delete.
+        """
+        present = set(vectordb.index_to_docstore_id.values())
+        ids = [doc_id for doc_id in ids if doc_id in present]
+        if not ids:
+            return
+        if supports_compacting_removal(vectordb.index):
+            vectordb.delete(ids)
+            return
+        removed = set(ids)
+        keep = [position for position, doc_id in sorted(vectordb.index_to_docstore_id.items())
+                if doc_id not in removed]
+        vectordb.index = compact_index(vectordb.index, np.asarray(keep, dtype="int64"))
+        vectordb.docstore.delete(ids)
+        vectordb.index_to_docstore_id = {position: vectordb.index_to_docstore_id[old_position]
+                                         for position, old_position in enumerate(keep)}
+
+    def __add(self, vectordb: Optional[FAISS], lexical_index: LexicalIndex, manifest: IndexManifest, embedding,
+              file_paths: List[str]) -> Optional[FAISS]:
+        """
+        Chunk, embed and add files to the VectorDB, skipping the ones that did not change.
+
+        Parameters:
+            vectordb (Optional[FAISS]): The VectorDB to add to, or None to create one.
+            lexical_index (LexicalIndex): The inverted index of the VectorDB.
+            manifest (IndexManifest): The manifest of the VectorDB.
+            embedding (Embeddings): The embedding model.
+            file_paths (List[str]): The paths of the files to add.
+
+        Returns:
+            Optional[FAISS]: The updated VectorDB.
+
+        Raises:
+            ValueError: If files with the same name but different content are given: files are
+                tracked by name, so one would silently replace the other.
+        """
+        hashes = defaultdict(dict)
+        for file_path in file_paths:
+            hashes[IndexManifest.file_key(file_path)].setdefault(IndexManifest.file_hash(file_path), file_path)
+        duplicates = sorted(file_key for file_key, versions in hashes.items() if len(versions) > 1)
+        if duplicates:
+            raise ValueError(f"Several different files are named {', '.join(map(repr, duplicates))}; "
+                             "please rename them or add them separately.")
+        pending = {}
+        for file_key, versions in hashes.items():
+            content_hash, file_path = next(iter(versions.items()))
+            if manifest.is_unchanged(file_key, content_hash):
+                print(f"Skipping unchanged file: {file_key}")
+                continue
+            pending[file_key] = (file_path, content_hash)
+        if not pending:
+            return vectordb
+
+        # Changed files replace their previous version.
+        vectordb = self.__remove(vectordb, lexical_index, manifest,
+                                 [file_key for file_key in pending if file_key in manifest.files])
+
         print("Chunking documents...")
-        chunked_documents = self.text_splitter.split_text(str(docs))
-        print("Number of chunks:", len(chunked_documents), "\n\n")
-        return chunked_documents
+        num_chunks_total = 0
+        tables = {file_key for file_key, (file_path, _) in pending.items()
+                  if DocumentClassifier(document=file_path).is_table()}
+        docs = self.__load_all_documents(
+            [file_path for file_key, (file_path, _) in pending.items() if file_key not in tables],
+            [content_hash for file_key, (_, content_hash) in pending.items() if file_key not in tables])
+        # Files are chunked and embedded one at a time, and every file in batches of ADD_BATCH_SIZE
+        # chunks, so only one batch of chunks is held in memory.
+        try:
+            self.__report("files", 0, len(pending))
+            for files_done, (file_key, (file_path, content_hash)) in enumerate(pending.items(), start=1):
+                if file_key in tables:
+                    chunks = self.__chunk_table(file_key, file_path)
+                else:
+                    chunks = self.__chunk_documents(file_key, next(docs))
+                num_chunks = 0
+                dump = self.__open_debug_dump(file_key)
+                try:
+                    while True:
+                        with Telemetry.span("chunk") as span:
+                            batch = list(islice(chunks, self.ADD_BATCH_SIZE))
+                            span.add(chunks=len(batch))
+                        if not batch:
+                            break
+                        ids = IndexManifest.chunk_ids_for(file_key, len(batch), start=num_chunks)
+                        if dump is not None:
+                            dump.writelines(json.dumps({"id": chunk_id, "metadata": chunk.metadata,
+                                                        "page_content": chunk.page_content}, ensure_ascii=False) + "\n"
+                                            for chunk_id, chunk in zip(ids, batch))
+                        texts = [chunk.page_content for chunk in batch]
+                        with Telemetry.span("embed", chunks=len(texts), characters=sum(map(len, texts))):
+                            vectors = embedding.embed_documents(texts)
+                        with Telemetry.span("index_add", vectors=len(vectors)):
+                            text_embeddings = list(zip(texts, vectors))
+                            metadatas = [chunk.metadata for chunk in batch]
+                            if vectordb is None:
+                                vectordb = FAISS.from_embeddings(text_embeddings, embedding, metadatas=metadatas, ids=ids)
+                            else:
+                                vectordb.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+                            lexical_index.add(ids, texts)
+                        num_chunks += len(batch)
+                        self.__report("chunks", num_chunks_total + num_chunks)
+                finally:
+                    if dump is not None:
+                        dump.close()
+                manifest.add(file_key, file_path, content_hash, num_chunks)
+                num_chunks_total += num_chunks
+                self.__report("files", files_done, len(pending))
+        finally:
+            # Stops the extraction of the remaining files if ingestion is aborted.
+            docs.close()
+        print("Number of loaded documents:", len(pending))
+        print("Number of chunks:", num_chunks_total, "\n\n")
+        return vectordb
+
+    def __remove(self, vectordb: Optional[FAISS], lexical_index: LexicalIndex, manifest: IndexManifest,
+                 file_keys: List[str]) -> Optional[FAISS]:
+        """
+        Remove the vectors of files from the VectorDB.
+
+        Parameters:
+            vectordb (Optional[FAISS]): The VectorDB to remove from.
+            lexical_index (LexicalIndex): The inverted index of the VectorDB.
+            manifest (IndexManifest): The manifest of the VectorDB.
+            file_keys (List[str]): The manifest keys of the files to remove.
+
+        Returns:
+            Optional[FAISS]: The updated VectorDB.
+        """
+        ids = []
+        for file_key in file_keys:
+            ids.extend(manifest.chunk_ids(file_key))
+            manifest.remove(file_key)
+            print(f"Removing file: {file_key}")
+        if vectordb is not None and ids:
+            self.__delete(vectordb, ids)
+            lexical_index.remove(ids)
+        return vectordb
+
+    def add_documents(self, file_paths: List[str]) -> Optional[FAISS]:
+        """
+        Add files to the saved VectorDB; files already ingested with the same content are skipped,
+        and nothing is saved if all of them are.
+
+        Parameters:
+            file_paths (List[str]): The paths of the files to add.
+
+        Returns:
+            Optional[FAISS]: The updated VectorDB.
+        """
+        with Telemetry.span("ingest", files=len(file_paths)):
+            embedding = self.__get_embedding()
+            manifest = IndexManifest(self.persist_directory)
+            vectordb = self.__load_vectordb(embedding, manifest)
+            files_before = dict(manifest.files)
+            lexical_index = self.__load_lexical_index(vectordb)
+            vectordb = self.__add(vectordb, lexical_index, manifest, embedding,
+                                  [str(file_path) for file_path in file_paths])
+            if vectordb is not None and manifest.files != files_before:
+                self.__save_vectordb(vectordb, lexical_index, manifest)
+        return vectordb
+
+    def remove_documents(self, file_keys: List[str]) -> Optional[FAISS]:
+        """
+        Remove files from the saved VectorDB; nothing is saved if none of them was ingested.
+
+        Parameters:
+            file_keys (List[str]): The files to remove, by path or manifest key.
+
+        Returns:
+            Optional[FAISS]: The updated VectorDB.
+        """
+        embedding = self.__get_embedding()
+        manifest = IndexManifest(self.persist_directory)
+        vectordb = self.__load_vectordb(embedding, manifest)
+        files_before = dict(manifest.files)
+        lexical_index = self.__load_lexical_index(vectordb)
+        vectordb = self.__remove(vectordb, lexical_index, manifest,
+                                 [IndexManifest.file_key(file_key) for file_key in file_keys])
+        if vectordb is not None and manifest.files != files_before:
+            self.__save_vectordb(vectordb, lexical_index, manifest)
+        return vectordb
 
     def prepare_and_save_vectordb(self):
         """
-        Load, chunk, and create a VectorDB with OpenAI embeddings, and save it.
+        Bring the saved VectorDB up to date with the documents, and save it if anything changed.
+
+        Uploaded files are added to the VectorDB (replacing earlier uploads of the same file). When
+        ingesting a data directory, files that are no longer in the directory are also removed.
 
         Returns:
-            Chroma: The created VectorDB.
+            FAISS: The updated VectorDB.
         """
-        docs = self.__load_all_documents()
-        chunked_documents = self.__chunk_documents(docs)
         print("Preparing vectordb...")
-        load_dotenv()
-        voyage_api_key = os.getenv('VOYAGE_API_KEY')
-        vectordb = FAISS.from_texts(
-            texts=chunked_documents,
-            embedding=self.embedding(voyage_api_key=voyage_api_key, model="voyage-large-2-instruct"),
-        )
-        vectordb.save_local(self.persist_directory)
+        with Telemetry.span("ingest") as span:
+            embedding = self.__get_embedding()
+            manifest = IndexManifest(self.persist_directory)
+            vectordb = self.__load_vectordb(embedding, manifest)
+            files_before = dict(manifest.files)
+            lexical_index = self.__load_lexical_index(vectordb)
+            file_paths = self.__list_files()
+            span.add(files=len(file_paths))
+            if not isinstance(self.data_directory, list):
+                present = {IndexManifest.file_key(file_path) for file_path in file_paths}
+                vectordb = self.__remove(vectordb, lexical_index, manifest,
+                                         [file_key for file_key in manifest.files if file_key not in present])
+            vectordb = self.__add(vectordb, lexical_index, manifest, embedding, file_paths)
+            if vectordb is None:
+                print("No documents to index.")
+                return None
+            if manifest.files == files_before:
+                print("VectorDB is up to date, nothing to save.")
+                return vectordb
+            self.__save_vectordb(vectordb, lexical_index, manifest)
 
         # Accessing the FAISS index
         faiss_index = vectordb.index
@@ -136,4 +579,3 @@ class PrepareVectorDB:
               faiss_index.ntotal, "\n\n")
         return vectordb
 
-
@@ -0,0 +1,137 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings with reciprocal-rank fusion: every item scores the sum of 1 / (k + rank)
+    over the rankings it appears in.
+
+    Parameters:
+        rankings (List[List[str]]): The rankings, best first.
+        k (int): The rank offset; larger values flatten the contribution of the top ranks.
+
+    Returns:
+        List[Tuple[str, float]]: The items and their fused scores, best first.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class ScoredRetriever(BaseRetriever):
+    """
+    Retriever that returns the top-k hits of a vector store together with their scores.
+
+    The score of each hit is stored in the metadata of a copy of the retrieved document under the
+    "score" key, so the same result list can feed both the answer chain and the References panel
+    without a second embedding call or index search.
+
+    With a lexical index (see LexicalIndex), retrieval is hybrid: the top `candidates` hits of the
+    vector search and of BM25 are fused with reciprocal-rank fusion, and keyword queries can be
+    answered from BM25 alone without embedding them.
+
+    Attributes:
+        vectorstore (VectorStore): The vector store to search.
+        k (int): The number of documents to retrieve.
+        lexical_index (LexicalIndex, optional): The inverted index of the vector store's chunks.
+        candidates (int): The number of hits of each ranking fed to the fusion.
+        rrf_k (int): The rank offset of reciprocal-rank fusion.
+    """
+    vectorstore: VectorStore
+    k: int = 5
+    lexical_index: Optional[Any] = None
+    candidates: int = 20
+    rrf_k: int = 60
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """
+        Retrieve the top-k documents for a query.
+
+        Parameters:
+            query (str): The (standalone) question to search for.
+            run_manager (CallbackManagerForRetrieverRun): The callback manager of the run.
+
+        Returns:
+            List[Document]: The retrieved documents, most similar first, with their scores in the metadata.
+        """
+        return self.with_scores(self.vectorstore.similarity_search_with_score(query, k=self.k))
+
+    def get_documents_by_vector(self, embedding: List[float]) -> List[Document]:
+        """
+        Retrieve the top-k documents for an already embedded query.
+
+        Parameters:
+            embedding (List[float]): The query embedding.
+
+        Returns:
+            List[Document]: The retrieved documents, most similar first, with their scores in the metadata.
+        """
+        return self.with_scores(self.vectorstore.similarity_search_with_score_by_vector(embedding, k=self.k))
+
+    def get_documents_by_keywords(self, query: str) -> List[Document]:
+        """
+        Retrieve the top-k documents for a query from the lexical index only.
+
+        Parameters:
+            query (str): The query.
+
+        Returns:
+            List[Document]: The retrieved documents, best first, with their BM25 scores in the metadata.
+        """
+        return self.with_scores([(self.vectorstore.docstore.search(doc_id), score)
+                                 for doc_id, score in self.lexical_index.search(query, self.k)])
+
+    def get_documents(self, query: str, embedding: List[float]) -> List[Document]:
+        """
+        Retrieve the top-k documents for a query, fusing vector and lexical search if there is a lexical index.
+
+        Parameters:
+            query (str): The query.
+            embedding (List[float]): The query embedding.
+
+        Returns:
+            List[Document]: The retrieved documents, best first, with their (fused) scores in the metadata.
+        """
+        if self.lexical_index is None:
+            return self.get_documents_by_vector(embedding)
+        _, positions = self.vectorstore.index.search(
+            np.asarray([embedding], dtype="float32"), max(self.k, self.candidates))
+        vector_ranking = [self.vectorstore.index_to_docstore_id[int(position)]
+                          for position in positions[0] if position != -1]
+        lexical_ranking = [doc_id for doc_id, _ in self.lexical_index.search(query, max(self.k, self.candidates))]
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], self.rrf_k)[:self.k]
+        return self.with_scores([(self.vectorstore.docstore.search(doc_id), score) for doc_id, score in fused])
+
+    @staticmethod
+    def with_scores(docs_and_scores: List[Tuple[Union[Document, str], float]]) -> List[Document]:
+        """
+        Copy retrieved documents, adding their score to the metadata.
+
+        Parameters:
+            docs_and_scores (List[Tuple[Union[Document, str], float]]): The retrieved documents and their scores.
+
+        Returns:
+            List[Document]: The documents with their scores in the metadata. Hits whose chunk is
+                missing from the docstore (the docstore then returns an "ID ... not found." string)
+                are skipped.
+        """
+        # Copy the documents: the docstore objects are shared by every request using the index.
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "score": float(score)})
+            for doc, score in docs_and_scores
+            if isinstance(doc, Document)
+        ]
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple
+
+from utils.utilities import count_num_tokens
+
+
+class SessionMemoryStore:
+    """
+    Bounded conversation memory for every chat session.
+
+    Each session keeps a sliding window of its last `number_of_q_a_pairs` question/answer pairs,
+    optionally trimmed further so the history handed to the model stays under `max_tokens` tokens.
+    Sessions are kept in least-recently-used order: sessions idle for longer than `ttl_seconds` are
+    dropped, and when more than `max_sessions` sessions are active the least recently used ones are
+    evicted. Prompt size and server memory therefore stay bounded however long conversations run
+    and however many users are connected.
+
+    Attributes:
+        number_of_q_a_pairs (int): The number of question/answer pairs kept per session.
+        max_tokens (Optional[int]): The maximum number of tokens of history returned, if any.
+        max_sessions (int): The maximum number of sessions kept.
+        ttl_seconds (float): The time after which an idle session is dropped, in seconds.
+    """
+
+    def __init__(self, number_of_q_a_pairs: int, max_tokens: Optional[int] = None,
+                 max_sessions: int = 1000, ttl_seconds: float = 3600) -> None:
+        """
+        Initialize the SessionMemoryStore.
+
+        Parameters:
+            number_of_q_a_pairs (int): The number of question/answer pairs kept per session.
+            max_tokens (int, optional): The maximum number of tokens of history returned.
+            max_sessions (int): The maximum number of sessions kept.
+            ttl_seconds (float): The time after which an idle session is dropped, in seconds.
+        """
+        self.number_of_q_a_pairs = number_of_q_a_pairs
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Tuple[float, deque]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __evict(self, now: float) -> None:
+        """
+        Drop expired sessions and the least recently used ones beyond `max_sessions`. Expects the lock to be held.
+
+        Parameters:
+            now (float): The current time.
+        """
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl_seconds and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def get_history(self, session_id: str) -> List[Tuple[str, str]]:
+        """
+        Return the recent history of a session.
+
+        Parameters:
+            session_id (str): The identifier of the session.
+
+        Returns:
+            List[Tuple[str, str]]: The (question, answer) pairs of the session, oldest first, within the token cap.
+        """
+        now = time.time()
+        with self._lock:
+            self.__evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            pairs = list(entry[1])
+
+        if self.max_tokens is None:
+            return [(question, answer) for question, answer, _ in pairs]
+        history, total = [], 0
+        for question, answer, num_tokens in reversed(pairs):
+            if total + num_tokens > self.max_tokens:
+                break
+            history.append((question, answer))
+            total += num_tokens
+        return history[::-1]
+
+    def add(self, session_id: str, question: str, answer: str) -> None:
+        """
+        Append a question/answer pair to the history of a session.
+
+        Parameters:
+            session_id (str): The identifier of the session.
+            question (str): The user's question.
+            answer (str): The chatbot's answer.
+        """
+        num_tokens = count_num_tokens(question + answer, model="gpt-3.5-turbo") if self.max_tokens else 0
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            pairs = entry[1] if entry is not None else deque(maxlen=self.number_of_q_a_pairs)
+            pairs.append((question, answer, num_tokens))
+            self._sessions[session_id] = (now, pairs)
+            self._sessions.move_to_end(session_id)
+            self.__evict(now)
+
+    def clear(self, session_id: str) -> None:
+        """
+        Forget the history of a session.
+
+        Parameters:
+            session_id (str): The identifier of the session.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -1,11 +1,9 @@
 
-from langchain_community.document_loaders import PyPDFLoader
-from utils.utilities import count_num_tokens
-from g4f.client import Client
-import asyncio
-from asyncio import WindowsSelectorEventLoopPolicy
-import sys
-import openai
+from utils.utilities import count_num_tokens, get_encoding
+from utils.telemetry import Telemetry
+from utils.api_clients import ClientFactory
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 
 class Summarizer:
@@ -33,11 +31,24 @@ class Summarizer:
         temperature: float,
         summarizer_llm_system_role: str,
         final_summarizer_llm_system_role: str,
-        character_overlap: int
+        window_token_budget: int = 3000,
+        window_token_overlap: int = 100,
+        max_concurrency: int = 8,
+        reduce_token_limit: int = 12000
     ):
         """
         Summarizes the content of a PDF file using OpenAI's ChatGPT engine.
 
+        Consecutive pages are first packed into windows of up to `window_token_budget` tokens (see
+        `pack_windows`), so the number of requests follows the number of tokens in the document
+        rather than its number of pages. The windows are summarized concurrently ("map"), at most
+        `max_concurrency` requests at a time, and the window summaries are then combined into the
+        final summary ("reduce"), keeping the document order. If the page summaries together exceed
+        `reduce_token_limit` tokens, they are reduced hierarchically: consecutive summaries are
+        grouped and summarized again until they fit.
+        The extraction, map, reduce and final requests are traced as stages of a "summarize" span
+        (see Telemetry).
+
         Args:
             file_dir (str): The path to the PDF file.
             max_final_token (int): The maximum number of tokens in the final summary.
@@ -45,57 +56,196 @@ class Summarizer:
             gpt_model (str): The ChatGPT engine model name.
             temperature (float): The temperature parameter for ChatGPT response generation.
             summarizer_llm_system_role (str): The system role for the summarizer.
+            final_summarizer_llm_system_role (str): The system role for the final summarizer.
+            window_token_budget (int): The maximum number of tokens of document text per map request.
+            window_token_overlap (int): The number of tokens each window repeats from the previous one.
+            max_concurrency (int): The maximum number of summarization requests in flight.
+            reduce_token_limit (int): The maximum number of tokens sent in a single reduce request.
 
         Returns:
             str: The final summarized content.
         """
-        docs = []
-        docs.extend(PyPDFLoader(file_dir).load())
-        print(f"Document length: {len(docs)}")
-        max_summarizer_output_token = int(
-            max_final_token/len(docs)) - token_threshold
-        full_summary = ""
-        counter = 1
-        print("Generating the summary..")
-        # if the document has more than one pages
-        if len(docs) > 1:
-            for i in range(len(docs)):
-                # NOTE: This part can be optimized by considering a better technique for creating the prompt. (e.g: lanchain "chunksize" and "chunkoverlap" arguments.)
-
-                if i == 0:  # For the first page
-                    prompt = docs[i].page_content + \
-                        docs[i+1].page_content[:character_overlap]
-                # For pages except the fist and the last one.
-                elif i < len(docs)-1:
-                    prompt = docs[i-1].page_content[-character_overlap:] + \
-                        docs[i].page_content + \
-                        docs[i+1].page_content[:character_overlap]
-                else:  # For the last page
-                    prompt = docs[i-1].page_content[-character_overlap:] + \
-                        docs[i].page_content
-                summarizer_llm_system_role = summarizer_llm_system_role.format(
-                    max_summarizer_output_token)
-                full_summary += Summarizer.get_llm_response(
+        with Telemetry.span("summarize"):
+            with Telemetry.span("extract", documents=1) as span:
+                from langchain_community.document_loaders import PyPDFLoader
+                docs = []
+                docs.extend(PyPDFLoader(file_dir).load())
+                span.add(pages=len(docs))
+            print(f"Document length: {len(docs)}")
+            prompts = Summarizer.pack_windows(
+                [doc.page_content for doc in docs],
+                window_token_budget,
+                window_token_overlap,
+                model="gpt-3.5-turbo"
+            )
+            print(f"Number of windows: {len(prompts)}")
+            max_summarizer_output_token = int(
+                max_final_token/max(1, len(prompts))) - token_threshold
+            print("Generating the summary..")
+            # if the document does not fit in a single window
+            if len(prompts) > 1:
+                with Telemetry.span("summarize_map", requests=len(prompts)):
+                    page_summaries = Summarizer.map_summaries(
+                        prompts,
+                        gpt_model,
+                        temperature,
+                        summarizer_llm_system_role.format(max_summarizer_output_token),
+                        max_concurrency,
+                        label="Window"
+                    )
+                with Telemetry.span("summarize_reduce"):
+                    page_summaries = Summarizer.reduce_summaries(
+                        page_summaries,
+                        gpt_model,
+                        temperature,
+                        summarizer_llm_system_role.format(max_summarizer_output_token),
+                        max_concurrency,
+                        reduce_token_limit
+                    )
+                full_summary = "\n\n".join(page_summaries)
+            else:  # if the document fits in a single window
+                full_summary = prompts[0] if prompts else ""
+            num_tokens = count_num_tokens(full_summary, model="gpt-3.5-turbo")
+            print("\nFull summary token length:", num_tokens)
+            with Telemetry.span("summarize_final", requests=1, tokens=num_tokens):
+                final_summary = Summarizer.get_llm_response(
                     gpt_model,
                     temperature,
-                    summarizer_llm_system_role,
-                    prompt=prompt
+                    final_summarizer_llm_system_role,
+                    prompt=full_summary
                 )
-        else:  # if the document has only one page
-            full_summary = docs[0].page_content
-
-            print(f"Page {counter} was summarized. ", end="")
-            counter += 1
-        print("\nFull summary token length:", count_num_tokens(
-            full_summary, model="gpt-3.5-turbo"))
-        final_summary = Summarizer.get_llm_response(
-            gpt_model,
-            temperature,
-            final_summarizer_llm_system_role,
-            prompt=full_summary
-        )
         return final_summary
 
+    @staticmethod
+    def pack_windows(pages: List[str], window_token_budget: int, window_token_overlap: int, model: str) -> List[str]:
+        """
+        Packs consecutive pages into windows that fill a token budget.
+
+        Pages are added to the current window whole as long as they fit; a page larger than the
+        budget is split across several windows. Each window after the first starts with the last
+        `window_token_overlap` tokens of the previous one, so no context is lost at the seams.
+
+        Args:
+            pages (List[str]): The text of each page, in document order.
+            window_token_budget (int): The maximum number of tokens per window, overlap included.
+            window_token_overlap (int): The number of tokens each window repeats from the previous one.
+            model (str): The name of the model whose tokenizer is used.
+
+        Returns:
+            List[str]: The text of each window, in document order.
+
+        Raises:
+            ValueError: If the budget is not positive, or the overlap is negative or not smaller than the budget.
+        """
+        if window_token_budget <= 0:
+            raise ValueError(f"window_token_budget must be positive, got {window_token_budget}.")
+        if not 0 <= window_token_overlap < window_token_budget:
+            raise ValueError(f"window_token_overlap must be at least 0 and less than window_token_budget "
+                             f"({window_token_budget}), got {window_token_overlap}.")
+        encoding = get_encoding(model)
+        # At most half of a window repeats the previous one, so every window moves forward.
+        window_token_overlap = min(window_token_overlap, window_token_budget // 2)
+        windows = []
+        current = []
+        fresh = 0  # tokens of the current window that are not overlap from the previous one
+
+        def flush():
+            nonlocal current, fresh
+            windows.append(encoding.decode(current))
+            current = current[-window_token_overlap:] if window_token_overlap else []
+            fresh = 0
+
+        for page in pages:
+            tokens = encoding.encode(page)
+            while tokens:
+                room = window_token_budget - len(current)
+                if len(tokens) <= room:
+                    current.extend(tokens)
+                    fresh += len(tokens)
+                    tokens = []
+                elif fresh:
+                    # Keep the page whole: start it in a new window.
+                    flush()
+                else:
+                    current.extend(tokens[:room])
+                    fresh += room
+                    tokens = tokens[room:]
+                    flush()
+        if fresh:
+            windows.append(encoding.decode(current))
+        return windows
+
+    @staticmethod
+    def map_summaries(prompts: List[str], gpt_model: str, temperature: float, llm_system_role: str,
+                      max_concurrency: int, label: str = "Page") -> List[str]:
+        """
+        Summarizes several texts concurrently.
+
+        Args:
+            prompts (List[str]): The texts to summarize.
+            gpt_model (str): The ChatGPT engine model name.
+            temperature (float): The temperature parameter for ChatGPT response generation.
+            llm_system_role (str): The system role for the summarizer.
+            max_concurrency (int): The maximum number of requests in flight.
+            label (str): How the texts are called in the progress messages.
+
+        Returns:
+            List[str]: The summary of each text, in the order of `prompts`.
+        """
+        def summarize(indexed_prompt):
+            index, prompt = indexed_prompt
+            summary = Summarizer.get_llm_response(gpt_model, temperature, llm_system_role, prompt=prompt)
+            print(f"{label} {index + 1} was summarized. ", end="")
+            return summary
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(prompts)))) as executor:
+            # executor.map yields the results in input order, whatever order they complete in.
+            return list(executor.map(summarize, enumerate(prompts)))
+
+    @staticmethod
+    def reduce_summaries(summaries: List[str], gpt_model: str, temperature: float, llm_system_role: str,
+                         max_concurrency: int, reduce_token_limit: int) -> List[str]:
+        """
+        Reduces summaries hierarchically until they fit in a single request.
+
+        Consecutive summaries are packed into groups of at most `reduce_token_limit` tokens and
+        every group is summarized (concurrently); this is repeated level by level until the joined
+        summaries fit within the limit.
+
+        Args:
+            summaries (List[str]): The summaries to reduce, in document order.
+            gpt_model (str): The ChatGPT engine model name.
+            temperature (float): The temperature parameter for ChatGPT response generation.
+            llm_system_role (str): The system role for the summarizer.
+            max_concurrency (int): The maximum number of requests in flight.
+            reduce_token_limit (int): The maximum number of tokens sent in a single request.
+
+        Returns:
+            List[str]: Summaries, in document order, whose joined length fits within the limit.
+        """
+        level = 1
+        while len(summaries) > 1:
+            token_counts = [count_num_tokens(summary, model="gpt-3.5-turbo") for summary in summaries]
+            if sum(token_counts) <= reduce_token_limit:
+                break
+            groups, group, group_tokens = [], [], 0
+            for summary, num_tokens in zip(summaries, token_counts):
+                if group and group_tokens + num_tokens > reduce_token_limit:
+                    groups.append(group)
+                    group, group_tokens = [], 0
+                group.append(summary)
+                group_tokens += num_tokens
+            groups.append(group)
+            if len(groups) == len(summaries):
+                # Every summary is above the limit on its own; grouping cannot make progress.
+                break
+            print(f"\nReduce level {level}: {len(summaries)} summaries into {len(groups)}.")
+            summaries = Summarizer.map_summaries(
+                ["\n\n".join(group) for group in groups], gpt_model, temperature, llm_system_role,
+                max_concurrency, label=f"Level {level} group")
+            level += 1
+        return summaries
+
     @staticmethod
     def get_llm_response(gpt_model: str, temperature: float, llm_system_role: str, prompt: str):
         """
@@ -110,24 +260,21 @@ class Summarizer:
 
         Returns:
             str: The response content from the ChatGPT engine.
-        """
-        try:
-            asyncio.set_event_loop_policy(WindowsSelectorEventLoopPolicy())
-            client = Client()
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": llm_system_role},
-                    {"role": "user", "content": prompt}],
-            )
-            
-
-            return(response.choices[0].message.content)
-
 
-        except Exception as e:
-            print(f"[red]An Error occured to connect to the server (server overload)[/red]")
-            print(e)
-            sys.exit(1)
+        Raises:
+            APIRequestError: If the request fails after the retries, or the provider's circuit is open.
+        """
+        # The shared client, with retries and a circuit breaker; failures are raised to the caller.
+        client = ClientFactory.completion_client("g4f")
+        response = ClientFactory.call(
+            "g4f:gpt-3.5-turbo",
+            client.chat.completions.create,
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": llm_system_role},
+                {"role": "user", "content": prompt}],
+            timeout=ClientFactory.timeout(),
+        )
+        return response.choices[0].message.content
 
     
@@ -0,0 +1,249 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+
+class Span:
+    """
+    A pipeline stage being timed, and the counts it reports (chunks, characters, cache hits, ...).
+
+    Attributes:
+        stage (str): The name of the stage, e.g. "embed".
+        trace_id (str): The identifier shared by the spans of one request or ingestion.
+        span_id (str): The identifier of the span.
+        parent_id (Optional[str]): The identifier of the enclosing span, if any.
+        counts (Dict[str, float]): The counts reported so far.
+    """
+
+    def __init__(self, stage: str, trace_id: str, parent_id: Optional[str] = None) -> None:
+        self.stage = stage
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.counts: Dict[str, float] = {}
+        self.start = time.perf_counter()
+
+    def add(self, **counts: float) -> None:
+        """
+        Add to the counts of the span.
+
+        Parameters:
+            **counts (float): The amounts to add, by name, e.g. chunks=64, cache_hits=12.
+        """
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+
+_CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar("telemetry_span", default=None)
+
+
+class Telemetry:
+    """
+    Process-wide timing of the pipeline stages, exported as Prometheus metrics and JSON logs.
+
+    Stages are timed with `span`, a context manager, or reported after the fact with `record`.
+    Spans nest: a span opened inside another one shares its trace ID, and code deeper in the call
+    stack can add counts to the innermost open span with `add` (the embedding cache reports its
+    hits this way). A span must not be held open across a `yield` of a generator that Gradio
+    drives, since every step may run in another thread; time such stages with `record`.
+
+    Every finished span updates, per stage:
+        - ragchat_stage_duration_seconds: histogram of the durations,
+        - ragchat_stage_<count>_total: counter of every count it reported,
+        - ragchat_stage_errors_total: counter of the spans that raised.
+    `render` formats them in the Prometheus text format and `start_server` serves them on
+    /metrics. With a JSON log (see `configure`), every span is also written as one JSON line
+    with its trace ID, parent, duration and counts.
+    """
+    NAMESPACE = "ragchat"
+    DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    _enabled = True
+    _lock = threading.Lock()
+    # stage -> (bucket counts, sum of the durations, number of spans)
+    _histograms: Dict[str, Tuple[List[int], float, int]] = {}
+    # (count name, stage) -> total
+    _counters: Dict[Tuple[str, str], float] = {}
+    _json_log: Optional[TextIO] = None
+    _server: Optional[ThreadingHTTPServer] = None
+
+    @classmethod
+    def configure(cls, enabled: bool = True, json_log_path: Optional[str] = None) -> None:
+        """
+        Turn recording on or off and set the JSON log.
+
+        Parameters:
+            enabled (bool): Whether spans are recorded.
+            json_log_path (str, optional): The file every span is appended to as a JSON line, or
+                "-" for the standard output. No JSON log if None.
+        """
+        with cls._lock:
+            cls._enabled = enabled
+            if cls._json_log is not None and cls._json_log is not sys.stdout:
+                cls._json_log.close()
+            if not json_log_path:
+                cls._json_log = None
+            elif json_log_path == "-":
+                cls._json_log = sys.stdout
+            else:
+                directory = os.path.dirname(json_log_path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                cls._json_log = open(json_log_path, "a", encoding="utf-8")
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return uuid.uuid4().hex[:16]
+
+    @classmethod
+    @contextmanager
+    def span(cls, stage: str, trace_id: Optional[str] = None, **counts: float) -> Iterator[Span]:
+        """
+        Time a stage.
+
+        Parameters:
+            stage (str): The name of the stage.
+            trace_id (str, optional): The trace the span belongs to. Defaults to the trace of the
+                enclosing span, or a new trace.
+            **counts (float): Initial counts of the span.
+
+        Yields:
+            Span: The span, to add counts to.
+        """
+        parent = _CURRENT_SPAN.get()
+        span = Span(stage, trace_id or (parent.trace_id if parent is not None else cls.new_trace_id()),
+                    parent.span_id if parent is not None else None)
+        span.add(**counts)
+        token = _CURRENT_SPAN.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            cls.record(stage, time.perf_counter() - span.start, span.trace_id, span.parent_id, error,
+                       span_id=span.span_id, **span.counts)
+
+    @staticmethod
+    def add(**counts: float) -> None:
+        """
+        Add counts to the innermost open span of the current thread, if any.
+
+        Parameters:
+            **counts (float): The amounts to add, by name.
+        """
+        span = _CURRENT_SPAN.get()
+        if span is not None:
+            span.add(**counts)
+
+    @classmethod
+    def record(cls, stage: str, seconds: float, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+               error: Optional[str] = None, span_id: Optional[str] = None, **counts: float) -> None:
+        """
+        Record a finished stage.
+
+        Parameters:
+            stage (str): The name of the stage.
+            seconds (float): The duration of the stage, in seconds.
+            trace_id (str, optional): The trace the stage belongs to.
+            parent_id (str, optional): The span the stage ran in.
+            error (str, optional): The name of the exception the stage raised, if any.
+            span_id (str, optional): The identifier of the span.
+            **counts (float): The counts of the stage, e.g. chunks=64.
+        """
+        if not cls._enabled:
+            return
+        with cls._lock:
+            buckets, total, number = cls._histograms.get(stage) or ([0] * len(cls.DURATION_BUCKETS), 0.0, 0)
+            position = bisect_left(cls.DURATION_BUCKETS, seconds)
+            if position < len(buckets):
+                buckets[position] += 1
+            cls._histograms[stage] = (buckets, total + seconds, number + 1)
+            for name, value in counts.items():
+                cls._counters[(name, stage)] = cls._counters.get((name, stage), 0) + value
+            if error is not None:
+                cls._counters[("errors", stage)] = cls._counters.get(("errors", stage), 0) + 1
+            if cls._json_log is not None:
+                entry = {"time": round(time.time(), 6), "stage": stage, "duration_ms": round(seconds * 1000, 3),
+                         "trace_id": trace_id, "span_id": span_id, "parent_id": parent_id, **counts}
+                if error is not None:
+                    entry["error"] = error
+                cls._json_log.write(json.dumps(entry) + "\n")
+                cls._json_log.flush()
+
+    @classmethod
+    def render(cls) -> str:
+        """
+        Format the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        name = f"{cls.NAMESPACE}_stage_duration_seconds"
+        lines = [f"# HELP {name} Duration of the pipeline stages.", f"# TYPE {name} histogram"]
+        with cls._lock:
+            histograms = {stage: (list(buckets), total, number)
+                          for stage, (buckets, total, number) in cls._histograms.items()}
+            counters = dict(cls._counters)
+        for stage, (buckets, total, number) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(cls.DURATION_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {number}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {number}')
+        for count_name in sorted({count_name for count_name, _ in counters}):
+            name = f"{cls.NAMESPACE}_stage_{count_name}_total"
+            lines.append(f"# HELP {name} Total {count_name.replace('_', ' ')} of the pipeline stages.")
+            lines.append(f"# TYPE {name} counter")
+            for (other_name, stage), value in sorted(counters.items()):
+                if other_name == count_name:
+                    lines.append(f'{name}{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def start_server(cls, host: str = "127.0.0.1", port: int = 9464) -> ThreadingHTTPServer:
+        """
+        Serve the metrics on http://<host>:<port>/metrics from a background thread. Only starts one server.
+
+        Parameters:
+            host (str): The address to listen on.
+            port (int): The port to listen on.
+
+        Returns:
+            ThreadingHTTPServer: The server.
+        """
+        with cls._lock:
+            if cls._server is not None:
+                return cls._server
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    data = Telemetry.render().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+                def log_message(self, *args):
+                    pass
+
+            cls._server = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=cls._server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Metrics served on http://{host}:{port}/metrics")
+        return cls._server
@@ -1,11 +1,56 @@
-from utils.prepare_vectordb import PrepareVectorDB
-from typing import List, Tuple
-from utils.load_config import LoadConfig
-from utils.summarizer import Summarizer
+from typing import Iterator, List, Tuple
+from functools import lru_cache, partial
+import os
+import gradio as gr
+from utils.load_config import get_config
+from utils.embedding_cache import EmbeddingCache
+from utils.extraction_cache import ExtractionCache
+from utils.parallel_extract import ParallelExtractor
+from utils.embedding_scheduler import EmbeddingScheduler
+from utils.ingestion_jobs import IngestionJob, IngestionJobQueue, JobLimitError
+from utils.upload_sessions import UploadSessionStore, get_upload_sessions
 
 # from utils.summarizer import Summarizer
 
-APPCFG = LoadConfig()
+APPCFG = get_config()
+EMBEDDING_SCHEDULER = EmbeddingScheduler(batch_size=APPCFG.embedding_batch_size,
+                                         max_concurrency=APPCFG.embedding_max_concurrency,
+                                         requests_per_minute=APPCFG.embedding_requests_per_minute,
+                                         max_retries=APPCFG.embedding_max_retries,
+                                         backoff_base=APPCFG.embedding_backoff_base,
+                                         backoff_max=APPCFG.embedding_backoff_max)
+INGESTION_JOBS = IngestionJobQueue(max_workers=APPCFG.ingestion_max_workers,
+                                   max_pending=APPCFG.ingestion_max_pending,
+                                   max_jobs_per_user=APPCFG.ingestion_max_jobs_per_user)
+UPLOAD_SESSIONS = get_upload_sessions()
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Return the process-wide embedding cache of uploads, opening its SQLite file on the first upload
+    rather than when the app starts.
+
+    Returns:
+        EmbeddingCache: The embedding cache.
+    """
+    return EmbeddingCache(APPCFG.embedding_cache_path, max_entries=APPCFG.embedding_cache_max_entries)
+
+
+@lru_cache(maxsize=None)
+def get_extractor() -> ParallelExtractor:
+    """
+    Return the process-wide document extractor of uploads, with its extraction cache, both created on
+    the first upload rather than when the app starts.
+
+    Returns:
+        ParallelExtractor: The extractor.
+    """
+    extraction_cache = ExtractionCache(APPCFG.extraction_cache_path, max_bytes=APPCFG.extraction_cache_max_bytes)
+    return ParallelExtractor(max_workers=APPCFG.extraction_max_workers,
+                             pages_per_task=APPCFG.extraction_pages_per_task,
+                             page_timeout=APPCFG.extraction_page_timeout,
+                             extraction_cache=extraction_cache)
 
 
 class UploadFile:
@@ -13,44 +58,135 @@ class UploadFile:
     Utility class for handling file uploads and processing.
 
     This class provides static methods for checking directories and processing uploaded files
-    to prepare a VectorDB.
+    to prepare a VectorDB. Uploads are processed as background jobs (see IngestionJobQueue), whose
+    progress is streamed to the chat panel. Every session indexes its uploads into its own directory
+    (see UploadSessionStore).
     """
 
     @staticmethod
-    def process_uploaded_files(files_dir: List, chatbot: List, rag_with_dropdown: str) -> Tuple:
+    def process_uploaded_files(files_dir: List, chatbot: List, rag_with_dropdown: str,
+                               request: gr.Request = None) -> Iterator[Tuple]:
         """
         Process uploaded files to prepare a VectorDB.
 
+        The files are queued as a background job and this generator only follows its progress, so
+        the server stays responsive to chat requests while they are processed.
+
         Parameters:
             files_dir (List): List of paths to the uploaded files.
             chatbot: An instance of the chatbot for communication.
+            rag_with_dropdown (str): The selected action ("Upload doc: Process for RAG" or "Upload doc: Give Full summary").
+            request (gr.Request): The Gradio request, injected by Gradio; identifies the session owning the
+                job and the index the files are added to.
 
-        Returns:
-            Tuple: A tuple containing an empty string and the updated chatbot instance.
+        Yields:
+            Tuple: A tuple containing an empty string and the updated chatbot instance, every time
+            the job makes progress.
         """
         # Update chatbot and other components as necessary
-        print(files_dir)
+        files_dir = [str(file_dir) for file_dir in files_dir]
+        owner = UploadSessionStore.owner_of(request)
         if rag_with_dropdown == "Upload doc: Process for RAG":
-            prepare_vectordb_instance = PrepareVectorDB(data_directory=files_dir,
-                                                        persist_directory=APPCFG.custom_persist_directory,
-                                                        chunk_size=APPCFG.chunk_size,
-                                                        chunk_overlap=APPCFG.chunk_overlap)
-            prepare_vectordb_instance.prepare_and_save_vectordb()
-            
-            chatbot.append(
-                (" ", "Uploaded files are ready. Please ask your question"))
+            description = f"indexing {len(files_dir)} file{'s' if len(files_dir) > 1 else ''}"
+            persist_directory = UPLOAD_SESSIONS.touch(owner)
+            function = partial(UploadFile.prepare_vectordb, files_dir, persist_directory)
+            lock_key = persist_directory
         elif rag_with_dropdown == "Upload doc: Give Full summary":
-            final_summary = Summarizer.summarize_the_pdf(file_dir=files_dir[0],
-                                                         max_final_token=APPCFG.max_final_token,
-                                                         token_threshold=APPCFG.token_threshold,
-                                                         gpt_model=APPCFG.llm_engine,
-                                                         temperature=APPCFG.temperature,
-                                                         summarizer_llm_system_role=APPCFG.summarizer_llm_system_role,
-                                                         final_summarizer_llm_system_role=APPCFG.final_summarizer_llm_system_role,
-                                                         character_overlap=APPCFG.character_overlap)
-            chatbot.append(
-                (" ", final_summary))
+            description = "summarizing " + os.path.basename(files_dir[0])
+            function = partial(UploadFile.summarize, files_dir[0])
+            lock_key = None
         else:
             chatbot.append(
                 (" ", "If you would like to upload a PDF, please select your desired action in 'rag_with' dropdown."))
-        return "", chatbot
\ No newline at end of file
+            yield "", chatbot
+            return
+
+        try:
+            job = INGESTION_JOBS.submit(owner, description, function, lock_key=lock_key)
+        except JobLimitError as e:
+            chatbot.append((" ", str(e)))
+            yield "", chatbot
+            return
+
+        chatbot.append((" ", job.status_text()))
+        for job in INGESTION_JOBS.watch(job, heartbeat=APPCFG.ingestion_heartbeat):
+            chatbot[-1] = (" ", job.status_text())
+            yield "", chatbot
+        if job.state == "done" and rag_with_dropdown == "Upload doc: Process for RAG":
+            chatbot.append(
+                (" ", "Uploaded files are ready. Please ask your question"))
+        elif job.state == "done":
+            chatbot.append(
+                (" ", job.result))
+        yield "", chatbot
+
+    @staticmethod
+    def prepare_vectordb(files_dir: List[str], persist_directory: str, job: IngestionJob) -> None:
+        """
+        Add uploaded files to the VectorDB of a session's uploads. Runs as a background job.
+
+        Parameters:
+            files_dir (List[str]): The paths to the uploaded files.
+            persist_directory (str): The upload index directory of the session.
+            job (IngestionJob): The job, to which progress is reported; cancelling it aborts ingestion
+                before the index is written.
+        """
+        from utils.prepare_vectordb import PrepareVectorDB
+
+        prepare_vectordb_instance = PrepareVectorDB(data_directory=files_dir,
+                                                    persist_directory=persist_directory,
+                                                    chunk_size=APPCFG.chunk_size,
+                                                    chunk_overlap=APPCFG.chunk_overlap,
+                                                    embedding_cache=get_embedding_cache(),
+                                                    extractor=get_extractor(),
+                                                    embedding_scheduler=EMBEDDING_SCHEDULER,
+                                                    index_type=APPCFG.index_type,
+                                                    index_params=APPCFG.index_params,
+                                                    embedding_model_engine=APPCFG.embedding_model_engine,
+                                                    debug_dump_directory=APPCFG.debug_dump_directory,
+                                                    progress_callback=job.report)
+        prepare_vectordb_instance.prepare_and_save_vectordb()
+
+    @staticmethod
+    def summarize(file_dir: str, job: IngestionJob = None) -> str:
+        """
+        Summarize an uploaded PDF. Runs as a background job.
+
+        Parameters:
+            file_dir (str): The path to the PDF.
+            job (IngestionJob, optional): The job; the summarizer does not report progress.
+
+        Returns:
+            str: The summary.
+        """
+        from utils.summarizer import Summarizer
+
+        return Summarizer.summarize_the_pdf(file_dir=file_dir,
+                                            max_final_token=APPCFG.max_final_token,
+                                            token_threshold=APPCFG.token_threshold,
+                                            gpt_model=APPCFG.llm_engine,
+                                            temperature=APPCFG.temperature,
+                                            summarizer_llm_system_role=APPCFG.summarizer_llm_system_role,
+                                            final_summarizer_llm_system_role=APPCFG.final_summarizer_llm_system_role,
+                                            window_token_budget=APPCFG.window_token_budget,
+                                            window_token_overlap=APPCFG.window_token_overlap,
+                                            max_concurrency=APPCFG.summarizer_max_concurrency,
+                                            reduce_token_limit=APPCFG.summarizer_reduce_token_limit)
+
+    @staticmethod
+    def cancel_uploads(chatbot: List, request: gr.Request = None) -> List:
+        """
+        Cancel the uploads of the session that are still queued or running.
+
+        Parameters:
+            chatbot (List): The chat history.
+            request (gr.Request): The Gradio request, injected by Gradio; identifies the session.
+
+        Returns:
+            List: The updated chat history.
+        """
+        owner = UploadSessionStore.owner_of(request)
+        cancelled = INGESTION_JOBS.cancel_all(owner)
+        chatbot.append((" ", f"Cancelling {cancelled} upload{'s' if cancelled != 1 else ''}." if cancelled
+                        else "There is no upload in progress."))
+        return chatbot
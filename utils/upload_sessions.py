@@ -0,0 +1,184 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from utils.load_config import get_config
+
+
+class UploadSessionStore:
+    """
+    Per-session directories for the indexes of uploaded documents.
+
+    Every owner (the logged-in user if the app runs with authentication, the browser session
+    otherwise) gets its own index directory under `base_directory`, so concurrent uploaders never
+    write to or read from each other's index. Every use of a directory refreshes a timestamp file
+    in it; directories unused for longer than `ttl_seconds` are deleted, and their indexes evicted
+    from the IndexRegistry, by `collect_garbage`, which runs at most every `gc_interval` seconds
+    (see `start_collector` to run it in the background). A directory is only deleted while holding
+    the IndexRegistry load lock of its index, so it never disappears under a load or a `touch`.
+
+    The app uses a single store, shared by the chat and the upload handlers (see `get_upload_sessions`).
+
+    Attributes:
+        base_directory (str): The directory holding the session directories.
+        ttl_seconds (float): The time after which an unused session directory is deleted, in seconds.
+        gc_interval (float): The minimum time between two garbage collections, in seconds.
+    """
+    STAMP_FILE = ".last_used"
+    _UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+    def __init__(self, base_directory: str, ttl_seconds: float = 86400, gc_interval: float = 600) -> None:
+        """
+        Initialize the UploadSessionStore.
+
+        Parameters:
+            base_directory (str): The directory holding the session directories.
+            ttl_seconds (float): The time after which an unused session directory is deleted, in seconds.
+            gc_interval (float): The minimum time between two garbage collections, in seconds.
+        """
+        self.base_directory = base_directory
+        self.ttl_seconds = ttl_seconds
+        self.gc_interval = gc_interval
+        self._last_gc = 0.0
+        self._lock = threading.Lock()
+        self._collector: Optional[threading.Thread] = None
+
+    @staticmethod
+    def owner_of(request=None) -> str:
+        """
+        Identify the owner of a Gradio request.
+
+        Parameters:
+            request (gr.Request): The Gradio request.
+
+        Returns:
+            str: The authenticated user name, else the session hash, else "default".
+        """
+        return getattr(request, "username", None) or getattr(request, "session_hash", None) or "default"
+
+    def directory_for(self, owner: str) -> str:
+        """
+        Return the index directory of an owner.
+
+        Parameters:
+            owner (str): The owner, as returned by `owner_of`.
+
+        Returns:
+            str: The directory; it is not created.
+        """
+        name = self._UNSAFE.sub("_", owner)[:64]
+        if name != owner:
+            # Keep names that had to be altered distinct.
+            name += "-" + hashlib.sha256(owner.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.base_directory, name)
+
+    def touch(self, owner: str) -> str:
+        """
+        Mark the directory of an owner as used now, creating it if needed.
+
+        Parameters:
+            owner (str): The owner.
+
+        Returns:
+            str: The directory.
+        """
+        from utils.index_registry import IndexRegistry
+
+        directory = self.directory_for(owner)
+        with IndexRegistry.load_lock(directory):
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, self.STAMP_FILE), "w") as f:
+                f.write(str(time.time()))
+        return directory
+
+    def __expired(self, directory: str, now: float, in_use: Optional[Callable[[str], bool]]) -> bool:
+        """
+        Check whether a session directory has been unused for longer than `ttl_seconds` and is not in use.
+        """
+        try:
+            last_used = os.stat(os.path.join(directory, self.STAMP_FILE)).st_mtime
+        except OSError:
+            try:
+                last_used = os.stat(directory).st_mtime
+            except OSError:
+                return False
+        return now - last_used > self.ttl_seconds and not (in_use is not None and in_use(directory))
+
+    def collect_garbage(self, in_use: Optional[Callable[[str], bool]] = None, force: bool = False) -> List[str]:
+        """
+        Delete the session directories that have not been used for `ttl_seconds`.
+
+        Parameters:
+            in_use (Callable[[str], bool], optional): Tells whether a directory is in use (e.g. by an
+                upload job) and must be kept whatever its age.
+            force (bool): Run even if the last collection was less than `gc_interval` seconds ago.
+
+        Returns:
+            List[str]: The deleted directories.
+        """
+        from utils.index_registry import IndexRegistry
+
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_gc < self.gc_interval:
+                return []
+            self._last_gc = now
+        removed = []
+        try:
+            entries = list(os.scandir(self.base_directory))
+        except OSError:
+            return removed
+        for entry in entries:
+            if not entry.is_dir() or not self.__expired(entry.path, now, in_use):
+                continue
+            with IndexRegistry.load_lock(entry.path):
+                # The session may have been used while waiting for the lock.
+                if not self.__expired(entry.path, time.time(), in_use):
+                    continue
+                IndexRegistry.evict(entry.path)
+                shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.path)
+        if removed:
+            print(f"Removed {len(removed)} expired upload session(s).")
+        return removed
+
+    def start_collector(self, in_use: Optional[Callable[[str], bool]] = None) -> None:
+        """
+        Run `collect_garbage` every `gc_interval` seconds in a background thread. Only starts one thread.
+
+        Parameters:
+            in_use (Callable[[str], bool], optional): Tells whether a directory is in use and must be kept.
+        """
+        with self._lock:
+            if self._collector is not None:
+                return
+            self._collector = threading.Thread(target=self.__collect_forever, args=(in_use,),
+                                               name="upload-session-gc", daemon=True)
+        self._collector.start()
+
+    def __collect_forever(self, in_use: Optional[Callable[[str], bool]]) -> None:
+        while True:
+            time.sleep(self.gc_interval)
+            try:
+                self.collect_garbage(in_use, force=True)
+            except Exception as e:
+                print(f"Error collecting expired upload sessions: {e}")
+
+
+@lru_cache(maxsize=None)
+def get_upload_sessions() -> UploadSessionStore:
+    """
+    Return the process-wide UploadSessionStore, configured from the app configuration.
+
+    Returns:
+        UploadSessionStore: The store shared by the chat and the upload handlers.
+    """
+    app_config = get_config()
+    return UploadSessionStore(app_config.custom_persist_directory,
+                              ttl_seconds=app_config.upload_session_ttl,
+                              gc_interval=app_config.upload_session_gc_interval)
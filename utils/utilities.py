@@ -1,4 +1,23 @@
-import tiktoken
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> "tiktoken.Encoding":
+    """
+    Returns the tiktoken encoding of a model, building it only once per process. tiktoken itself is
+    only imported on first use.
+    Args:
+        model (str): The name of the GPT model.
+
+    Returns:
+        tiktoken.Encoding: The encoding used by the model.
+    """
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
 
 
 def count_num_tokens(text: str, model: str) -> int:
@@ -11,5 +30,4 @@ def count_num_tokens(text: str, model: str) -> int:
     Returns:
         int: The number of tokens in the text.
     """
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
\ No newline at end of file
+    return len(get_encoding(model).encode(text))